@@ -0,0 +1,124 @@
+"""CPU and memory benchmark for html_meta against the BeautifulSoup path.
+
+Usage: python benchmarks/bench_html_meta.py [--repeat N]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_meta
+
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+
+
+def legacy_extract(data):
+    """The original per-page path: decode the whole body and build a full tree"""
+    from bs4 import BeautifulSoup
+    html = data.decode('utf-8', errors='replace')
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.string if soup.title else None
+    meta_desc = soup.find('meta', {'name': 'description'})
+    description = meta_desc['content'] if meta_desc else None
+    return {
+        'title': re.sub(r'\s+', ' ', title).strip() if title else None,
+        'description': re.sub(r'\s+', ' ', description).strip() if description else None,
+    }
+
+
+def streaming_extract(data):
+    chunks = (data[i:i + html_meta.CHUNK_SIZE] for i in range(0, len(data), html_meta.CHUNK_SIZE))
+    metadata = html_meta.extract_metadata(chunks)
+    return {'title': metadata['title'], 'description': metadata['description']}
+
+
+def bytes_read(data):
+    """How much of the page the streaming extractor consumes"""
+    consumed = 0
+
+    def chunks():
+        nonlocal consumed
+        for i in range(0, len(data), html_meta.CHUNK_SIZE):
+            chunk = data[i:i + html_meta.CHUNK_SIZE]
+            consumed += len(chunk)
+            yield chunk
+
+    html_meta.extract_metadata(chunks())
+    return consumed
+
+
+def load_pages():
+    with open(os.path.join(PAGES, 'expected.jsonl'), encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    for case in cases:
+        with open(os.path.join(PAGES, case['file']), 'rb') as f:
+            case['data'] = f.read()
+    return cases
+
+
+def check_correctness(cases):
+    failures = 0
+    for case in cases:
+        got = streaming_extract(case['data'])
+        if got != case['expected']:
+            failures += 1
+            print(f"FAIL {case['file']}")
+            print(f"  expected {case['expected']}")
+            print(f"  got      {got}")
+    print(f"correctness: {len(cases) - failures}/{len(cases)} pages pass")
+    return failures == 0
+
+
+def measure(label, fn, cases, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for case in cases:
+            fn(case['data'])
+    cpu_ms = (time.process_time() - start) * 1000 / (repeat * len(cases))
+
+    peaks = []
+    for case in cases:
+        tracemalloc.start()
+        fn(case['data'])
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    peak_kb = sum(peaks) / len(peaks) / 1024
+    print(f"{label:<22} {cpu_ms:>8.2f} ms CPU/page  {peak_kb:>10.1f} KiB peak/page")
+    return cpu_ms, peak_kb
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    cases = load_pages()
+    ok = check_correctness(cases)
+
+    total = sum(len(case['data']) for case in cases)
+    read = sum(bytes_read(case['data']) for case in cases)
+    print(f"\n{len(cases)} pages, {total / 1024:.0f} KiB total, streaming reads {read / 1024:.0f} KiB")
+
+    streaming = measure('streaming html_meta', streaming_extract, cases, args.repeat)
+    if importlib.util.find_spec('bs4') is None:
+        print("beautifulsoup4 is not installed, skipping the baseline")
+    else:
+        legacy = measure('BeautifulSoup', legacy_extract, cases, args.repeat)
+        for case in cases:
+            if legacy_extract(case['data'])['description'] != case['expected']['description'] \
+                    and case['expected']['description'] is not None:
+                print(f"note: BeautifulSoup misses the description of {case['file']} (no OpenGraph fallback)")
+        print(f"\nper search of {len(cases)} pages: "
+              f"{legacy[0] / streaming[0]:.1f}x less CPU, {legacy[1] / streaming[1]:.1f}x less peak memory")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
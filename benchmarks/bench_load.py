@@ -0,0 +1,487 @@
+"""Offline load test of the whole bot (test.py) with simulated users.
+
+Everything the bot talks to runs locally:
+- Telegram: FakeTelegram (benchmarks/fake_services.py) serves long polling,
+  file downloads and Google's speech endpoint (reached through http_proxy).
+- Gmail: FakeGmail serves one mailbox per tenant. Bank emails are delivered
+  at --email-rate per second while the test runs.
+- PostgreSQL: a throwaway cluster (LocalPostgres), or with --existing-server
+  a scratch database on the server in DB_* (ScratchDatabase). Both are
+  migrated with prisma/migrations and removed afterwards.
+
+Each simulated user is a registered tenant. It sends /capture, then --actions
+actions picked from --mix, waiting for the bot's answer to each one (closed
+loop) and thinking up to 2x--think seconds in between. "reply" notes the
+latest transaction notification it received, "voice" and "photo" capture an
+expense from a voice note (needs ffmpeg) or a receipt (needs tesseract).
+
+Reported: throughput, p50/p99 latency and failures per action, the delay
+from Gmail delivery to notification, the bot's memory (peak and final RSS)
+and a few of its own metrics.
+
+Usage: python benchmarks/bench_load.py [--users N] [--actions N] [--think S] [--mix help=3,...]
+                                       [--existing-server] [--env KEY=VALUE ...]
+"""
+import os
+import re
+import sys
+import time
+import glob
+import random
+import shutil
+import signal
+import asyncio
+import argparse
+import tempfile
+import importlib.util
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CHAT_BASE = 7_000_000_000
+BANK_SENDER = 'Timo <support@timo.vn>'
+DEFAULT_MIX = 'help=3,check_outlay=2,report=1,check_bot=1,reply=3,voice=1,photo=1'
+NOTE = re.compile(r'GD(\d+)-(\d+)')
+
+# Action -> predicate on a bot message that completes it
+DONE = {
+    'capture': lambda text: text.startswith('🧾'),
+    'help': lambda text: '📱 Các lệnh có sẵn' in text,
+    'check_outlay': lambda text: text.startswith('✅ Đã chi tiêu'),
+    'report': lambda text: '📈 Tổng cộng' in text or text.startswith('📊 Chưa có dữ liệu'),
+    'check_bot': lambda text: 'Vui lòng reply để ghi chú' in text or text.startswith('✅ Không có giao dịch'),
+    'reply': lambda text: text.startswith('💰 Tổng chi tiêu'),
+    'voice': lambda text: '\n💰 Tổng chi tiêu trong tháng này' in text,
+    'photo': lambda text: '\n💰 Tổng chi tiêu trong tháng này' in text,
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DONE:
+            raise SystemExit(f"unknown action in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_voice_clips(count, seconds=2):
+    """Distinct OGG/Opus clips (sine tones), or [] without ffmpeg"""
+    if not shutil.which('ffmpeg'):
+        return []
+    clips = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(count):
+            path = os.path.join(tmp, f'{i}.ogg')
+            subprocess.run(
+                ['ffmpeg', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=frequency={300 + 40 * i}:duration={seconds}',
+                 '-c:a', 'libopus', path],
+                check=True
+            )
+            with open(path, 'rb') as f:
+                clips.append(f.read())
+    return clips
+
+
+def load_receipts():
+    """Receipt photos, or [] without tesseract"""
+    if not shutil.which('tesseract'):
+        return []
+    receipts = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, 'ocr', 'receipt_*.jpg'))):
+        with open(path, 'rb') as f:
+            receipts.append(f.read())
+    return receipts
+
+
+def read_rss(pid):
+    """(current, peak) resident memory of a process in MB, from /proc"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def seed_tenants(config, users):
+    """One tenant per simulated user, each with an OAuth token for its fake mailbox"""
+    import psycopg2
+    conn = psycopg2.connect(**config)
+    try:
+        with conn, conn.cursor() as cursor:
+            for i in range(users):
+                cursor.execute(
+                    'INSERT INTO "Tenant" ("id", "chatId", "name") VALUES (%s, %s, %s);',
+                    (f'bench-{i}', CHAT_BASE + i, f'User {i}')
+                )
+                cursor.execute("""
+                INSERT INTO "OAuthToken" ("id", "accessToken", "refreshToken", "expiryDate", "updatedAt", "tenantId")
+                VALUES (%s, %s, 'refresh', (NOW() AT TIME ZONE 'UTC') + INTERVAL '1 day', NOW(), %s);
+                """, (f'bench-token-{i}', f'token-{i}', f'bench-{i}'))
+    finally:
+        conn.close()
+
+
+class User:
+    def __init__(self, index):
+        self.index = index
+        self.chat_id = CHAT_BASE + index
+        self.waiting = None  # (action, future) of the request in flight
+        self.unnoted = {}  # transaction note -> bot message showing it
+        self.sent = 0
+
+
+class LoadTest:
+    def __init__(self, args, mix, clips, receipts):
+        from fake_services import FakeGmail, FakeTelegram
+        self.args = args
+        self.mix = mix
+        self.clips = clips
+        self.receipts = receipts
+        self.rng = random.Random(args.seed)
+        self.telegram = FakeTelegram(on_message=self.on_message)
+        self.gmail = FakeGmail()
+        self.users = {CHAT_BASE + i: User(i) for i in range(args.users)}
+        self.latencies = {}
+        self.failures = {}
+        self.delivered = {}  # note -> delivery time
+        self.notified = {}  # note -> delay
+        self.rss_peak = 0
+
+    def on_message(self, chat_id, message_id, text, method):
+        user = self.users.get(chat_id)
+        if user is None:
+            return
+        notification = text.startswith('Chào')
+        # Notifications and /check_bot lists can be replied to; reports show noted ones
+        if notification or '📄 GD' in text:
+            for chat, k in NOTE.findall(text):
+                note = f'GD{chat}-{k}'
+                user.unnoted[note] = message_id
+                if notification and note in self.delivered and note not in self.notified:
+                    self.notified[note] = time.time() - self.delivered[note]
+        if user.waiting is None or notification:
+            return
+        action, future = user.waiting
+        if future.done():
+            return
+        if DONE[action](text):
+            future.set_result(None)
+        elif text.startswith(('❌', '⏳')):
+            future.set_exception(RuntimeError(text.splitlines()[0]))
+
+    def message(self, user, **fields):
+        message = {
+            'message_id': self.telegram.next_message_id(user.chat_id),
+            'date': int(time.time()),
+            'chat': {'id': user.chat_id, 'type': 'private'},
+            'from': {'id': user.chat_id, 'is_bot': False, 'first_name': f'User {user.index}'},
+        }
+        message.update(fields)
+        return message
+
+    def command(self, user, text):
+        command = text.split()[0]
+        return self.message(user, text=text, entities=[{'type': 'bot_command', 'offset': 0, 'length': len(command)}])
+
+    def build(self, user, action):
+        """The update message for an action, or None if the user cannot do it now"""
+        user.sent += 1
+        if action == 'report':
+            return self.command(user, f'/report {datetime.now().month}')
+        if action == 'reply':
+            if not user.unnoted:
+                return None
+            note, message_id = user.unnoted.popitem()
+            replied = {'message_id': message_id, 'date': int(time.time()),
+                       'chat': {'id': user.chat_id, 'type': 'private'},
+                       'from': {'id': 1, 'is_bot': True, 'first_name': 'Bench'}, 'text': note}
+            return self.message(user, text='AN_UONG - ăn phở', reply_to_message=replied)
+        if action == 'voice':
+            file_id = f'voice-{user.index}-{user.sent}'
+            data = self.clips[user.sent % len(self.clips)]
+            self.telegram.add_file(file_id, data)
+            return self.message(user, voice={'file_id': file_id, 'file_unique_id': file_id, 'duration': 2,
+                                             'mime_type': 'audio/ogg', 'file_size': len(data)})
+        if action == 'photo':
+            file_id = f'photo-{user.index}-{user.sent}'
+            # Bytes after the JPEG end marker are ignored by decoders but make
+            # every photo new to the OCR cache and the duplicate check
+            data = self.receipts[user.sent % len(self.receipts)] + file_id.encode()
+            self.telegram.add_file(file_id, data)
+            return self.message(user, photo=[{'file_id': file_id, 'file_unique_id': file_id,
+                                              'width': 800, 'height': 1200, 'file_size': len(data)}])
+        return self.command(user, f'/{action}')
+
+    async def request(self, user, action):
+        message = self.build(user, action)
+        if message is None:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        user.waiting = (action, future)
+        start = time.perf_counter()
+        self.telegram.push_update(message)
+        try:
+            await asyncio.wait_for(future, self.args.action_timeout)
+        except asyncio.TimeoutError:
+            self.failures.setdefault(action, []).append('timeout')
+        except RuntimeError as e:
+            self.failures.setdefault(action, []).append(str(e))
+        else:
+            self.latencies.setdefault(action, []).append(time.perf_counter() - start)
+        finally:
+            user.waiting = None
+        return True
+
+    async def run_user(self, user):
+        await asyncio.sleep(self.args.ramp * user.index / len(self.users))
+        await self.request(user, 'capture')
+        names, weights = list(self.mix), list(self.mix.values())
+        for _ in range(self.args.actions):
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think))
+            action = self.rng.choices(names, weights)[0]
+            if not await self.request(user, action):
+                await self.request(user, 'help')
+
+    async def deliver_emails(self):
+        """Bank emails to random users at --email-rate per second"""
+        count = 0
+        while True:
+            await asyncio.sleep(1 / self.args.email_rate)
+            user = self.rng.choice(list(self.users.values()))
+            count += 1
+            note = f'GD{user.chat_id}-{count}'
+            amount = self.rng.randrange(10, 500) * 1000
+            now = datetime.now()
+            snippet = (f"Tài khoản Spend Account vừa giảm {amount:,} VND vào {now:%d/%m/%Y %H:%M}. "
+                       f"Số dư hiện tại: 5.000.000 VND. Mô tả: {note}").replace(',', '.')
+            self.gmail.deliver(f'token-{user.index}', BANK_SENDER, 'Thông báo biến động số dư', snippet)
+            self.delivered[note] = time.time()
+
+    async def sample_memory(self, pid):
+        while True:
+            rss, peak = read_rss(pid)
+            if peak:
+                self.rss_peak = max(self.rss_peak, peak)
+            await asyncio.sleep(1)
+
+
+async def scrape_metrics(port):
+    """{metric name: summed value} for the _sum/_count and counter lines of /metrics"""
+    import aiohttp
+    totals = {}
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                text = await response.text()
+    except aiohttp.ClientError:
+        return totals
+    for line in text.splitlines():
+        if line.startswith('#') or '_bucket' in line:
+            continue
+        name, _, value = line.rpartition(' ')
+        name = name.split('{')[0]
+        totals[name] = totals.get(name, 0) + float(value)
+    return totals
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def run_load(args, db_config, mix, clips, receipts):
+    from fake_services import start_app
+    test = LoadTest(args, mix, clips, receipts)
+    for i in range(args.users):
+        test.gmail.add_account(f'token-{i}', f'user{i}@bench.local')
+    telegram_runner, telegram_url = await start_app(test.telegram.make_app())
+    gmail_runner, gmail_url = await start_app(test.gmail.make_app())
+
+    metrics_port = free_port()
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN='1:bench',
+        TELEGRAM_API_URL=f'{telegram_url}/bot',
+        TELEGRAM_FILE_URL=f'{telegram_url}/file/bot',
+        TELEGRAM_CHAT_ID='',
+        BOT_MODE='polling',
+        GMAIL_API_ENDPOINT=gmail_url,
+        GMAIL_SYNC_INTERVAL=str(args.sync_interval),
+        GOOGLE_API_KEY='offline',
+        PREWARM_DELAY='0',
+        METRICS_PORT=str(metrics_port),
+        DB_HOST=db_config['host'],
+        DB_PORT=str(db_config['port']),
+        DB_NAME=db_config['database'],
+        DB_USER=db_config['user'],
+        DB_PASSWORD=db_config['password'] or '',
+    )
+    if 'voice' in mix:
+        # Speech recognition goes to http://www.google.com through the fake
+        env.update(http_proxy=telegram_url, no_proxy='127.0.0.1,localhost')
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    log = tempfile.NamedTemporaryFile(prefix='bench-load-', suffix='.log', delete=False)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, 'test.py', cwd=ROOT, env=env, stdout=log, stderr=log
+    )
+    background = []
+    try:
+        # Ready once the bot polls
+        deadline = time.perf_counter() + args.timeout
+        while 'getUpdates' not in test.telegram.first_call:
+            if process.returncode is not None or time.perf_counter() > deadline:
+                raise RuntimeError(f"bot did not start, see {log.name}")
+            await asyncio.sleep(0.1)
+        _, idle_rss = read_rss(process.pid)
+
+        background.append(asyncio.create_task(test.sample_memory(process.pid)))
+        if args.email_rate > 0:
+            background.append(asyncio.create_task(test.deliver_emails()))
+        start = time.perf_counter()
+        users = asyncio.gather(*(test.run_user(user) for user in test.users.values()))
+        try:
+            await asyncio.wait_for(users, args.timeout)
+        except asyncio.TimeoutError:
+            print(f"  stopped after {args.timeout:g}s (--timeout)")
+        elapsed = time.perf_counter() - start
+        final_rss, peak = read_rss(process.pid)
+        test.rss_peak = max(test.rss_peak, peak or 0)
+        bot_metrics = await scrape_metrics(metrics_port)
+    finally:
+        for task in background:
+            task.cancel()
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        log.close()
+        await telegram_runner.cleanup()
+        await gmail_runner.cleanup()
+
+    report(test, elapsed, idle_rss, final_rss, bot_metrics)
+    print(f"  bot log: {log.name}")
+
+
+def report(test, elapsed, idle_rss, final_rss, bot_metrics):
+    completed = sum(len(values) for values in test.latencies.values())
+    failed = sum(len(values) for values in test.failures.values())
+    print(f"  {completed} actions in {elapsed:.1f}s: {completed / elapsed:.1f}/s, {failed} failed")
+    print(f"  {'action':<14} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for action in DONE:
+        values = test.latencies.get(action, [])
+        failures = test.failures.get(action, [])
+        if not values and not failures:
+            continue
+        p50 = f"{percentile(values, 50) * 1000:9.1f}" if values else f"{'-':>9}"
+        p99 = f"{percentile(values, 99) * 1000:9.1f}" if values else f"{'-':>9}"
+        print(f"  {action:<14} {len(values):>6} {p50} {p99} {len(failures):>7}")
+    reasons = {}
+    for failures in test.failures.values():
+        for reason in failures:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    for reason, count in sorted(reasons.items(), key=lambda item: -item[1])[:5]:
+        print(f"    {count:>6} x {reason}")
+
+    delays = list(test.notified.values())
+    print(f"  notifications: {len(delays)} of {len(test.delivered)} emails", end='')
+    if delays:
+        print(f", delay p50 {percentile(delays, 50):.1f}s p99 {percentile(delays, 99):.1f}s")
+    else:
+        print()
+    print(f"  bot memory: {idle_rss or 0:.0f} MB idle, {test.rss_peak:.0f} MB peak, {final_rss or 0:.0f} MB at the end")
+
+    for name, label in (
+        ('bot_handler_seconds', 'handler time'),
+        ('db_query_seconds', 'db query'),
+        ('db_pool_wait_seconds', 'db pool wait'),
+        ('gmail_stage_seconds', 'gmail sync stage'),
+        ('bot_event_loop_lag_probe_seconds', 'event loop lag'),
+    ):
+        count = bot_metrics.get(f'{name}_count')
+        if count:
+            print(f"  {label:<18} mean {bot_metrics[f'{name}_sum'] / count * 1000:8.1f} ms over {count:.0f}")
+    errors = bot_metrics.get('bot_handler_errors_total', 0)
+    print(f"  handler errors     {errors:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=10, help='actions per user after /capture')
+    parser.add_argument('--think', type=float, default=1, help='mean think time between actions (s)')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds over which users start')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='action=weight,... of ' + ','.join(DONE))
+    parser.add_argument('--email-rate', type=float, default=20, help='bank emails delivered per second')
+    parser.add_argument('--sync-interval', type=int, default=5, help='GMAIL_SYNC_INTERVAL of the bot')
+    parser.add_argument('--action-timeout', type=float, default=60)
+    parser.add_argument('--timeout', type=float, default=900, help='limit for the whole run')
+    parser.add_argument('--seed', type=int, default=2026)
+    parser.add_argument('--existing-server', action='store_true',
+                        help='create the scratch database on the DB_* server instead of a private cluster')
+    parser.add_argument('--pg-bin', help='directory of initdb and pg_ctl')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra settings for the bot, e.g. OUTBOX_GLOBAL_RATE=1000')
+    args = parser.parse_args()
+
+    missing = [name for name in ('aiohttp', 'psycopg2') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"{missing[0]} is not installed, skipping")
+        return
+    from local_postgres import LocalPostgres, ScratchDatabase
+
+    mix = parse_mix(args.mix)
+    clips = make_voice_clips(8) if 'voice' in mix else []
+    receipts = load_receipts() if 'photo' in mix else []
+    if 'voice' in mix and not clips:
+        print("ffmpeg not found, leaving voice notes out")
+        del mix['voice']
+    if 'voice' in mix and importlib.util.find_spec('socks') is None:
+        # The Gmail client (httplib2) fails on any proxy setting without PySocks
+        print("PySocks is not installed, leaving voice notes out")
+        del mix['voice']
+    if 'photo' in mix and not receipts:
+        print("tesseract not found, leaving photos out")
+        del mix['photo']
+
+    try:
+        database = ScratchDatabase() if args.existing_server else LocalPostgres(args.pg_bin)
+        database.start()
+    except Exception as e:
+        print(f"no database for the load test ({e}), skipping")
+        return
+    try:
+        seed_tenants(database.config, args.users)
+        print(f"{args.users} users x {args.actions} actions, think {args.think:g}s, mix {args.mix}")
+        asyncio.run(run_load(args, database.config, mix, clips, receipts))
+    except RuntimeError as e:
+        print(f"  failed: {e}")
+        sys.exit(1)
+    finally:
+        database.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Latency and accuracy benchmark for ocr.OCRService against inline OCR.
+
+The baseline is the original handler path: tesseract on the raw photo, one
+image at a time. The candidate pre-processes each image and runs the batch
+on the process pool, then repeats it to show the content-hash cache.
+Accuracy is the character error rate against the ground truth.
+
+Needs the tesseract binary with the 'vie' language data.
+
+Usage: python benchmarks/bench_ocr.py [--workers N] [--lang vie]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ocr')
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(text):
+    return ' '.join(text.split())
+
+
+def char_error_rate(expected, got):
+    expected, got = normalize(expected), normalize(got)
+    return edit_distance(expected, got) / max(len(expected), 1)
+
+
+def load_cases():
+    with open(os.path.join(FIXTURES, 'expected.jsonl'), encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    for case in cases:
+        with open(os.path.join(FIXTURES, case['file']), 'rb') as f:
+            case['data'] = f.read()
+    return cases
+
+
+def inline_ocr(cases, lang):
+    import pytesseract
+    from PIL import Image
+    start = time.perf_counter()
+    texts = [pytesseract.image_to_string(Image.open(io.BytesIO(case['data'])), lang=lang) for case in cases]
+    return texts, time.perf_counter() - start
+
+
+async def pooled_ocr(cases, lang, workers):
+    from ocr import OCRService
+    service = OCRService(workers=workers, lang=lang)
+    try:
+        # Start the workers outside the timed region, as they are on a running bot
+        await asyncio.get_running_loop().run_in_executor(service._pool(), time.sleep, 0)
+        start = time.perf_counter()
+        texts = await asyncio.gather(*(service.recognize(case['data']) for case in cases))
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(service.recognize(case['data']) for case in cases))
+        cached = time.perf_counter() - start
+    finally:
+        service.close()
+    return texts, elapsed, cached
+
+
+def report(label, cases, texts, elapsed):
+    rates = [char_error_rate(case['text'], text) for case, text in zip(cases, texts)]
+    for case, rate in zip(cases, rates):
+        print(f"  {case['file']:<18} CER {rate:6.1%}")
+    mean = sum(rates) / len(rates)
+    print(f"{label:<28} {elapsed * 1000 / len(cases):>8.0f} ms/image  mean CER {mean:6.1%}\n")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--lang', default='vie')
+    args = parser.parse_args()
+
+    if shutil.which('tesseract') is None:
+        print("tesseract is not installed, skipping")
+        return
+
+    cases = load_cases()
+    print(f"{len(cases)} images ({sum(len(c['data']) for c in cases) / 1024:.0f} KiB), "
+          f"{args.workers} workers\n")
+
+    texts, inline_elapsed = inline_ocr(cases, args.lang)
+    inline_cer = report('inline, raw image', cases, texts, inline_elapsed)
+
+    texts, pooled_elapsed, cached_elapsed = asyncio.run(pooled_ocr(cases, args.lang, args.workers))
+    pooled_cer = report('pool, pre-processed', cases, texts, pooled_elapsed)
+
+    print(f"batch latency {inline_elapsed:.2f}s -> {pooled_elapsed:.2f}s "
+          f"({inline_elapsed / pooled_elapsed:.1f}x), repeat from cache {cached_elapsed * 1000:.1f} ms")
+    print(f"mean CER {inline_cer:.1%} -> {pooled_cer:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Benchmark for outbox on a synthetic month of 5,000 transactions.
+
+1. /report rendering: the old `+=` string against blocks packed by
+   split_blocks, and whether the result fits Telegram's 4096 limit.
+2. A burst of notifications for the same transactions spread over several
+   chats, sent to a fake Telegram that enforces flood limits (per chat and
+   global, scaled up by --speedup so the run takes seconds): the old path,
+   one send_message per transaction with no retry, against the Outbox.
+
+Usage: python benchmarks/bench_outbox.py [--transactions N] [--chats N] [--speedup N]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import importlib.util
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ['AN_UONG', 'DI_CHUYEN', 'MUA_SAM', 'HOA_DON', 'SUC_KHOE', 'GIAI_TRI', 'Others']
+NOTES = ['ăn trưa với đồng nghiệp', 'cà phê sáng', 'đổ xăng', 'grab đi làm', 'tiền điện tháng này',
+         'mua quần áo', 'siêu thị cuối tuần', 'thuốc cảm', 'xem phim', 'chuyển khoản cho bạn']
+
+
+def synthetic_month(count, seed=2026):
+    rng = random.Random(seed)
+    start = datetime(2026, 9, 1)
+    rows = []
+    for i in range(count):
+        rows.append({
+            'emailId': f'msg{i:05d}',
+            'category': rng.choice(CATEGORIES),
+            'price': -rng.randrange(10, 2000) * 1000,
+            'expense': f'Thanh toán {rng.choice(NOTES)}',
+            'note': rng.choice(NOTES) if rng.random() < 0.7 else None,
+            'createdAt': start + timedelta(minutes=rng.randrange(30 * 24 * 60)),
+        })
+    return rows
+
+
+def report_inputs(rows):
+    totals = {}
+    details = {}
+    for row in rows:
+        count, total = totals.get(row['category'], (0, 0))
+        totals[row['category']] = (count + 1, total + row['price'])
+        details.setdefault(row['category'], []).append((row['expense'], row['note']))
+    totals = sorted(((category, c, t) for category, (c, t) in totals.items()), key=lambda item: item[2])
+    return totals, details
+
+
+def legacy_report(totals, details):
+    """The original report_command body"""
+    message = "📊 Thống kê chi tiêu tháng 9/2026:\n\n"
+    total_spent = 0
+    for category, count, amount in totals:
+        formatted_amount = "{:,.0f}".format(abs(amount))
+        status = 'chi' if amount < 0 else 'thu'
+        message += f"📌 {category}:\n"
+        message += f"💰 Tổng: {formatted_amount} VNĐ ({status})\n"
+        message += "📝 Chi tiết:\n"
+        for expense, note in details.get(category, []):
+            if note:
+                message += f"• {expense} ({note})\n"
+            else:
+                message += f"• {expense}\n"
+        message += "\n"
+        total_spent += amount
+    formatted_total = "{:,.0f}".format(abs(total_spent))
+    status = 'chi' if total_spent < 0 else 'thu'
+    message += f"📈 Tổng cộng: {formatted_total} VNĐ ({status})"
+    return message
+
+
+def block_report(totals, details):
+    """The report_command body with the outbox, up to the send"""
+    from outbox import split_blocks
+    blocks = ["📊 Thống kê chi tiêu tháng 9/2026:"]
+    total_spent = 0
+    for category, count, amount in totals:
+        formatted_amount = "{:,.0f}".format(abs(amount))
+        status = 'chi' if amount < 0 else 'thu'
+        lines = [f"📌 {category}:", f"💰 Tổng: {formatted_amount} VNĐ ({status})", "📝 Chi tiết:"]
+        for expense, note in details.get(category, []):
+            lines.append(f"• {expense} ({note})" if note else f"• {expense}")
+        blocks.append("\n".join(lines))
+        total_spent += amount
+    formatted_total = "{:,.0f}".format(abs(total_spent))
+    status = 'chi' if total_spent < 0 else 'thu'
+    blocks.append(f"📈 Tổng cộng: {formatted_total} VNĐ ({status})")
+    return [text for text, _ in split_blocks(blocks)]
+
+
+def bench_report(rows, repeat):
+    from outbox import MAX_MESSAGE_LENGTH, text_length
+    totals, details = report_inputs(rows)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        legacy = legacy_report(totals, details)
+    legacy_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = block_report(totals, details)
+    blocks_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    longest = max(map(text_length, chunks))
+    print(f"report of {len(rows)} transactions")
+    print(f"  legacy += string     {legacy_ms:8.2f} ms  1 message of {text_length(legacy):,} units "
+          f"({'rejected' if text_length(legacy) > MAX_MESSAGE_LENGTH else 'ok'})")
+    print(f"  blocks + split       {blocks_ms:8.2f} ms  {len(chunks)} messages, longest {longest:,} units")
+    joined = '\n\n'.join(chunks)
+    same = joined.replace('\n', '') == legacy.replace('\n', '')
+    print(f"  same content as legacy: {same}\n")
+    return longest <= MAX_MESSAGE_LENGTH and same
+
+
+class FakeTelegram:
+    """send_message with Telegram-like flood limits, `speedup` times faster"""
+
+    def __init__(self, speedup, per_chat_rate=1, per_chat_burst=3, global_rate=30, latency=0.05):
+        from outbox import TokenBucket
+        self.speedup = speedup
+        self.latency = latency / speedup
+        self._global = TokenBucket(global_rate * speedup, global_rate)
+        self._chats = {}
+        self._make = lambda: TokenBucket(per_chat_rate * speedup, per_chat_burst)
+        self.accepted = []
+        self.rejected = 0
+
+    def _allow(self, bucket):
+        bucket._refill()
+        if bucket._tokens >= 1:
+            bucket._tokens -= 1
+            return True
+        return False
+
+    async def send_message(self, chat_id, text, **kwargs):
+        from telegram.error import RetryAfter
+        await asyncio.sleep(self.latency)
+        chat = self._chats.setdefault(chat_id, self._make())
+        if not self._allow(chat) or not self._allow(self._global):
+            self.rejected += 1
+            raise RetryAfter(3 / self.speedup)
+        self.accepted.append((chat_id, text))
+        return len(self.accepted)
+
+
+def render(items):
+    if len(items) == 1:
+        return f"Tài khoản của bạn đã giảm {items[0]} VNĐ"
+    return f"Bạn có {len(items)} giao dịch chưa ghi chú:\n" + "\n".join(f"💰 {item} VNĐ" for item in items)
+
+
+async def legacy_burst(rows, chats, speedup):
+    """The original check_unread_transactions loop: one message per row, no retry"""
+    telegram = FakeTelegram(speedup)
+    delivered = failed = 0
+    start = time.perf_counter()
+    for i, row in enumerate(rows):
+        try:
+            await telegram.send_message(chat_id=i % chats, text=render([abs(row['price'])]))
+            delivered += 1
+        except Exception:
+            failed += 1
+    return delivered, failed, len(telegram.accepted), time.perf_counter() - start
+
+
+async def outbox_burst(rows, chats, speedup):
+    from outbox import Outbox
+    telegram = FakeTelegram(speedup)
+    outbox = Outbox(telegram, global_rate=25 * speedup, per_chat_rate=1 * speedup, per_chat_burst=3,
+                    coalesce_window=1 / speedup, max_digest=10)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(outbox.notify(i % chats, row['emailId'], abs(row['price']), render) for i, row in enumerate(rows)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"  outbox stats: {outbox.stats}, telegram rejected {telegram.rejected}")
+    return len(rows) - failed, failed, len(telegram.accepted), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--speedup', type=float, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('telegram') is None:
+        print("python-telegram-bot is not installed, skipping")
+        return
+
+    rows = synthetic_month(args.transactions)
+    ok = bench_report(rows, args.repeat)
+
+    print(f"notification burst: {len(rows)} transactions over {args.chats} chats "
+          f"(flood limits {args.speedup:g}x faster than Telegram's)")
+    for label, run in (('legacy, one per row', legacy_burst), ('outbox', outbox_burst)):
+        delivered, failed, messages, elapsed = asyncio.run(run(rows, args.chats, args.speedup))
+        print(f"  {label:<20} {delivered:>5} notified  {failed:>5} lost  {messages:>5} messages  "
+              f"{elapsed * args.speedup:8.1f} s at Telegram's limits")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Correctness and throughput benchmark for transaction_parser.
+
+Usage: python benchmarks/bench_parser.py [--repeat N]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transaction_parser
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parser_corpus.jsonl')
+
+
+def legacy_extract_transaction_info(text):
+    """The original per-message Timo parser, kept here as the baseline"""
+    transaction_type = None
+    if "vừa tăng" in text.lower():
+        transaction_type = "+"
+    elif "vừa giảm" in text.lower():
+        transaction_type = "-"
+    match = re.search(r'(\d{1,3}(?:[.,]\d{3})*)\s?(VND|USD|đ)', text)
+    price = 0.0
+    if match:
+        price = float(match.group(1).replace(".", "").replace(",", ""))
+    note = None
+    match_note = re.search(r'Mô tả:\s*(.+)', text)
+    if match_note:
+        note = match_note.group(1).strip()
+    if transaction_type == "-":
+        price = -price
+    return price, note
+
+
+def load_corpus():
+    with open(CORPUS, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_correctness(corpus):
+    failures = 0
+    for case in corpus:
+        tx = transaction_parser.parse(case['sender'], case['text'])
+        # Only the fields a case lists are checked
+        got = {field: getattr(tx, field) for field in case['expected']}
+        if got != case['expected']:
+            failures += 1
+            print(f"FAIL {case['sender']}: {case['text'][:60]}...")
+            print(f"  expected {case['expected']}")
+            print(f"  got      {got}")
+    print(f"correctness: {len(corpus) - failures}/{len(corpus)} cases pass")
+    return failures == 0
+
+
+def bench(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:>12,.0f} msg/s  ({elapsed * 1000:.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    ok = check_correctness(corpus)
+
+    # The legacy parser only knows Timo, so both run on the same Timo messages
+    timo = [(case['sender'], case['text']) for case in corpus if 'timo' in case['sender']] * args.repeat
+    items = [(case['sender'], case['text']) for case in corpus] * args.repeat
+    print(f"\nthroughput over {len(timo):,} Timo messages:")
+    bench('legacy', lambda: [legacy_extract_transaction_info(t) for _, t in timo], len(timo))
+    bench('engine parse()', lambda: [transaction_parser.parse(s, t) for s, t in timo], len(timo))
+    print(f"\nthroughput over {len(items):,} messages from every bank:")
+    bench('engine parse()', lambda: [transaction_parser.parse(s, t) for s, t in items], len(items))
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
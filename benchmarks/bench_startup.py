@@ -0,0 +1,212 @@
+"""Cold start benchmark for the bot (test.py).
+
+1. Import time: `python -X importtime -c "import test"` in a fresh process,
+   repeated --runs times. Reports the median and the slowest modules that
+   test.py imports directly.
+2. Time to first update: starts `python test.py` in polling mode against a
+   fake Bot API served on localhost. The fake answers the first getUpdates
+   with a /help message and records when the bot's reply arrives. The run
+   reports when the process first called the API (import and setup done),
+   when it first polled (startup hooks done) and when it replied.
+
+The bot still opens its database pool at startup, so step 2 needs DB_* (or
+the .env file) to point at a reachable PostgreSQL; pass --imports-only to
+skip it.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--top N] [--imports-only]
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import importlib.util
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_ID = 424242
+
+
+def parse_importtime(stderr):
+    """Return {module: (cumulative_us, depth)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        modules[name.strip()] = (int(cumulative), depth)
+    return modules
+
+
+def import_once():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import test'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return wall, parse_importtime(result.stderr)
+
+
+def bench_imports(runs, top):
+    walls = []
+    cumulative = {}
+    for _ in range(runs):
+        wall, modules = import_once()
+        walls.append(wall)
+        for name, (us, depth) in modules.items():
+            # Modules imported by test.py itself sit one level below it
+            if depth == 1:
+                cumulative.setdefault(name, []).append(us)
+        cumulative.setdefault('test', []).append(modules['test'][0])
+
+    print(f"import test ({runs} runs)")
+    print(f"  process wall time    {statistics.median(walls) * 1000:8.1f} ms (median)")
+    print(f"  import test          {statistics.median(cumulative.pop('test')) / 1000:8.1f} ms (median)")
+    slowest = sorted(cumulative.items(), key=lambda item: -statistics.median(item[1]))[:top]
+    for name, values in slowest:
+        print(f"    {name:<30} {statistics.median(values) / 1000:8.1f} ms")
+    print()
+
+
+class FakeBotAPI:
+    """Just enough of the Bot API for the bot to start polling and reply"""
+
+    def __init__(self):
+        self.started = None
+        self.events = {}
+        self._served = False
+        self.replied = asyncio.Event()
+
+    def mark(self, event):
+        self.events.setdefault(event, time.perf_counter() - self.started)
+
+    async def handle(self, request):
+        from aiohttp import web
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.mark('first API call')
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'getUpdates':
+            self.mark('first poll')
+            if self._served:
+                await asyncio.sleep(0.5)
+                result = []
+            else:
+                self._served = True
+                result = [{'update_id': 1, 'message': {
+                    'message_id': 1,
+                    'date': int(time.time()),
+                    'chat': {'id': CHAT_ID, 'type': 'private'},
+                    'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Bench'},
+                    'text': '/help',
+                    'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+                }}]
+        elif method == 'sendMessage':
+            if int(params.get('chat_id', 0)) == CHAT_ID:
+                self.mark('first reply')
+                self.replied.set()
+            result = {'message_id': 2, 'date': int(time.time()),
+                      'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                      'text': params.get('text', '')}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+async def first_update_once(prewarm_delay, timeout):
+    from aiohttp import web
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN='1:bench',
+        TELEGRAM_API_URL=f'http://127.0.0.1:{port}/bot',
+        BOT_MODE='polling',
+        PREWARM_DELAY=str(prewarm_delay)
+    )
+    api.started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, 'test.py', cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        done, _ = await asyncio.wait(
+            [asyncio.ensure_future(api.replied.wait()), asyncio.ensure_future(process.wait())],
+            timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not api.replied.is_set():
+            if process.returncode is not None:
+                stderr = (await process.stderr.read()).decode(errors='replace').strip().splitlines()
+                raise RuntimeError(f"bot exited with {process.returncode}: {stderr[-1] if stderr else ''}")
+            raise RuntimeError(f"no reply within {timeout}s")
+        return api.events
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        await runner.cleanup()
+
+
+def bench_first_update(runs, prewarm_delay, timeout):
+    if importlib.util.find_spec('aiohttp') is None:
+        print("aiohttp is not installed, skipping time to first update")
+        return True
+    print(f"time to first update ({runs} runs, PREWARM_DELAY={prewarm_delay:g})")
+    events = {}
+    for _ in range(runs):
+        try:
+            run = asyncio.run(first_update_once(prewarm_delay, timeout))
+        except RuntimeError as e:
+            print(f"  failed: {e}")
+            return False
+        for event, elapsed in run.items():
+            events.setdefault(event, []).append(elapsed)
+    for event in ('first API call', 'first poll', 'first reply'):
+        if event in events:
+            print(f"  {event:<20} {statistics.median(events[event]) * 1000:8.1f} ms (median)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest direct imports to list')
+    parser.add_argument('--prewarm-delay', type=float, default=2)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--imports-only', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        bench_imports(args.runs, args.top)
+    except RuntimeError as e:
+        print(f"test.py cannot be imported here ({e}), skipping")
+        return
+    if args.imports_only:
+        return
+    sys.exit(0 if bench_first_update(args.runs, args.prewarm_delay, args.timeout) else 1)
+
+
+if __name__ == '__main__':
+    main()
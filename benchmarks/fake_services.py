@@ -0,0 +1,273 @@
+"""Local stand-ins for the services the bot talks to, for benchmarks.
+
+FakeTelegram serves the Bot API methods the bot uses (long polling, sending
+and editing messages, file downloads) from an in-memory queue of updates,
+and reports every message the bot sends. It also answers Google's speech
+endpoint when the bot reaches it through http_proxy. FakeGmail serves
+per-account mailboxes to the Gmail API client, batch requests included.
+Both run on aiohttp in the benchmark's own event loop.
+"""
+import json
+import time
+import email
+import asyncio
+import itertools
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import parse_qs, urlsplit
+
+from aiohttp import web
+
+
+async def start_app(app, host='127.0.0.1', port=0):
+    """Serve an aiohttp app; returns (runner, base URL)"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://{host}:{port}'
+
+
+class FakeTelegram:
+    """The Bot API as the bot uses it.
+
+    push_update() queues an update for getUpdates; add_file() makes bytes
+    downloadable by file_id. on_message(chat_id, message_id, text, method)
+    is called for every sendMessage/editMessageText. Message ids are
+    allocated per chat with next_message_id(), shared with the simulated
+    users so replies can point at bot messages.
+    """
+
+    def __init__(self, on_message=None, transcript='ăn phở 50 nghìn'):
+        self.on_message = on_message
+        self.transcript = transcript
+        self.updates = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = {}
+        self._has_updates = asyncio.Event()
+        self.files = {}
+        self.calls = {}
+        self.first_call = {}
+
+    def make_app(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        # Reached through http_proxy as http://www.google.com/speech-api/v2/recognize
+        app.router.add_post('/speech-api/v2/recognize', self.handle_speech)
+        return app
+
+    def next_message_id(self, chat_id):
+        self._message_ids[chat_id] = self._message_ids.get(chat_id, 0) + 1
+        return self._message_ids[chat_id]
+
+    def push_update(self, message):
+        update = {'update_id': next(self._update_ids), 'message': message}
+        self.updates.append(update)
+        self._has_updates.set()
+        return update['update_id']
+
+    def add_file(self, file_id, data):
+        self.files[file_id] = data
+
+    async def _params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+        return dict(await request.post())
+
+    async def handle_method(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.first_call.setdefault(method, time.perf_counter())
+        params = await self._params(request)
+        handler = getattr(self, f'api_{method}', None)
+        result = await handler(params) if handler else True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+    async def api_getUpdates(self, params):
+        if not self.updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout=min(float(params.get('timeout') or 0), 1))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        batch = []
+        while self.updates and len(batch) < limit:
+            batch.append(self.updates.popleft())
+        return batch
+
+    def _sent(self, params, method, message_id=None):
+        chat_id = int(params['chat_id'])
+        if message_id is None:
+            message_id = self.next_message_id(chat_id)
+        text = params.get('text', '')
+        if self.on_message is not None:
+            self.on_message(chat_id, message_id, text, method)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Bench'},
+            'text': text,
+        }
+
+    async def api_sendMessage(self, params):
+        return self._sent(params, 'sendMessage')
+
+    async def api_editMessageText(self, params):
+        return self._sent(params, 'editMessageText', int(params['message_id']))
+
+    async def api_getFile(self, params):
+        file_id = params['file_id']
+        return {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.files.get(file_id, b'')),
+                'file_path': f'files/{file_id}'}
+
+    async def handle_file(self, request):
+        data = self.files.get(request.match_info['path'].rsplit('/', 1)[-1])
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data)
+
+    async def handle_speech(self, request):
+        await request.read()
+        alternative = {'transcript': self.transcript, 'confidence': 0.9}
+        body = '{"result":[]}\n' + json.dumps({'result': [{'alternative': [alternative], 'final': True}],
+                                               'result_index': 0}, ensure_ascii=False) + '\n'
+        return web.Response(text=body, content_type='application/json')
+
+
+class Mailbox:
+    def __init__(self, address):
+        self.address = address
+        self.messages = {}
+        self.history = []  # (historyId, message id)
+        self.history_id = 1000
+
+
+class FakeGmail:
+    """Gmail API v1 for profile, messages.list/get, history.list and batches.
+
+    Mailboxes are selected by the OAuth access token. deliver() adds a bank
+    email whose Date header is the delivery time, and returns that time.
+    """
+
+    def __init__(self):
+        self.mailboxes = {}
+        self._ids = itertools.count(1)
+        self.calls = {}
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/gmail/v1/users/{user}/profile', self.handle_profile)
+        app.router.add_get('/gmail/v1/users/{user}/messages', self.handle_list)
+        app.router.add_get('/gmail/v1/users/{user}/messages/{id}', self.handle_get)
+        app.router.add_get('/gmail/v1/users/{user}/history', self.handle_history)
+        app.router.add_post('/batch/gmail/v1', self.handle_batch)
+        return app
+
+    def add_account(self, token, address):
+        self.mailboxes[token] = Mailbox(address)
+
+    def deliver(self, token, sender, subject, snippet):
+        mailbox = self.mailboxes[token]
+        message_id = f'{next(self._ids):016x}'
+        sent = datetime.now(timezone.utc)
+        mailbox.history_id += 1
+        mailbox.messages[message_id] = {
+            'id': message_id,
+            'threadId': message_id,
+            'historyId': str(mailbox.history_id),
+            'snippet': snippet,
+            'payload': {'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'Subject', 'value': subject},
+                {'name': 'Date', 'value': format_datetime(sent)},
+            ]},
+        }
+        mailbox.history.append((mailbox.history_id, message_id))
+        return message_id, sent
+
+    def _mailbox(self, authorization):
+        token = (authorization or '').removeprefix('Bearer ').strip()
+        return self.mailboxes.get(token)
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def profile(self, mailbox):
+        return 200, {'emailAddress': mailbox.address, 'historyId': str(mailbox.history_id)}
+
+    def list_messages(self, mailbox):
+        ids = sorted(mailbox.messages, reverse=True)
+        return 200, {'messages': [{'id': i, 'threadId': i} for i in ids], 'resultSizeEstimate': len(ids)}
+
+    def get_message(self, mailbox, message_id):
+        message = mailbox.messages.get(message_id)
+        if message is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        return 200, message
+
+    def list_history(self, mailbox, start):
+        added = [{'id': str(h), 'messagesAdded': [{'message': {'id': m, 'threadId': m}}]}
+                 for h, m in mailbox.history if h > start]
+        return 200, {'history': added, 'historyId': str(mailbox.history_id)}
+
+    def _dispatch(self, mailbox, method, path, query):
+        if mailbox is None:
+            return 401, {'error': {'code': 401, 'message': 'Invalid Credentials'}}
+        parts = path.strip('/').split('/')
+        # gmail/v1/users/{user}/...
+        resource = parts[4:]
+        if resource == ['profile']:
+            self._count('profile')
+            return self.profile(mailbox)
+        if resource == ['messages']:
+            self._count('messages.list')
+            return self.list_messages(mailbox)
+        if len(resource) == 2 and resource[0] == 'messages':
+            self._count('messages.get')
+            return self.get_message(mailbox, resource[1])
+        if resource == ['history']:
+            self._count('history.list')
+            return self.list_history(mailbox, int(query.get('startHistoryId', ['0'])[0]))
+        return 404, {'error': {'code': 404, 'message': f'Unknown path {path}'}}
+
+    async def _handle(self, request):
+        query = parse_qs(request.query_string)
+        status, body = self._dispatch(self._mailbox(request.headers.get('Authorization')),
+                                      request.method, request.path, query)
+        return web.json_response(body, status=status)
+
+    handle_profile = handle_list = handle_get = handle_history = _handle
+
+    async def handle_batch(self, request):
+        self._count('batch')
+        body = await request.read()
+        outer_mailbox = self._mailbox(request.headers.get('Authorization'))
+        parsed = email.message_from_bytes(
+            b'Content-Type: ' + request.headers['Content-Type'].encode() + b'\r\n\r\n' + body
+        )
+        boundary = f'batch_{next(self._ids):x}'
+        parts = []
+        for part in parsed.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            headers = dict(line.split(':', 1) for line in rest.split('\n\n', 1)[0].splitlines() if ':' in line)
+            auth = next((v for k, v in headers.items() if k.lower() == 'authorization'), None)
+            method, target, _ = request_line.split(' ', 2)
+            url = urlsplit(target)
+            mailbox = self._mailbox(auth.strip()) if auth else outer_mailbox
+            status, payload = self._dispatch(mailbox, method, url.path, parse_qs(url.query))
+            content_id = part['Content-ID'].strip('<>')
+            parts.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                f'Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload, ensure_ascii=False)}\r\n'
+            )
+        text = ''.join(parts) + f'--{boundary}--\r\n'
+        return web.Response(body=text.encode(), headers={'Content-Type': f'multipart/mixed; boundary={boundary}'})
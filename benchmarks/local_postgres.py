@@ -0,0 +1,148 @@
+"""Throwaway PostgreSQL databases for benchmarks.
+
+LocalPostgres runs a private cluster (initdb + pg_ctl) in a temporary
+directory on a free port; ScratchDatabase creates a database on an existing
+server instead (from the DB_* settings) and drops it afterwards. Both apply
+the Prisma migrations, so the bot sees the same schema as production.
+
+PostgreSQL refuses to run as root: under root, use ScratchDatabase or run
+the benchmark as another user.
+"""
+import os
+import glob
+import shutil
+import socket
+import tempfile
+import subprocess
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS = os.path.join(ROOT, 'prisma', 'migrations')
+
+
+def find_pg_bin(pg_bin=None):
+    """Directory holding initdb and pg_ctl: the argument, PG_BIN, PATH or the Debian layout"""
+    candidates = [pg_bin, os.getenv('PG_BIN')]
+    initdb = shutil.which('initdb')
+    if initdb:
+        candidates.append(os.path.dirname(initdb))
+    candidates.extend(sorted(glob.glob('/usr/lib/postgresql/*/bin'), reverse=True))
+    for candidate in candidates:
+        if candidate and os.path.exists(os.path.join(candidate, 'initdb')):
+            return candidate
+    raise RuntimeError("initdb not found; install PostgreSQL or pass --pg-bin / set PG_BIN")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def apply_migrations(config):
+    """Run every Prisma migration, oldest first"""
+    conn = psycopg2.connect(**config)
+    try:
+        with conn, conn.cursor() as cursor:
+            for path in sorted(glob.glob(os.path.join(MIGRATIONS, '*', 'migration.sql'))):
+                with open(path, encoding='utf-8') as f:
+                    cursor.execute(f.read())
+    finally:
+        conn.close()
+
+
+class LocalPostgres:
+    """A private PostgreSQL cluster that lives as long as the benchmark"""
+
+    def __init__(self, pg_bin=None, database='emailbot_bench', max_connections=200):
+        self.pg_bin = find_pg_bin(pg_bin)
+        self.database = database
+        self.max_connections = max_connections
+        self.port = None
+        self._dir = None
+
+    @property
+    def config(self):
+        return {'host': '127.0.0.1', 'port': str(self.port), 'database': self.database,
+                'user': 'postgres', 'password': 'postgres'}
+
+    def _run(self, tool, *args):
+        result = subprocess.run([os.path.join(self.pg_bin, tool), *args], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{tool} failed: {(result.stderr or result.stdout).strip()}")
+
+    def start(self):
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            raise RuntimeError("PostgreSQL cannot run as root; use --existing-server or another user")
+        self._dir = tempfile.mkdtemp(prefix='emailbot-pg-')
+        data = os.path.join(self._dir, 'data')
+        self.port = free_port()
+        self._run('initdb', '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync')
+        options = (f"-p {self.port} -k {self._dir} -c listen_addresses=127.0.0.1 "
+                   f"-c max_connections={self.max_connections}")
+        self._run('pg_ctl', '-D', data, '-o', options, '-l', os.path.join(self._dir, 'server.log'), '-w', 'start')
+        conn = psycopg2.connect(**dict(self.config, database='postgres'))
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE "{self.database}";')
+        conn.close()
+        apply_migrations(self.config)
+        return self
+
+    def stop(self):
+        if self._dir is None:
+            return
+        try:
+            self._run('pg_ctl', '-D', os.path.join(self._dir, 'data'), '-m', 'fast', '-w', 'stop')
+        finally:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ScratchDatabase:
+    """A database created on an existing server (DB_* settings) and dropped afterwards"""
+
+    def __init__(self, server=None, database=None):
+        self.server = server or {
+            'host': os.getenv('DB_HOST'),
+            'port': os.getenv('DB_PORT'),
+            'database': os.getenv('DB_NAME', 'postgres'),
+            'user': os.getenv('DB_USER'),
+            'password': os.getenv('DB_PASSWORD'),
+        }
+        self.database = database or f'emailbot_bench_{os.getpid()}'
+
+    @property
+    def config(self):
+        return dict(self.server, database=self.database)
+
+    def _admin(self, statement):
+        conn = psycopg2.connect(**self.server)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+        finally:
+            conn.close()
+
+    def start(self):
+        # template0 so the database is UTF8 even when the server default is not
+        self._admin(f'CREATE DATABASE "{self.database}" ENCODING \'UTF8\' TEMPLATE template0;')
+        apply_migrations(self.config)
+        return self
+
+    def stop(self):
+        self._admin(f'DROP DATABASE IF EXISTS "{self.database}";')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
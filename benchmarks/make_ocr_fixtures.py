@@ -0,0 +1,126 @@
+"""Regenerate the synthetic receipts and screenshots in fixtures/ocr.
+
+They mimic what users send to the bot: phone photos of receipts that are
+large, slightly rotated, unevenly lit and noisy, and banking app
+screenshots. The ground truth goes to fixtures/ocr/expected.jsonl.
+
+Usage: python benchmarks/make_ocr_fixtures.py [--font PATH]
+"""
+import os
+import json
+import random
+import argparse
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ocr')
+DEFAULT_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+RECEIPTS = [
+    [
+        "CỬA HÀNG TIỆN LỢI MINH CHÂU",
+        "123 Nguyễn Trãi, Quận 1, TP.HCM",
+        "Hóa đơn bán lẻ số 004512",
+        "Sữa tươi Vinamilk 1L      32.000",
+        "Bánh mì sandwich          18.500",
+        "Nước suối Lavie x2        10.000",
+        "Tổng cộng                 60.500",
+        "Tiền mặt                 100.000",
+        "Tiền thối                 39.500",
+        "Cảm ơn quý khách!",
+    ],
+    [
+        "QUÁN PHỞ HÀ NỘI",
+        "45 Lê Lợi, Hoàn Kiếm, Hà Nội",
+        "Bàn 07 - Ngày 12/10/2026",
+        "Phở bò tái chín           55.000",
+        "Quẩy                       5.000",
+        "Trà đá x2                  6.000",
+        "Thành tiền                66.000",
+        "Thanh toán chuyển khoản",
+    ],
+    [
+        "SIÊU THỊ ĐIỆN MÁY XANH",
+        "Phiếu thanh toán 2026-10-01",
+        "Bàn ủi hơi nước Philips  890.000",
+        "Giảm giá khuyến mãi      -90.000",
+        "Phí giao hàng             30.000",
+        "Tổng thanh toán          830.000",
+        "Bảo hành 24 tháng",
+    ],
+]
+
+SCREENSHOTS = [
+    [
+        "Chuyển tiền thành công",
+        "Số tiền: 1.250.000 VND",
+        "Người nhận: NGUYEN VAN AN",
+        "Ngân hàng: Vietcombank",
+        "Nội dung: tiền nhà tháng 10",
+        "Mã giao dịch: FT26285123456",
+    ],
+    [
+        "Thông báo biến động số dư",
+        "Tài khoản: 0071000123456",
+        "Số dư giảm: 245.000 VND",
+        "Số dư hiện tại: 8.730.500 VND",
+        "Mô tả: thanh toán hóa đơn điện",
+    ],
+]
+
+
+def render(lines, font, width, line_height, margin, background, ink):
+    height = margin * 2 + line_height * len(lines)
+    image = Image.new('RGB', (width, height), background)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, font=font, fill=ink)
+    return image
+
+
+def photograph(image, rng, scale, angle):
+    """Make a clean render look like a phone photo of a receipt"""
+    image = image.resize((int(image.width * scale), int(image.height * scale)), Image.BICUBIC)
+    image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=(205, 200, 190))
+    # Uneven lighting: a horizontal gradient that darkens one side
+    shade = Image.linear_gradient('L').rotate(90).resize(image.size)
+    shade = shade.point(lambda value: 150 + value * 105 // 255)
+    image = Image.composite(image, Image.new('RGB', image.size, (60, 55, 50)), shade)
+    noise = Image.effect_noise(image.size, 24).convert('RGB')
+    image = Image.blend(image, noise, 0.12)
+    return image.filter(ImageFilter.GaussianBlur(rng.uniform(0.6, 1.2)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--font', default=DEFAULT_FONT)
+    args = parser.parse_args()
+
+    rng = random.Random(2026)
+    os.makedirs(OUT, exist_ok=True)
+    cases = []
+
+    for i, lines in enumerate(RECEIPTS):
+        font = ImageFont.truetype(args.font, 26)
+        image = render(lines, font, 620, 40, 30, (246, 242, 232), (35, 35, 40))
+        angle = rng.choice([-1, 1]) * rng.uniform(2.0, 4.5)
+        image = photograph(image, rng, scale=rng.uniform(3.2, 4.0), angle=angle)
+        name = f'receipt_{i + 1}.jpg'
+        image.save(os.path.join(OUT, name), quality=80)
+        cases.append({'file': name, 'kind': 'receipt', 'text': '\n'.join(lines)})
+
+    for i, lines in enumerate(SCREENSHOTS):
+        font = ImageFont.truetype(args.font, 34)
+        image = render(lines, font, 1080, 64, 60, (255, 255, 255), (30, 30, 30))
+        name = f'screenshot_{i + 1}.png'
+        image.save(os.path.join(OUT, name), optimize=True)
+        cases.append({'file': name, 'kind': 'screenshot', 'text': '\n'.join(lines)})
+
+    with open(os.path.join(OUT, 'expected.jsonl'), 'w', encoding='utf-8') as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False) + '\n')
+    print(f"wrote {len(cases)} images to {OUT}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Size-bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def keys(self):
+        return list(self._data)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire ttl seconds after being stored"""
+
+    def __init__(self, maxsize=256, ttl=3600):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            self.pop(key)
+            return default
+        return value
+
+    def put(self, key, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
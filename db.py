@@ -0,0 +1,301 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+import metrics
+
+QUERY_SECONDS = metrics.histogram('db_query_seconds', 'Time spent running database queries', ['query'])
+POOL_WAIT_SECONDS = metrics.histogram(
+    'db_pool_wait_seconds', 'Time a query waited for a worker thread and a connection'
+)
+SQL_VERBS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+
+class Database:
+    """Shared PostgreSQL connection pool with non-blocking query helpers.
+
+    psycopg2 is blocking, so every query runs on a dedicated thread pool that
+    is exactly as large as the connection pool: a worker can always check out
+    a connection and the event loop never waits on the network. If the
+    database cannot be reached when the pool is opened, the connections are
+    made on first use instead, so callers get errors rather than the bot
+    failing to start.
+    """
+
+    def __init__(self, config, minconn=1, maxconn=10, health_check_interval=30, slow_query_ms=500):
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.slow_query_ms = slow_query_ms
+        self._pool = None
+        self._executor = None
+        self._last_used = {}
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool raises when exhausted; block callers instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def open(self):
+        """Create the worker threads and, if the database answers, the pool"""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.maxconn, thread_name_prefix='db')
+        try:
+            self._connect_pool()
+        except psycopg2.Error as e:
+            logging.warning(f"Database is not reachable, connecting on first use: {e}")
+
+    def _connect_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self.config)
+                logging.info(f"Database pool opened (min={self.minconn}, max={self.maxconn})")
+
+    def close(self):
+        """Close every pooled connection"""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+        logging.info("Database pool closed")
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _getconn(self):
+        self._slots.acquire()
+        try:
+            self._connect_pool()
+            # Replace connections that were dropped by the server or a restart
+            for _ in range(self.maxconn + 1):
+                with self._lock:
+                    conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                logging.warning("Discarding broken database connection")
+                with self._lock:
+                    self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("No healthy database connection available")
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _putconn(self, conn):
+        self._last_used[id(conn)] = time.monotonic()
+        try:
+            with self._lock:
+                self._pool.putconn(conn, close=conn.closed != 0)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for blocking code already running off the event loop.
+
+        The block runs as one transaction: it is committed on success and
+        rolled back on error.
+        """
+        conn = self._getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+
+    def _timed(self, label, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            QUERY_SECONDS.labels(query=_query_label(label)).observe(elapsed)
+            elapsed_ms = elapsed * 1000
+            if elapsed_ms >= self.slow_query_ms:
+                logging.warning(f"Slow query ({elapsed_ms:.1f} ms): {label}")
+            else:
+                logging.debug(f"Query ({elapsed_ms:.1f} ms): {label}")
+
+    async def run(self, fn, *args):
+        """Run fn(cursor, *args) inside a transaction on a worker thread"""
+        if self._executor is None:
+            raise RuntimeError("Database pool is not open")
+
+        submitted = time.perf_counter()
+
+        def work():
+            with self.connection() as conn:
+                POOL_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+                with conn.cursor() as cursor:
+                    return self._timed(getattr(fn, '__name__', 'run'), fn, cursor, *args)
+
+        # Run with the caller's context so slow query logs carry its trace ID
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, contextvars.copy_context().run, work)
+
+    async def fetchone(self, query, params=None):
+        def work(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        work.__name__ = _describe(query)
+        return await self.run(work)
+
+    async def fetchall(self, query, params=None):
+        def work(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        work.__name__ = _describe(query)
+        return await self.run(work)
+
+    async def execute(self, query, params=None):
+        """Execute a statement and return the number of affected rows"""
+        def work(cursor):
+            cursor.execute(query, params)
+            return cursor.rowcount
+        work.__name__ = _describe(query)
+        return await self.run(work)
+
+    async def ping(self):
+        """Return True if the database answers a trivial query"""
+        try:
+            return await self.fetchone("SELECT 1") == (1,)
+        except Exception as e:
+            logging.error(f"Database health check failed: {e}")
+            return False
+
+
+def _describe(query):
+    return ' '.join(query.split())[:120]
+
+
+def _query_label(label):
+    """Metric label for a query: its verb and first table, or the function name"""
+    verb = label.split(' ', 1)[0].upper()
+    if verb not in SQL_VERBS:
+        return label
+    table = re.search(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', label, re.IGNORECASE)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+class Listener:
+    """Dedicated LISTEN connection that reports NOTIFY payloads on the event loop.
+
+    The socket is watched with loop.add_reader, so waiting for notifications
+    costs no thread and no query. A dropped connection is re-established with
+    exponential backoff.
+    """
+
+    def __init__(self, config, channel, callback, max_backoff=60):
+        self.config = config
+        self.channel = channel
+        self.callback = callback
+        self.max_backoff = max_backoff
+        self._conn = None
+        self._loop = None
+        self._reconnect_task = None
+        self._closed = False
+
+    @property
+    def connected(self):
+        return self._conn is not None and not self._conn.closed
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.config)
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}";')
+        return conn
+
+    async def start(self):
+        """Connect and start listening, retrying in the background on failure"""
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        try:
+            await self._attach()
+        except psycopg2.Error as e:
+            logging.error(f"Could not LISTEN on {self.channel}: {e}")
+            self._schedule_reconnect()
+
+    async def _attach(self):
+        conn = await asyncio.to_thread(self._connect)
+        if self._closed:
+            conn.close()
+            return
+        self._conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        logging.info(f"Listening for notifications on {self.channel}")
+
+    def _detach(self):
+        if self._conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._conn.fileno())
+        except (ValueError, psycopg2.InterfaceError):
+            pass
+        if not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            logging.error(f"Lost LISTEN connection on {self.channel}: {e}")
+            self._detach()
+            self._schedule_reconnect()
+            return
+
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            try:
+                self.callback(notify.payload)
+            except Exception as e:
+                logging.error(f"Error in notification callback: {e}")
+
+    def _schedule_reconnect(self):
+        if self._closed or (self._reconnect_task and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+        while not self._closed:
+            await asyncio.sleep(delay)
+            try:
+                await self._attach()
+                return
+            except psycopg2.Error as e:
+                logging.error(f"Reconnect to LISTEN {self.channel} failed: {e}")
+                delay = min(delay * 2, self.max_backoff)
+
+    async def stop(self):
+        """Stop listening and close the connection"""
+        self._closed = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        self._detach()
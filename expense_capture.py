@@ -0,0 +1,314 @@
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from dataclasses import dataclass
+
+from psycopg2.extras import execute_values
+
+DEFAULT_CATEGORY = 'Others'
+
+# Keyword -> category for spoken notes and receipts; the longest keyword wins
+# at a position and the leftmost match in the text decides
+CATEGORIES = {
+    'AN_UONG': ['ăn', 'ăn sáng', 'ăn trưa', 'ăn tối', 'uống', 'cà phê', 'cafe', 'trà sữa', 'trà đá',
+                'phở', 'cơm', 'bún', 'bánh', 'bánh mì', 'nhậu', 'quán', 'nhà hàng', 'đồ ăn'],
+    'DI_CHUYEN': ['xăng', 'đổ xăng', 'grab', 'taxi', 'gửi xe', 'sửa xe', 'vé xe', 'xe buýt', 'vé máy bay'],
+    'MUA_SAM': ['mua', 'quần', 'áo', 'giày', 'siêu thị', 'cửa hàng', 'tiện lợi', 'shopee', 'lazada',
+                'tiki', 'điện máy'],
+    'HOA_DON': ['tiền điện', 'tiền nước', 'internet', 'wifi', 'cước', 'hóa đơn', 'tiền nhà', 'thuê nhà'],
+    'SUC_KHOE': ['thuốc', 'khám', 'bệnh viện', 'nha khoa', 'gym'],
+    'GIAI_TRI': ['xem phim', 'game', 'du lịch', 'karaoke'],
+    'THU_NHAP': ['lương', 'thưởng', 'nhận tiền', 'hoàn tiền'],
+}
+INCOME_CATEGORIES = {'THU_NHAP'}
+
+
+def fold(text):
+    """Lowercase and strip Vietnamese diacritics ("Tổng cộng" -> "tong cong")"""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+_KEYWORDS = sorted(
+    ((keyword, category) for category, keywords in CATEGORIES.items() for keyword in keywords),
+    key=lambda item: len(item[0]), reverse=True
+)
+# Keywords are compared without diacritics, which OCR and typed notes often
+# drop; where two keywords fold alike ("quán", "quần") the first listed wins
+_CATEGORY_BY_KEYWORD = {}
+for _keyword, _category in _KEYWORDS:
+    _CATEGORY_BY_KEYWORD.setdefault(fold(_keyword), _category)
+_CATEGORY_PATTERN = re.compile(
+    r'(?<!\w)(' + '|'.join(re.escape(keyword) for keyword in _CATEGORY_BY_KEYWORD) + r')(?!\w)'
+)
+
+# Spoken amounts: "50k", "50 nghìn", "1 triệu 2", "1tr5", "2 lít", "50.000 đồng".
+# After a large unit a short number is its fraction ("1 triệu 2" is 1.2 million)
+# unless it carries its own small unit ("1 triệu 200 nghìn")
+_LARGE_UNITS = {'triệu': 1000000, 'tr': 1000000, 'củ': 1000000, 'trăm': 100000, 'lít': 100000, 'xị': 100000}
+_SMALL_UNITS = {'nghìn': 1000, 'ngàn': 1000, 'ng': 1000, 'k': 1000, 'đồng': 1, 'vnđ': 1, 'vnd': 1, 'đ': 1}
+_THOUSANDS = r'(?:nghìn|ngàn|ng|k)'
+_END = r'(?![^\W\d_])'  # a unit is not followed by a letter ("50kg" is not 50k)
+
+
+def _alternation(units):
+    return '|'.join(sorted(units, key=len, reverse=True))
+
+
+_SPOKEN_AMOUNT = re.compile(
+    r'(?<![\w.,])(?P<number>\d+(?:[.,]\d+)*)\s*(?:'
+    r'(?P<large>' + _alternation(_LARGE_UNITS) + ')' + _END +
+    r'(?:\s*(?P<rest>\d{1,3})(?:\s*(?P<rest_unit>' + _THOUSANDS + ')' + _END + r')?(?![\d.,]))?'
+    r'|(?P<small>' + _alternation(_SMALL_UNITS) + ')' + _END +
+    r')?'
+)
+_FILLER = re.compile(r'(?<!\w)(?:hết|mất|tốn|là|khoảng|với|và)(?!\w)|[,;:+\-]')
+
+# Receipt totals by priority, compared without diacritics since OCR often drops them
+_TOTAL_LABELS = [
+    re.compile(r'(?<!\w)' + label + r'(?!\w)')
+    for label in ['tong thanh toan', 'can thanh toan', 'tong cong', 'thanh tien', 'tong tien',
+                  'so tien', 'total', 'tong']
+]
+_NOTE_LABELS = ['noi dung', 'mo ta']
+_RECEIPT_AMOUNT = re.compile(r'(?<![\d.,])(?:\d{1,3}(?:[.,]\d{3})+|\d{4,})(?![\d.,]?\d)')
+
+
+@dataclass(frozen=True)
+class Expense:
+    amount: float
+    category: str
+    note: str
+
+
+def guess_category(text):
+    match = _CATEGORY_PATTERN.search(fold(text))
+    return _CATEGORY_BY_KEYWORD[match.group(1)] if match else DEFAULT_CATEGORY
+
+
+def signed(amount, category):
+    """Expenses are stored negative and income positive, like bank transactions"""
+    return abs(amount) if category in INCOME_CATEGORIES else -abs(amount)
+
+
+def _to_number(number):
+    # "50.000" and "1,250,000" use thousands separators; "1,5" and "1.5" are decimals
+    groups = re.split(r'[.,]', number)
+    if all(len(group) == 3 for group in groups[1:]):
+        return float(''.join(groups))
+    if len(groups) == 2:
+        return float(f'{groups[0]}.{groups[1]}')
+    return None
+
+
+def _has_unit(match):
+    return bool(match.group('large') or match.group('small'))
+
+
+def _spoken_amount(match):
+    value = _to_number(match.group('number'))
+    if value is None:
+        return None
+    if match.group('small'):
+        return value * _SMALL_UNITS[match.group('small')]
+    if not match.group('large'):
+        # "ăn trưa 50": amounts under a thousand are said in thousands
+        return value * 1000 if value < 1000 else value
+    amount = value * _LARGE_UNITS[match.group('large')]
+    rest = match.group('rest')
+    if rest and match.group('rest_unit'):
+        amount += int(rest) * 1000
+    elif rest:
+        amount += int(rest) / 10 ** len(rest) * _LARGE_UNITS[match.group('large')]
+    return amount
+
+
+def _clean_note(text):
+    return ' '.join(_FILLER.sub(' ', text).split())
+
+
+def parse_spoken(text):
+    """Parse a spoken or typed note such as "ăn trưa 50 nghìn, cà phê 30k".
+
+    Returns one Expense per amount, each described by the words before it
+    (or after it when the note starts with the amount), or None when the
+    note cannot be read unambiguously.
+    """
+    text = unicodedata.normalize('NFC', text).strip()
+    matches = list(_SPOKEN_AMOUNT.finditer(text.lower()))
+    if any(map(_has_unit, matches)):
+        # "mua 2 cái áo 200k": bare numbers are part of the description
+        matches = [match for match in matches if _has_unit(match)]
+    if not matches:
+        return None
+
+    if len(matches) == 1:
+        match = matches[0]
+        notes = [_clean_note(text[:match.start()] + ' ' + text[match.end():])]
+    else:
+        notes = []
+        start = 0
+        for match in matches:
+            notes.append(_clean_note(text[start:match.start()]))
+            start = match.end()
+        if _clean_note(text[start:]):
+            return None  # trailing words with no amount of their own
+
+    expenses = []
+    for match, note in zip(matches, notes):
+        amount = _spoken_amount(match)
+        if not amount or not note:
+            return None
+        category = guess_category(note)
+        expenses.append(Expense(signed(amount, category), category, note))
+    return expenses
+
+
+def _receipt_amount(line):
+    amounts = _RECEIPT_AMOUNT.findall(line)
+    if not amounts:
+        return None
+    # The total is the rightmost figure on its line
+    return float(re.sub(r'[.,]', '', amounts[-1]))
+
+
+def parse_receipt(text):
+    """Parse OCR text of a receipt or a transfer screenshot into an Expense.
+
+    The amount comes from the highest-priority total line, the note from a
+    "Nội dung" line or else the first line (usually the shop's name).
+    Returns None when no total is found.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    folded = [fold(line) for line in lines]
+
+    amount = None
+    for pattern in _TOTAL_LABELS:
+        for line, folded_line in zip(reversed(lines), reversed(folded)):
+            if pattern.search(folded_line):
+                amount = _receipt_amount(line)
+                if amount:
+                    break
+        if amount:
+            break
+    if not amount:
+        return None
+
+    note = None
+    for line, folded_line in zip(lines, folded):
+        for label in _NOTE_LABELS:
+            if folded_line.startswith(label):
+                note = line.split(':', 1)[-1].strip()
+                break
+        if note:
+            break
+    if not note:
+        note = next((line for line in lines if any(char.isalpha() for char in line)), 'Hóa đơn')
+
+    category = guess_category(note)
+    if category == DEFAULT_CATEGORY:
+        category = guess_category(text)
+    return Expense(signed(amount, category), category, note)
+
+
+def expense_from_json(reply):
+    """Read the {"amount", "category", "note"} object a language model was asked for"""
+    match = re.search(r'\{.*\}', reply or '', re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+        amount = float(data['amount'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    note = str(data.get('note') or '').strip()
+    if not amount or not note:
+        return None
+    category = str(data.get('category') or '').strip().upper() or DEFAULT_CATEGORY
+    if category not in CATEGORIES:
+        category = guess_category(note)
+    return Expense(signed(amount, category), category, note)
+
+
+def content_key(tenant_id, data, index=0):
+    """Stable "emailId" of a captured expense: the same photo or voice note is stored once"""
+    digest = hashlib.sha256(f'{tenant_id}:{index}:'.encode() + bytes(data)).hexdigest()
+    return f'capture:{digest}'
+
+
+def insert_captured(cursor, rows):
+    """Insert captured expenses, skipping keys already stored; returns the new keys"""
+    query = """
+    INSERT INTO "Email" ("emailId", "expense", "createdAt", "month", "price", "note",
+                         "isRead", "category", "tenantId")
+    VALUES %s
+    ON CONFLICT ("emailId") DO NOTHING
+    RETURNING "emailId";
+    """
+    inserted = execute_values(cursor, query, rows, page_size=500, fetch=True)
+    return [row[0] for row in inserted]
+
+
+class ExpenseWriter:
+    """Batches captured expenses into multi-row inserts on the "Email" table.
+
+    add() queues a row and waits for it to be written. Rows queued while a
+    write is in progress go out together in the next one, so a burst of
+    captures costs one round trip instead of one per expense. Captured rows
+    are stored already categorized ("isRead" = true), and their "emailId"
+    is a content hash so a re-sent photo or voice note is not counted twice.
+    """
+
+    def __init__(self, db, max_batch=500, linger=0.05):
+        self.db = db
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def pending(self):
+        """Rows waiting to be written"""
+        return len(self._queue)
+
+    async def add(self, key, tenant_id, expense, note, created_at):
+        """Store one expense; returns False if it had already been captured"""
+        row = (key, expense.note, created_at, created_at.month, expense.amount, note,
+               True, expense.category, tenant_id)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((row, future))
+        self._wakeup.set()
+        return await future
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.linger)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything queued so far"""
+        while self._queue:
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            await self._write(batch)
+
+    async def _write(self, batch):
+        # A key repeated within the batch is written once; the repeats are duplicates
+        first = {}
+        for row, future in batch:
+            first.setdefault(row[0], (row, future))
+        try:
+            inserted = set(await self.db.run(insert_captured, [row for row, _ in first.values()]))
+        except Exception as e:
+            logging.error(f"Error writing {len(batch)} captured expenses: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for row, future in batch:
+            if not future.done():
+                future.set_result(row[0] in inserted and first[row[0]][1] is future)
@@ -1,30 +1,57 @@
-import re
+import time
+import asyncio
+import logging
+import threading
 import psycopg2
+import metrics
+import transaction_parser
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+# googleapiclient.discovery, google.oauth2 và google_auth_oauthlib được import
+# khi dùng lần đầu (trên worker thread) để bot khởi động nhanh hơn
 import os
+import json
 import pickle
 import email.utils
 
-def get_credentials():
+def get_credentials(interactive=True, path='token.pickle'):
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
     creds = None
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
+    if os.path.exists(path):
+        with open(path, 'rb') as token:
             creds = pickle.load(token)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
-        else:
+        elif interactive:
             flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.pickle', 'wb') as token:
+        else:
+            return None
+        with open(path, 'wb') as token:
             pickle.dump(creds, token)
     return creds
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# Gmail API gốc, đổi được để chạy với server giả lập (benchmarks/bench_load.py)
+GMAIL_API_ENDPOINT = os.getenv('GMAIL_API_ENDPOINT')
+
+# Chỉ lấy email từ các ngân hàng có bộ luật trong transaction_parser
+BANK_QUERY = ' OR '.join(transaction_parser.bank_addresses())
+FULL_SYNC_DAYS = 5
+
+# Gmail khuyến nghị tối đa 50 request trong một batch
+BATCH_SIZE = 50
+MAX_BATCH_RETRIES = 4
+RETRYABLE_STATUSES = {429, 500, 503}
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+GMAIL_MESSAGES = metrics.counter('gmail_messages_total', 'Email Gmail đi qua từng bước đồng bộ', ['stage'])
+GMAIL_STAGE_SECONDS = metrics.histogram('gmail_stage_seconds', 'Thời gian của từng bước đồng bộ Gmail', ['stage'])
 
 DB_CONFIG = {
     "host": "localhost",
@@ -36,108 +63,420 @@ DB_CONFIG = {
 
 def extract_transaction_info(text):
     """
-    Trích xuất số tiền, loại giao dịch (+/-), và ghi chú từ nội dung email.
-    """
-    # Xác định giao dịch là tăng hay giảm
-    transaction_type = None
-    if "vừa tăng" in text.lower():
-        transaction_type = "+"
-    elif "vừa giảm" in text.lower():
-        transaction_type = "-"
-    
-    # Trích xuất số tiền
-    match = re.search(r'(\d{1,3}(?:[.,]\d{3})*)\s?(VND|USD|đ)', text)
-    price = 0.0
-    if match:
-        price = float(match.group(1).replace(".", "").replace(",", "")) # Chuyển về số
-    
-    # Trích xuất ghi chú
-    note = None
-    match_note = re.search(r'Mô tả:\s*(.+)', text)
-    if match_note:
-        note = match_note.group(1).strip()
-    
-    # Đặt dấu + hoặc - trước số tiền
-    if transaction_type == "-":
-        price = -price
-    
-    return price, note
+    Trích xuất số tiền (có dấu +/-) và ghi chú từ nội dung email Timo.
+    """
+    transaction = transaction_parser.TIMO.parse(text)
+    return transaction.amount, transaction.description
 
-def save_to_db(email_id, subject, snippet, price, note, sent_date):
+@contextmanager
+def connect(db=None):
     """
-    Lưu dữ liệu vào bảng Email trong PostgreSQL.
+    Mở một kết nối (lấy từ pool của bot nếu có) và chạy khối lệnh trong một transaction.
     """
-    print(f"📧 Email: {email_id} | Số tiền: {price} | Ghi chú: {note}")
+    if db is not None:
+        with db.connection() as conn:
+            yield conn
+        return
+    conn = psycopg2.connect(**DB_CONFIG)
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        month = sent_date.month
-        
-        query = """
-        INSERT INTO "Email" ("emailId", "expense", "createdAt", "month", "price", "note") 
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT ("emailId") DO NOTHING;
-        """
-        
-        cursor.execute(query, (email_id, subject, sent_date, month, price, note))
+        yield conn
         conn.commit()
-        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        print(f"✅ Đã lưu email {email_id} vào DB.")
-    except Exception as e:
-        print(f"❌ Lỗi khi lưu vào DB: {e}")
 
-def fetch_unread_emails():
+def save_batch(cursor, rows, tenant_id=None):
     """
-    Lấy email chưa đọc trong 3 ngày gần nhất từ Gmail.
+    Ghi nhiều email bằng một câu INSERT nhiều dòng.
+    rows: danh sách (emailId, expense, createdAt, month, price, note).
+    tenant_id: chủ sở hữu các email (None với cài đặt một người dùng cũ).
+    Trả về danh sách emailId thực sự mới (bỏ qua email đã có).
     """
-    creds = get_credentials()
-    if not creds:
-        print("Không thể lấy credentials. Thoát chương trình.")
+    if not rows:
         return []
+    query = """
+    INSERT INTO "Email" ("emailId", "expense", "createdAt", "month", "price", "note", "tenantId") 
+    VALUES %s
+    ON CONFLICT ("emailId") DO NOTHING
+    RETURNING "emailId";
+    """
+    rows = [row + (tenant_id,) for row in rows]
+    inserted = execute_values(cursor, query, rows, page_size=500, fetch=True)
+    return [row[0] for row in inserted]
 
+def save_to_db(email_id, subject, snippet, price, note, sent_date):
+    """
+    Lưu dữ liệu vào bảng Email trong PostgreSQL.
+    """
+    logging.info(f"📧 Email: {email_id} | Số tiền: {price} | Ghi chú: {note}")
     try:
-        service = build('gmail', 'v1', credentials=creds)
+        with connect() as conn, conn.cursor() as cursor:
+            save_batch(cursor, [(email_id, subject, sent_date, sent_date.month, price, note)])
+        logging.info(f"✅ Đã lưu email {email_id} vào DB.")
+    except Exception as e:
+        logging.error(f"❌ Lỗi khi lưu vào DB: {e}")
+
+def new_batch(service, callback):
+    """
+    Tạo Gmail batch request. URL batch lấy từ discovery document chứ không
+    theo client_options, nên phải đặt riêng khi dùng GMAIL_API_ENDPOINT.
+    """
+    if GMAIL_API_ENDPOINT:
+        from googleapiclient.http import BatchHttpRequest
+        return BatchHttpRequest(callback=callback, batch_uri=GMAIL_API_ENDPOINT.rstrip('/') + '/batch/gmail/v1')
+    return service.new_batch_http_request(callback=callback)
+
+def is_retryable(exception):
+    """
+    Lỗi tạm thời (giới hạn tốc độ, lỗi server) có thể thử lại.
+    """
+    if not isinstance(exception, HttpError):
+        return False
+    if exception.resp.status in RETRYABLE_STATUSES:
+        return True
+    # 403 chỉ thử lại khi là rateLimitExceeded / userRateLimitExceeded
+    return exception.resp.status == 403 and b'ratelimitexceeded' in (exception.content or b'').lower()
+
+def load_sync_cursor(cursor, account, tenant_id=None):
+    """
+    Đọc historyId của lần đồng bộ trước, None nếu chưa từng đồng bộ.
+    Mỗi tenant có cursor riêng, kể cả khi nhiều tenant dùng chung một tài khoản.
+    """
+    cursor.execute("""
+    SELECT "historyId" FROM "GmailSyncState"
+    WHERE "tenantId" = %s AND "account" = %s;
+    """, (tenant_id or '', account))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_sync_cursor(cursor, account, history_id, tenant_id=None):
+    """
+    Lưu historyId mới nhất sau khi đồng bộ thành công.
+    """
+    cursor.execute("""
+    INSERT INTO "GmailSyncState" ("tenantId", "account", "historyId", "updatedAt")
+    VALUES (%s, %s, %s, NOW())
+    ON CONFLICT ("tenantId", "account") DO UPDATE
+    SET "historyId" = EXCLUDED."historyId", "updatedAt" = EXCLUDED."updatedAt";
+    """, (tenant_id or '', account, str(history_id)))
+
+class PickleTokenStore:
+    """
+    Credentials lưu trong token.pickle (cài đặt một người dùng cũ).
+    """
+
+    def __init__(self, path='token.pickle', interactive=False):
+        self.path = path
+        self.interactive = interactive
+
+    def load(self):
+        return get_credentials(interactive=self.interactive, path=self.path)
+
+    def save(self, creds):
+        with open(self.path, 'wb') as token:
+            pickle.dump(creds, token)
+
+class OAuthTokenStore:
+    """
+    Credentials của một tenant lưu trong bảng OAuthToken (dùng token mới nhất).
+    Client id/secret lấy từ credentials.json giống backend NestJS.
+    """
+
+    def __init__(self, db, tenant_id, client_secrets='credentials.json'):
+        self.db = db
+        self.tenant_id = tenant_id
+        self.client_secrets = client_secrets
+        self._token_id = None
+
+    def load(self):
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        with connect(self.db) as conn, conn.cursor() as cursor:
+            cursor.execute("""
+            SELECT "id", "accessToken", "refreshToken", "expiryDate"
+            FROM "OAuthToken"
+            WHERE "tenantId" = %s
+            ORDER BY "createdAt" DESC
+            LIMIT 1;
+            """, (self.tenant_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+
+        self._token_id, access_token, refresh_token, expiry = row
+        with open(self.client_secrets, encoding='utf-8') as f:
+            client = json.load(f)['installed']
+        creds = Credentials(
+            token=access_token,
+            refresh_token=refresh_token,
+            token_uri=TOKEN_URI,
+            client_id=client['client_id'],
+            client_secret=client['client_secret'],
+            scopes=SCOPES,
+            expiry=expiry
+        )
+        if not creds.valid and creds.refresh_token:
+            creds.refresh(Request())
+            self.save(creds)
+        return creds
+
+    def save(self, creds):
+        with connect(self.db) as conn, conn.cursor() as cursor:
+            cursor.execute("""
+            UPDATE "OAuthToken"
+            SET "accessToken" = %s, "expiryDate" = %s, "updatedAt" = NOW()
+            WHERE "id" = %s;
+            """, (creds.token, creds.expiry, self._token_id))
+
+class GmailIngestionService:
+    """
+    Dịch vụ lấy email từ Gmail chạy trong cùng tiến trình với bot.
+    Mỗi tenant có một service riêng với credentials riêng (token_store).
+    Credentials và Gmail client được tạo một lần và dùng lại giữa các lần đồng bộ.
+    """
+
+    def __init__(self, db=None, interactive=False, tenant_id=None, token_store=None):
+        self.db = db
+        self.interactive = interactive
+        self.tenant_id = tenant_id
+        self.token_store = token_store or PickleTokenStore(interactive=interactive)
+        self._creds = None
+        self._service = None
+        self._service_lock = threading.Lock()
+        self._sync_lock = None
+
+    def get_service(self):
+        """
+        Trả về Gmail client, làm mới token khi hết hạn.
+        """
+        from googleapiclient.discovery import build
+        from google.auth.transport.requests import Request
+        with self._service_lock:
+            if self._creds and self._creds.valid and self._service:
+                return self._service
+
+            if self._creds and self._creds.expired and self._creds.refresh_token:
+                self._creds.refresh(Request())
+                self.token_store.save(self._creds)
+            else:
+                self._creds = self.token_store.load()
+                if not self._creds:
+                    raise RuntimeError("Không thể lấy credentials Gmail")
+                self._service = None
+
+            if self._service is None:
+                client_options = {'api_endpoint': GMAIL_API_ENDPOINT} if GMAIL_API_ENDPOINT else None
+                self._service = build(
+                    'gmail', 'v1', credentials=self._creds, cache_discovery=False, client_options=client_options
+                )
+            return self._service
+
+    def list_window_message_ids(self, service):
+        """
+        Liệt kê email của ngân hàng trong FULL_SYNC_DAYS ngày gần nhất (đồng bộ đầy đủ).
+        """
         today = date.today() + timedelta(days=1)
-        three_days_ago = today - timedelta(days=5)
-        query = f"from:support@timo.vn after:{three_days_ago.strftime('%Y/%m/%d')} before:{today.strftime('%Y/%m/%d')}"
-        results = service.users().messages().list(userId='me', q=query).execute()
-        messages = results.get('messages', [])
-
-        if not messages:
-            print("Không có email chưa đọc nào trong khoảng thời gian này.")
-            return []
-
-        for msg in messages:
-            msg_id = msg['id']
-            email_detail = service.users().messages().get(userId='me', id=msg_id).execute()
-            headers = email_detail.get("payload", {}).get("headers", [])
-            
-            # Extract subject and date
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-            date_str = next((h["value"] for h in headers if h["name"] == "Date"), None)
-            
-            # Parse email date
-            sent_date = datetime.now()  # Default to current time if parsing fails
-            if date_str:
+        three_days_ago = today - timedelta(days=FULL_SYNC_DAYS)
+        query = f"from:({BANK_QUERY}) after:{three_days_ago.strftime('%Y/%m/%d')} before:{today.strftime('%Y/%m/%d')}"
+        message_ids = []
+        page_token = None
+        while True:
+            results = service.users().messages().list(userId='me', q=query, pageToken=page_token).execute()
+            message_ids.extend(msg['id'] for msg in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return list(dict.fromkeys(message_ids))
+
+    def list_history_message_ids(self, service, start_history_id):
+        """
+        Liệt kê email mới thêm vào kể từ start_history_id bằng Gmail history API.
+        Trả về (danh sách id, historyId mới nhất).
+        """
+        message_ids = []
+        latest_history_id = start_history_id
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_ids.append(added['message']['id'])
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        # Giữ thứ tự, bỏ id trùng
+        return list(dict.fromkeys(message_ids)), latest_history_id
+
+    def fetch_message_metadata(self, service, message_ids):
+        """
+        Lấy Subject/Date/From và snippet của nhiều email bằng Gmail batch request,
+        mỗi round-trip tối đa BATCH_SIZE email. Email bị giới hạn tốc độ được thử lại.
+        """
+        details = {}
+        pending = list(message_ids)
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            retry = []
+            errors = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    details[request_id] = response
+                elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                    pass  # Email đã bị xóa
+                elif is_retryable(exception):
+                    retry.append(request_id)
+                else:
+                    errors.append(exception)
+
+            for i in range(0, len(pending), BATCH_SIZE):
+                batch = new_batch(service, callback)
+                for msg_id in pending[i:i + BATCH_SIZE]:
+                    batch.add(
+                        service.users().messages().get(
+                            userId='me', id=msg_id, format='metadata', metadataHeaders=METADATA_HEADERS
+                        ),
+                        request_id=msg_id
+                    )
+                batch.execute()
+
+            if errors:
+                raise errors[0]
+            if not retry:
+                break
+            pending = retry
+            time.sleep(2 ** attempt)
+        else:
+            raise RuntimeError(f"Không lấy được {len(pending)} email sau {MAX_BATCH_RETRIES} lần thử lại")
+
+        return [details[msg_id] for msg_id in message_ids if msg_id in details]
+
+    def read_message(self, email_detail):
+        """
+        Đọc metadata của một email.
+        Trả về (emailId, người gửi, tiêu đề, snippet, ngày gửi), hoặc None nếu email không phải của ngân hàng.
+        """
+        msg_id = email_detail["id"]
+        headers = email_detail.get("payload", {}).get("headers", [])
+
+        # History API trả về mọi email mới, chỉ giữ email từ ngân hàng
+        sender = next((h["value"] for h in headers if h["name"] == "From"), "")
+        if transaction_parser.find_rules(sender) is None:
+            return None
+        
+        # Extract subject and date
+        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
+        date_str = next((h["value"] for h in headers if h["name"] == "Date"), None)
+        
+        # Parse email date
+        sent_date = datetime.now()  # Default to current time if parsing fails
+        if date_str:
+            try:
+                # Parse the email date string
+                parsed_date = email.utils.parsedate_to_datetime(date_str)
+                sent_date = parsed_date
+            except Exception as e:
+                logging.warning(f"❌ Lỗi khi parse ngày tháng: {e}")
+        
+        snippet = email_detail.get("snippet", "")
+        return msg_id, sender, subject, snippet, sent_date
+
+    def parse_messages(self, email_details):
+        """
+        Trích xuất giao dịch từ nhiều email.
+        Trả về các dòng cho save_batch.
+        """
+        rows = []
+        for email_detail in email_details:
+            message = self.read_message(email_detail)
+            if message is None:
+                continue
+            msg_id, sender, subject, snippet, sent_date = message
+            transaction = transaction_parser.parse(sender, subject + " " + snippet)
+            note = transaction.description or transaction.counterparty
+            logging.info(f"📧 Email: {msg_id} | Số tiền: {transaction.amount} | Ghi chú: {note}")
+            rows.append((msg_id, subject, sent_date, sent_date.month, transaction.amount, note))
+        return rows
+
+    def fetch_unread_emails(self):
+        """
+        Đồng bộ email mới từ Gmail (chạy đồng bộ).
+        Dùng historyId đã lưu để chỉ lấy email mới; nếu chưa có hoặc đã hết hạn
+        thì đồng bộ lại toàn bộ email trong FULL_SYNC_DAYS ngày gần nhất.
+        Toàn bộ email của một lần đồng bộ được ghi trong một transaction.
+        Trả về danh sách emailId mới được lưu.
+        """
+        service = self.get_service()
+        # Lấy historyId trước khi liệt kê để không bỏ sót email đến giữa chừng
+        profile = service.users().getProfile(userId='me').execute()
+        account = profile['emailAddress']
+
+        with connect(self.db) as conn, conn.cursor() as cursor:
+            history_id = load_sync_cursor(cursor, account, self.tenant_id)
+
+        message_ids = None
+        latest_history_id = profile['historyId']
+        with GMAIL_STAGE_SECONDS.labels(stage='list').time():
+            if history_id:
                 try:
-                    # Parse the email date string
-                    parsed_date = email.utils.parsedate_to_datetime(date_str)
-                    sent_date = parsed_date
-                except Exception as e:
-                    print(f"❌ Lỗi khi parse ngày tháng: {e}")
-            
-            snippet = email_detail.get("snippet", "")
-            content = subject + " " + snippet
+                    message_ids, latest_history_id = self.list_history_message_ids(service, history_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    logging.warning(f"⚠️ historyId {history_id} đã hết hạn, đồng bộ lại toàn bộ.")
 
-            # Trích xuất số tiền, loại giao dịch và ghi chú
-            price, note = extract_transaction_info(content)
+            if message_ids is None:
+                latest_history_id = profile['historyId']
+                message_ids = self.list_window_message_ids(service)
+        GMAIL_MESSAGES.labels(stage='listed').inc(len(message_ids))
 
-            # Lưu vào DB với ngày gửi email
-            save_to_db(msg_id, subject, snippet, price, note, sent_date)
+        with GMAIL_STAGE_SECONDS.labels(stage='fetch').time():
+            details = self.fetch_message_metadata(service, message_ids)
+        GMAIL_MESSAGES.labels(stage='fetched').inc(len(details))
 
+        with GMAIL_STAGE_SECONDS.labels(stage='parse').time():
+            rows = self.parse_messages(details)
+        GMAIL_MESSAGES.labels(stage='parsed').inc(len(rows))
+
+        with GMAIL_STAGE_SECONDS.labels(stage='insert').time():
+            with connect(self.db) as conn, conn.cursor() as cursor:
+                new_ids = save_batch(cursor, rows, self.tenant_id)
+                save_sync_cursor(cursor, account, latest_history_id, self.tenant_id)
+        GMAIL_MESSAGES.labels(stage='inserted').inc(len(new_ids))
+
+        if new_ids:
+            logging.info(f"✅ Đã lưu {len(new_ids)} email mới vào DB.")
+        else:
+            logging.info("Không có email mới nào.")
+        return new_ids
+
+    async def sync(self):
+        """
+        Đồng bộ email trong thread riêng để không chặn event loop.
+        Chỉ một lần đồng bộ chạy tại một thời điểm; các lời gọi đồng thời sẽ chờ.
+        """
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        async with self._sync_lock:
+            return await asyncio.to_thread(self.fetch_unread_emails)
+
+
+def fetch_unread_emails():
+    """
+    Lấy email chưa đọc trong 5 ngày gần nhất từ Gmail.
+    """
+    try:
+        GmailIngestionService(interactive=True).fetch_unread_emails()
     except Exception as e:
-        print(f"❌ Lỗi khi lấy email: {e}")
+        logging.error(f"❌ Lỗi khi lấy email: {e}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     fetch_unread_emails()
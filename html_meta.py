@@ -0,0 +1,111 @@
+import codecs
+from html.parser import HTMLParser
+
+# Metadata lives in <head>; never read more than this much of a page
+DEFAULT_MAX_BYTES = 256 * 1024
+CHUNK_SIZE = 8192
+
+
+class MetadataParser(HTMLParser):
+    """Incremental parser that collects <title>, meta description and OpenGraph tags.
+
+    Feed it text as it arrives; `done` turns true once the head is over
+    (</head> or <body>), after which the rest of the page can be skipped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.description = None
+        self.og = {}
+        self.done = False
+        self._title_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'title' and self.title is None:
+            self._title_parts = []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            content = attrs.get('content')
+            if content is None:
+                return
+            name = (attrs.get('name') or '').lower()
+            prop = (attrs.get('property') or '').lower()
+            if name == 'description' and self.description is None:
+                self.description = content
+            elif prop.startswith('og:'):
+                self.og.setdefault(prop[3:], content)
+        elif tag == 'body':
+            self._finish()
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts)
+            self._title_parts = None
+        elif tag == 'head':
+            self._finish()
+
+    def handle_data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+
+    def _finish(self):
+        if self._title_parts is not None:
+            self.title = ''.join(self._title_parts)
+            self._title_parts = None
+        self.done = True
+
+    def metadata(self):
+        """Return the collected tags, with OpenGraph values as fallbacks"""
+        title = self.title
+        if title is None and self._title_parts:
+            title = ''.join(self._title_parts)
+        return {
+            'title': _clean(title) or _clean(self.og.get('title')),
+            'description': _clean(self.description) or _clean(self.og.get('description')),
+            'og': {key: _clean(value) for key, value in self.og.items()},
+        }
+
+
+def _decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def _clean(value):
+    return ' '.join(value.split()) if value else None
+
+
+def extract_metadata(chunks, encoding='utf-8', max_bytes=DEFAULT_MAX_BYTES):
+    """Parse metadata from an iterable of byte chunks, stopping at the end of <head>"""
+    decoder = _decoder(encoding)
+    parser = MetadataParser()
+    read = 0
+    for chunk in chunks:
+        chunk = chunk[:max_bytes - read]
+        read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done or read >= max_bytes:
+            break
+    parser.close()
+    return parser.metadata()
+
+
+async def extract_metadata_async(stream, encoding='utf-8', max_bytes=DEFAULT_MAX_BYTES,
+                                 chunk_size=CHUNK_SIZE):
+    """Like extract_metadata, reading from an aiohttp StreamReader"""
+    decoder = _decoder(encoding)
+    parser = MetadataParser()
+    read = 0
+    async for chunk in stream.iter_chunked(chunk_size):
+        chunk = chunk[:max_bytes - read]
+        read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done or read >= max_bytes:
+            break
+    parser.close()
+    return parser.metadata()
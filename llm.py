@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+import metrics
+from cache import TTLCache
+
+REQUEST_SECONDS = metrics.histogram('llm_request_seconds', 'Time of Gemini requests, excluding cache hits')
+CACHE_LOOKUPS = metrics.counter('llm_cache_lookups_total', 'Prompt cache lookups', ['result'])
+
+
+class LLMService:
+    """Shared Gemini client for every handler.
+
+    The model is configured once. Calls are async, limited to `concurrency`
+    at a time and bounded by `timeout` seconds. Responses are cached by
+    prompt (LRU with TTL), and concurrent calls with the same prompt share
+    one request.
+
+    google.generativeai takes most of a second to import, so the client is
+    created on the first call (or by a background pre-warm) rather than when
+    the bot starts.
+    """
+
+    def __init__(self, api_key, model_name='gemini-2.0-flash', concurrency=4, timeout=30,
+                 cache_size=256, cache_ttl=3600):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt, cache=True):
+        """Return the model's text for a prompt ('' if it produced none)"""
+        if cache:
+            text = self._cache.get(prompt)
+            if text is not None:
+                self.hits += 1
+                CACHE_LOOKUPS.labels(result='hit').inc()
+                return text
+            pending = self._inflight.get(prompt)
+            if pending is not None:
+                return await asyncio.shield(pending)
+        self.misses += 1
+        CACHE_LOOKUPS.labels(result='miss').inc()
+
+        task = asyncio.ensure_future(self._generate(prompt))
+        if cache:
+            self._inflight[prompt] = task
+        try:
+            text = await asyncio.shield(task)
+        finally:
+            if self._inflight.get(prompt) is task:
+                del self._inflight[prompt]
+        if cache and text:
+            self._cache.put(prompt, text)
+        return text
+
+    async def _generate(self, prompt):
+        if self._model is None:
+            # Import off the event loop if the pre-warm has not done it yet
+            await asyncio.to_thread(lambda: self.model)
+        async with self._slots:
+            with REQUEST_SECONDS.time():
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(prompt), timeout=self.timeout
+                )
+        try:
+            return response.text
+        except ValueError as e:
+            # Blocked or empty candidates have no text
+            logging.warning(f"Gemini returned no text: {e}")
+            return ''
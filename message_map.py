@@ -0,0 +1,53 @@
+import logging
+
+from cache import LRUCache
+
+
+class MessageMap:
+    """Maps a sent Telegram message to the transactions it shows.
+
+    Recent entries live in an LRU cache; every entry is also written through
+    to the "TelegramMessage" table so replies keep working after a restart.
+    """
+
+    def __init__(self, db, maxsize=1024, retention_days=30):
+        self.db = db
+        self.retention_days = retention_days
+        self._cache = LRUCache(maxsize)
+
+    async def remember(self, chat_id, message_id, email_ids):
+        """Record that message_id in chat_id lists email_ids (in display order)"""
+        email_ids = list(email_ids)
+        self._cache.put((chat_id, message_id), email_ids)
+        query = """
+        INSERT INTO "TelegramMessage" ("chatId", "messageId", "emailIds")
+        VALUES (%s, %s, %s)
+        ON CONFLICT ("chatId", "messageId") DO UPDATE SET "emailIds" = EXCLUDED."emailIds";
+        """
+        try:
+            await self.db.execute(query, (chat_id, message_id, email_ids))
+        except Exception as e:
+            logging.error(f"Error saving message map for {message_id}: {e}")
+
+    async def lookup(self, chat_id, message_id):
+        """Return the email ids shown by a message, or None if it is not a transaction message"""
+        email_ids = self._cache.get((chat_id, message_id))
+        if email_ids is not None:
+            return email_ids
+        query = """
+        SELECT "emailIds" FROM "TelegramMessage"
+        WHERE "chatId" = %s AND "messageId" = %s;
+        """
+        row = await self.db.fetchone(query, (chat_id, message_id))
+        if not row:
+            return None
+        self._cache.put((chat_id, message_id), row[0])
+        return row[0]
+
+    async def prune(self):
+        """Forget messages older than the retention period"""
+        query = """
+        DELETE FROM "TelegramMessage"
+        WHERE "createdAt" < NOW() - make_interval(days => %s);
+        """
+        return await self.db.execute(query, (self.retention_days,))
@@ -0,0 +1,170 @@
+import sys
+import time
+import asyncio
+import logging
+import secrets
+import functools
+import threading
+import traceback
+import contextvars
+
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Seconds; wide enough for a 1 ms query and a 60 s Gmail sync
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Trace ID of the update or background job being processed. Copied into
+# worker threads by asyncio.to_thread and Database.run, and added to every
+# log line by TraceIdFilter.
+trace_id = contextvars.ContextVar('trace_id', default=None)
+
+
+def new_trace_id():
+    return secrets.token_hex(6)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace ID to log records as %(trace_id)s"""
+
+    def filter(self, record):
+        record.trace_id = trace_id.get() or '-'
+        return True
+
+
+# Registered in prometheus_client's default registry, which also exports the
+# process_* and python_* metrics of the bot process
+def counter(name, documentation, labelnames=()):
+    return Counter(name, documentation, labelnames, registry=REGISTRY)
+
+
+def gauge(name, documentation, labelnames=()):
+    return Gauge(name, documentation, labelnames, registry=REGISTRY)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return Histogram(name, documentation, labelnames, registry=REGISTRY, buckets=buckets)
+
+
+HANDLER_SECONDS = histogram('bot_handler_seconds', 'Time spent handling an update', ['handler'])
+HANDLER_ERRORS = counter('bot_handler_errors_total', 'Updates whose handler raised', ['handler'])
+LOOP_LAG = gauge('bot_event_loop_lag_seconds', 'Delay of the last event loop probe')
+LOOP_LAG_SECONDS = histogram('bot_event_loop_lag_probe_seconds', 'Delay of event loop probes')
+
+# Task -> trace ID of the handler it is running, read by LoopMonitor from its
+# own thread (a task's context is not visible from outside it)
+_task_traces = {}
+
+
+def traced(name, callback):
+    """Wrap a handler callback to time it and give each update a trace ID"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        trace = new_trace_id()
+        token = trace_id.set(trace)
+        task = asyncio.current_task()
+        previous = _task_traces.get(task)
+        _task_traces[task] = (trace, name)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.labels(handler=name).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(handler=name).observe(time.perf_counter() - start)
+            if previous is None:
+                _task_traces.pop(task, None)
+            else:
+                _task_traces[task] = previous
+            trace_id.reset(token)
+    return wrapper
+
+
+class LoopMonitor:
+    """Measures event loop lag from a watchdog thread.
+
+    Every `interval` seconds a no-op callback is scheduled on the loop; the
+    time until it runs is the lag. If it has not run after `threshold`
+    seconds the loop is blocked, and the watchdog logs what the loop thread
+    is executing at that moment (task, trace ID and innermost frames), so
+    the stage responsible can be found from the logs.
+    """
+
+    def __init__(self, interval=0.5, threshold=0.25, frames=8):
+        self.interval = interval
+        self.threshold = threshold
+        self.frames = frames
+        self._loop = None
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + self.threshold + 1)
+            self._thread = None
+
+    def _describe_blocker(self):
+        task = asyncio.current_task(self._loop)
+        trace, handler = _task_traces.get(task, (None, None))
+        where = task.get_name() if task is not None else 'callback'
+        if handler:
+            where += f" ({handler}, trace {trace})"
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = ''.join(traceback.format_stack(frame)[-self.frames:]) if frame is not None else ''
+        return where, stack
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            ran = threading.Event()
+            start = time.perf_counter()
+            try:
+                self._loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                return  # loop closed
+            if not ran.wait(self.threshold):
+                where, stack = self._describe_blocker()
+                logging.warning(f"Event loop blocked for over {self.threshold * 1000:.0f} ms in {where}:\n{stack}")
+                while not ran.wait(1):
+                    if self._stopped.is_set() or self._loop.is_closed():
+                        return
+            lag = time.perf_counter() - start
+            LOOP_LAG.set(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+
+class MetricsServer:
+    """Serves GET /metrics from a registry on a local port"""
+
+    def __init__(self, registry=REGISTRY, listen='127.0.0.1', port=9100):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(body=generate_latest(self.registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+    async def start(self):
+        # aiohttp is imported here so modules that only record metrics do not load it
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logging.info(f"Metrics served on http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,143 @@
+import io
+import os
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from cache import LRUCache
+
+OCR_SECONDS = metrics.histogram('ocr_seconds', 'Time to OCR an image on the process pool, including queueing')
+
+# Longest side after downscaling: about 300 DPI for a receipt or phone screen,
+# which is what tesseract is tuned for
+TARGET_MAX_SIDE = 2000
+MAX_SKEW_DEGREES = 5
+SKEW_STEP_DEGREES = 0.5
+
+
+def otsu_threshold(image):
+    """Pick the gray level that best separates ink from paper (Otsu's method)"""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def _row_profile_score(binary, angle):
+    from PIL import Image
+    # Text lines are sharpest (highest row-to-row variance of ink) when level;
+    # resizing to one column averages each row in C
+    rotated = binary.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+    mean = sum(rows) / len(rows)
+    return sum((value - mean) ** 2 for value in rows)
+
+
+def estimate_skew(binary):
+    """Return the rotation in degrees that levels the text lines"""
+    small = binary.copy()
+    small.thumbnail((600, 600))
+    steps = int(MAX_SKEW_DEGREES / SKEW_STEP_DEGREES)
+    angles = [i * SKEW_STEP_DEGREES for i in range(-steps, steps + 1)]
+    return max(angles, key=lambda angle: (_row_profile_score(small, angle), -abs(angle)))
+
+
+def preprocess(image, max_side=TARGET_MAX_SIDE):
+    """Downscale, grayscale, binarize and deskew a photo for OCR"""
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    gray = ImageOps.autocontrast(ImageOps.grayscale(image), cutoff=1)
+    threshold = otsu_threshold(gray)
+    binary = gray.point(lambda value: 255 if value > threshold else 0)
+    angle = estimate_skew(binary)
+    if angle:
+        binary = binary.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return binary
+
+
+def ocr_bytes(data, lang='vie', preprocessing=True):
+    """OCR an encoded image; runs in a worker process"""
+    # PIL and pytesseract are only needed in the workers, not at bot startup
+    import pytesseract
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    if preprocessing:
+        image = preprocess(image)
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+class OCRService:
+    """Runs tesseract on a process pool sized to the host's cores.
+
+    Images are pre-processed in the worker before OCR, and results are
+    cached by a hash of the image bytes so a re-sent photo is answered
+    without running tesseract again.
+    """
+
+    def __init__(self, workers=None, lang='vie', cache_size=256):
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self._executor = None
+        self._cache = LRUCache(cache_size)
+        self._inflight = {}
+
+    def _pool(self):
+        if self._executor is None:
+            # The bot already runs threads (database, voice, loop monitor) when the
+            # first photo arrives; forking it could copy locks they hold and its
+            # open sockets, so workers are forked from a clean forkserver instead
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver')
+            )
+        return self._executor
+
+    async def recognize(self, data):
+        """Return the text of an encoded image"""
+        data = bytes(data)
+        key = hashlib.sha256(data).hexdigest()
+        text = self._cache.get(key)
+        if text is not None:
+            return text
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), ocr_bytes, data, self.lang)
+        self._inflight[key] = future
+        try:
+            with OCR_SECONDS.time():
+                text = await asyncio.shield(future)
+        finally:
+            del self._inflight[key]
+        self._cache.put(key, text)
+        return text
+
+    @property
+    def pending(self):
+        """Images being recognized or waiting for a worker"""
+        return len(self._inflight)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
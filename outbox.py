@@ -0,0 +1,284 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from cache import LRUCache
+
+# Telegram rejects messages longer than 4096 UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+
+
+def text_length(text):
+    """Length of a message as Telegram counts it (emoji count twice)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _hard_split(block, limit):
+    # A single block over the limit is cut at the last line break that fits,
+    # or mid-line without splitting a surrogate pair. Working on the UTF-16
+    # encoding measures the whole block once instead of line by line.
+    data = block.encode('utf-16-le')
+    max_bytes = limit * 2
+    pieces = []
+    start = 0
+    while len(data) - start > max_bytes:
+        end = start + max_bytes
+        cut = data.rfind(b'\n\x00', start, end + 2)
+        while cut > start and cut % 2:
+            cut = data.rfind(b'\n\x00', start, cut + 1)
+        if cut > start:
+            pieces.append(data[start:cut])
+            start = cut + 2
+            continue
+        if 0xD8 <= data[end - 1] <= 0xDB:
+            end -= 2  # keep a high surrogate with its pair
+        pieces.append(data[start:end])
+        start = end
+    pieces.append(data[start:])
+    texts = (piece.decode('utf-16-le') for piece in pieces)
+    return [text for text in texts if text.strip()]
+
+
+def split_blocks(blocks, limit=MAX_MESSAGE_LENGTH, separator='\n\n'):
+    """Pack text blocks into as few messages as possible, keeping their order.
+
+    Blocks are measured once and each message is joined once, so packing a
+    report is linear in its size. Returns a list of (text, indices) where
+    indices are the positions of the blocks that went into that message; a
+    block longer than the limit is cut at line breaks over several messages.
+    """
+    separator_length = text_length(separator)
+    chunks = []
+    current = []
+    indices = []
+    size = 0
+
+    def close():
+        nonlocal current, indices, size
+        if current:
+            chunks.append((separator.join(current), indices))
+        current, indices, size = [], [], 0
+
+    for index, block in enumerate(blocks):
+        if not block:
+            continue
+        length = text_length(block)
+        if length > limit:
+            close()
+            for piece in _hard_split(block, limit):
+                chunks.append((piece, [index]))
+            continue
+        extra = length + (separator_length if current else 0)
+        if size + extra > limit:
+            close()
+            extra = length
+        current.append(block)
+        indices.append(index)
+        size += extra
+    close()
+    return chunks
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Split a long text into messages at paragraph breaks"""
+    return [chunk for chunk, _ in split_blocks(text.split('\n\n'), limit)]
+
+
+class TokenBucket:
+    """Allows `rate` operations per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def wait(self):
+        """Wait until a token is available without taking it"""
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def acquire(self):
+        await self.wait()
+        self._tokens -= 1
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds`"""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class _Outgoing:
+    __slots__ = ('texts', 'items', 'keys', 'render', 'kwargs', 'future', 'created')
+
+    def __init__(self, future, kwargs, texts=None, items=None, keys=None, render=None):
+        self.texts = texts
+        self.items = items
+        self.keys = keys
+        self.render = render
+        self.kwargs = kwargs
+        self.future = future
+        self.created = time.monotonic()
+
+
+class Outbox:
+    """Rate-limited outbound Telegram messages.
+
+    Every chat has a FIFO queue drained by its own worker, so messages to a
+    chat keep their order. Each message waits for a token from the chat's
+    bucket (`per_chat_rate` per second, bursts of `per_chat_burst`) and from
+    the global bucket (`global_rate` per second). On a RetryAfter the chat
+    is paused for the time Telegram asks and the message is retried; network
+    errors are retried with backoff.
+
+    Notifications queued with notify() that are still waiting for their
+    chat's turn are coalesced into one digest message of up to `max_digest`
+    items. Long texts are split into ordered messages under Telegram's limit.
+    """
+
+    def __init__(self, bot, global_rate=25, per_chat_rate=1, per_chat_burst=3, max_retries=5,
+                 coalesce_window=1.0, max_digest=10, max_chats=4096):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.coalesce_window = coalesce_window
+        self.max_digest = max_digest
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets = LRUCache(max_chats)
+        self._queues = {}
+        self._workers = {}
+        self._closing = False
+        self.stats = {'sent': 0, 'retried': 0, 'coalesced': 0, 'failed': 0}
+
+    @property
+    def pending(self):
+        """Messages and digests waiting to be sent, across all chats"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._buckets.put(chat_id, bucket)
+        return bucket
+
+    def _enqueue(self, chat_id, entry):
+        self._queues.setdefault(chat_id, deque()).append(entry)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+
+    async def send(self, chat_id, text, **kwargs):
+        """Send a text, split if needed; returns the sent messages in order"""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, _Outgoing(future, kwargs, texts=split_message(text)))
+        return await future
+
+    async def send_blocks(self, chat_id, blocks, keys=None, **kwargs):
+        """Send text blocks packed into as few messages as possible.
+
+        keys, if given, has one entry per block (None for headers and
+        footers). Returns (message, keys of the blocks it shows) per message.
+        """
+        chunks = split_blocks(blocks)
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, _Outgoing(future, kwargs, texts=[text for text, _ in chunks]))
+        messages = await future
+        if keys is None:
+            return [(message, []) for message in messages]
+        return [
+            (message, [keys[i] for i in indices if keys[i] is not None])
+            for message, (_, indices) in zip(messages, chunks)
+        ]
+
+    async def notify(self, chat_id, key, item, render, **kwargs):
+        """Queue a notification that may be merged with others to the same chat.
+
+        render(items) builds the text for a list of items. Returns (messages,
+        keys): the messages the notification went out in and the keys of
+        every notification merged into them.
+        """
+        queue = self._queues.get(chat_id)
+        tail = queue[-1] if queue else None
+        if (tail is not None and tail.render == render and tail.kwargs == kwargs
+                and len(tail.items) < self.max_digest):
+            tail.items.append(item)
+            tail.keys.append(key)
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(tail.future)
+        future = asyncio.get_running_loop().create_future()
+        entry = _Outgoing(future, kwargs, items=[item], keys=[key], render=render)
+        self._enqueue(chat_id, entry)
+        return await asyncio.shield(future)
+
+    async def _drain(self, chat_id):
+        queue = self._queues[chat_id]
+        bucket = self._bucket(chat_id)
+        try:
+            while queue:
+                entry = queue[0]
+                if entry.render is not None:
+                    # Notifications keep joining this one until the chat may send again
+                    wait = entry.created + self.coalesce_window - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    await bucket.wait()
+                    queue.popleft()
+                    texts = split_message(entry.render(entry.items))
+                else:
+                    queue.popleft()
+                    texts = entry.texts
+                try:
+                    messages = [await self._deliver(chat_id, text, bucket, entry.kwargs) for text in texts]
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+                    continue
+                if not entry.future.done():
+                    entry.future.set_result(messages if entry.render is None else (messages, entry.keys))
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _deliver(self, chat_id, text, bucket, kwargs):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                message = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.stats['retried'] += 1
+                logging.warning(f"Flood control for chat {chat_id}, retrying in {e.retry_after}s")
+                bucket.pause(e.retry_after)
+            except BadRequest:
+                raise
+            except NetworkError as e:
+                # Once closing, the bot may be going away: fail instead of backing off
+                if attempt == self.max_retries or self._closing:
+                    raise
+                self.stats['retried'] += 1
+                logging.warning(f"Error sending to chat {chat_id}, retrying: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            else:
+                self.stats['sent'] += 1
+                return message
+
+    async def close(self):
+        """Wait for queued messages to go out, without retrying network errors"""
+        self._closing = True
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
@@ -0,0 +1,35 @@
+import time
+import logging
+import importlib
+
+# Modules of the AI, search, voice, OCR and Gmail features. They are imported
+# where they are first used so the bot starts without them; prewarm() loads
+# them on a worker thread once the bot is running, so the first user of a
+# feature does not wait for its import either.
+HEAVY_MODULES = [
+    'google.generativeai',
+    'googleapiclient.discovery',
+    'google_auth_oauthlib.flow',
+    'google.oauth2.credentials',
+    'google.auth.transport.requests',
+    'googlesearch',
+    'speech_recognition',
+    'pydub',
+    'pydub.silence',
+    'pytesseract',
+]
+
+
+def prewarm(modules=HEAVY_MODULES):
+    """Import modules ahead of their first use; returns seconds taken per module"""
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.warning(f"Could not pre-import {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - start
+    logging.info(f"Pre-imported {len(timings)} modules in {sum(timings.values()):.2f}s")
+    return timings
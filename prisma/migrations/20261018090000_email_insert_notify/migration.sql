@@ -0,0 +1,12 @@
+-- CreateFunction
+CREATE OR REPLACE FUNCTION "notify_email_inserted"() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('email_inserted', NEW."emailId");
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CreateTrigger
+CREATE TRIGGER "Email_notify_insert"
+AFTER INSERT ON "Email"
+FOR EACH ROW EXECUTE FUNCTION "notify_email_inserted"();
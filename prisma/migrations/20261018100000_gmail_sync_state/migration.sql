@@ -0,0 +1,8 @@
+-- CreateTable
+CREATE TABLE "GmailSyncState" (
+    "account" TEXT NOT NULL,
+    "historyId" TEXT NOT NULL,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "GmailSyncState_pkey" PRIMARY KEY ("account")
+);
@@ -0,0 +1,67 @@
+-- CreateTable
+CREATE TABLE "SpendingRollup" (
+    "year" INTEGER NOT NULL,
+    "month" INTEGER NOT NULL,
+    "category" TEXT NOT NULL,
+    "total" DOUBLE PRECISION NOT NULL DEFAULT 0,
+    "expenseTotal" DOUBLE PRECISION NOT NULL DEFAULT 0,
+    "count" INTEGER NOT NULL DEFAULT 0,
+
+    CONSTRAINT "SpendingRollup_pkey" PRIMARY KEY ("year","month","category")
+);
+
+-- CreateFunction
+-- Keeps "SpendingRollup" in sync with categorized ("isRead" = true) rows of "Email"
+CREATE OR REPLACE FUNCTION "email_spending_rollup"() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD."isRead" THEN
+            UPDATE "SpendingRollup"
+            SET "total" = "total" - OLD."price",
+                "expenseTotal" = "expenseTotal" - LEAST(OLD."price", 0),
+                "count" = "count" - 1
+            WHERE "year" = EXTRACT(YEAR FROM OLD."createdAt")::INTEGER
+              AND "month" = EXTRACT(MONTH FROM OLD."createdAt")::INTEGER
+              AND "category" = OLD."category";
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW."isRead" THEN
+            INSERT INTO "SpendingRollup" ("year", "month", "category", "total", "expenseTotal", "count")
+            VALUES (
+                EXTRACT(YEAR FROM NEW."createdAt")::INTEGER,
+                EXTRACT(MONTH FROM NEW."createdAt")::INTEGER,
+                NEW."category",
+                NEW."price",
+                LEAST(NEW."price", 0),
+                1
+            )
+            ON CONFLICT ("year", "month", "category") DO UPDATE
+            SET "total" = "SpendingRollup"."total" + EXCLUDED."total",
+                "expenseTotal" = "SpendingRollup"."expenseTotal" + EXCLUDED."expenseTotal",
+                "count" = "SpendingRollup"."count" + 1;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CreateTrigger
+CREATE TRIGGER "Email_spending_rollup"
+AFTER INSERT OR DELETE OR UPDATE OF "isRead", "price", "category", "createdAt" ON "Email"
+FOR EACH ROW EXECUTE FUNCTION "email_spending_rollup"();
+
+-- Backfill
+INSERT INTO "SpendingRollup" ("year", "month", "category", "total", "expenseTotal", "count")
+SELECT
+    EXTRACT(YEAR FROM "createdAt")::INTEGER,
+    EXTRACT(MONTH FROM "createdAt")::INTEGER,
+    "category",
+    SUM("price"),
+    SUM(LEAST("price", 0)),
+    COUNT(*)
+FROM "Email"
+WHERE "isRead" = true
+GROUP BY 1, 2, 3;
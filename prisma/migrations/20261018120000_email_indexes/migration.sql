@@ -0,0 +1,7 @@
+-- CreateIndex
+-- Unread transactions, newest first (notifications, /check_bot, /reset_bot)
+CREATE INDEX "Email_unread_createdAt_idx" ON "Email"("createdAt" DESC) WHERE "isRead" = false;
+
+-- CreateIndex
+-- Categorized transactions by date range (monthly reports)
+CREATE INDEX "Email_read_createdAt_idx" ON "Email"("createdAt") WHERE "isRead" = true;
@@ -0,0 +1,12 @@
+-- CreateTable
+CREATE TABLE "TelegramMessage" (
+    "chatId" BIGINT NOT NULL,
+    "messageId" BIGINT NOT NULL,
+    "emailIds" TEXT[],
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "TelegramMessage_pkey" PRIMARY KEY ("chatId","messageId")
+);
+
+-- CreateIndex
+CREATE INDEX "TelegramMessage_createdAt_idx" ON "TelegramMessage"("createdAt");
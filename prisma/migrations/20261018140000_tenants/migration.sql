@@ -0,0 +1,90 @@
+-- CreateTable
+CREATE TABLE "Tenant" (
+    "id" TEXT NOT NULL,
+    "chatId" BIGINT NOT NULL,
+    "name" TEXT NOT NULL,
+    "active" BOOLEAN NOT NULL DEFAULT true,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "Tenant_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Tenant_chatId_key" ON "Tenant"("chatId");
+
+-- AlterTable
+ALTER TABLE "OAuthToken" ADD COLUMN "tenantId" TEXT;
+
+-- CreateIndex
+CREATE INDEX "OAuthToken_tenantId_createdAt_idx" ON "OAuthToken"("tenantId", "createdAt");
+
+-- AddForeignKey
+ALTER TABLE "OAuthToken" ADD CONSTRAINT "OAuthToken_tenantId_fkey" FOREIGN KEY ("tenantId") REFERENCES "Tenant"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AlterTable
+-- Rows stored before tenants existed keep NULL until the bot assigns them
+-- to the default tenant (TELEGRAM_CHAT_ID) at startup
+ALTER TABLE "Email" ADD COLUMN "tenantId" TEXT;
+
+-- AddForeignKey
+ALTER TABLE "Email" ADD CONSTRAINT "Email_tenantId_fkey" FOREIGN KEY ("tenantId") REFERENCES "Tenant"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- RecreateIndex
+-- Hot paths now filter by tenant first
+DROP INDEX "Email_unread_createdAt_idx";
+CREATE INDEX "Email_unread_createdAt_idx" ON "Email"("tenantId", "createdAt" DESC) WHERE "isRead" = false;
+
+DROP INDEX "Email_read_createdAt_idx";
+CREATE INDEX "Email_read_createdAt_idx" ON "Email"("tenantId", "createdAt") WHERE "isRead" = true;
+
+-- AlterTable
+-- '' collects rows without a tenant so the key stays NOT NULL
+ALTER TABLE "SpendingRollup" ADD COLUMN "tenantId" TEXT NOT NULL DEFAULT '';
+ALTER TABLE "SpendingRollup" DROP CONSTRAINT "SpendingRollup_pkey";
+ALTER TABLE "SpendingRollup" ADD CONSTRAINT "SpendingRollup_pkey" PRIMARY KEY ("tenantId", "year", "month", "category");
+
+-- CreateFunction
+CREATE OR REPLACE FUNCTION "email_spending_rollup"() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD."isRead" THEN
+            UPDATE "SpendingRollup"
+            SET "total" = "total" - OLD."price",
+                "expenseTotal" = "expenseTotal" - LEAST(OLD."price", 0),
+                "count" = "count" - 1
+            WHERE "tenantId" = COALESCE(OLD."tenantId", '')
+              AND "year" = EXTRACT(YEAR FROM OLD."createdAt")::INTEGER
+              AND "month" = EXTRACT(MONTH FROM OLD."createdAt")::INTEGER
+              AND "category" = OLD."category";
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW."isRead" THEN
+            INSERT INTO "SpendingRollup" ("tenantId", "year", "month", "category", "total", "expenseTotal", "count")
+            VALUES (
+                COALESCE(NEW."tenantId", ''),
+                EXTRACT(YEAR FROM NEW."createdAt")::INTEGER,
+                EXTRACT(MONTH FROM NEW."createdAt")::INTEGER,
+                NEW."category",
+                NEW."price",
+                LEAST(NEW."price", 0),
+                1
+            )
+            ON CONFLICT ("tenantId", "year", "month", "category") DO UPDATE
+            SET "total" = "SpendingRollup"."total" + EXCLUDED."total",
+                "expenseTotal" = "SpendingRollup"."expenseTotal" + EXCLUDED."expenseTotal",
+                "count" = "SpendingRollup"."count" + 1;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- RecreateTrigger
+-- Also fires when rows are assigned to a tenant, moving them between rollups
+DROP TRIGGER "Email_spending_rollup" ON "Email";
+CREATE TRIGGER "Email_spending_rollup"
+AFTER INSERT OR DELETE OR UPDATE OF "isRead", "price", "category", "createdAt", "tenantId" ON "Email"
+FOR EACH ROW EXECUTE FUNCTION "email_spending_rollup"();
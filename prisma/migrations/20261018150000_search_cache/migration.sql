@@ -0,0 +1,13 @@
+-- CreateTable
+CREATE TABLE "SearchCache" (
+    "kind" TEXT NOT NULL,
+    "key" TEXT NOT NULL,
+    "value" JSONB NOT NULL,
+    "expiresAt" TIMESTAMP(3) NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "SearchCache_pkey" PRIMARY KEY ("kind","key")
+);
+
+-- CreateIndex
+CREATE INDEX "SearchCache_expiresAt_idx" ON "SearchCache"("expiresAt");
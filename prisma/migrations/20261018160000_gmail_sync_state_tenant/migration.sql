@@ -0,0 +1,7 @@
+-- AlterTable
+-- Each tenant keeps its own cursor, even for a Gmail account linked to
+-- several tenants. '' holds cursors stored before tenants existed, until
+-- the bot assigns them to the default tenant (TELEGRAM_CHAT_ID) at startup
+ALTER TABLE "GmailSyncState" ADD COLUMN "tenantId" TEXT NOT NULL DEFAULT '';
+ALTER TABLE "GmailSyncState" DROP CONSTRAINT "GmailSyncState_pkey";
+ALTER TABLE "GmailSyncState" ADD CONSTRAINT "GmailSyncState_pkey" PRIMARY KEY ("tenantId", "account");
@@ -0,0 +1,170 @@
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+
+from cache import LRUCache
+
+
+class Reminder:
+    __slots__ = ('chat_id', 'email_id', 'payload', 'attempt', 'seq')
+
+    def __init__(self, chat_id, email_id, payload):
+        self.chat_id = chat_id
+        self.email_id = email_id
+        self.payload = payload
+        self.attempt = 0
+        self.seq = None
+
+
+class ReminderScheduler:
+    """Re-sends transaction notifications until they are answered.
+
+    Pending reminders are keyed by (chat_id, email_id) and ordered in a heap
+    by due time, so one task serves every chat. When reminders come due they
+    are checked against the database with a single query, and only rows that
+    are still unread are re-sent. Each transaction is reminded after the
+    delays in `backoff` (the last delay repeats) up to `max_attempts` times.
+
+    remind(chat_id, email_id, payload) sends one reminder.
+    still_pending(email_ids) returns the subset of email_ids that are unread.
+    """
+
+    def __init__(self, remind, still_pending, backoff=(15, 60, 300, 900, 3600),
+                 max_attempts=10, max_pending=100):
+        self.remind = remind
+        self.still_pending = still_pending
+        self.backoff = tuple(backoff)
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self._heap = []
+        self._pending = {}
+        self._by_email = {}
+        # Reminders that ran out of attempts, so pollers do not notify them again
+        self._exhausted = LRUCache(max(max_pending * 10, 1024))
+        self._seq = count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def full(self):
+        return len(self._pending) >= self.max_pending
+
+    def is_tracked(self, chat_id, email_id):
+        """True if the transaction was already notified in this chat"""
+        key = (chat_id, email_id)
+        return key in self._pending or key in self._exhausted
+
+    def schedule(self, chat_id, email_id, payload):
+        """Start reminding about a transaction that was just notified.
+
+        Returns False when the cap on outstanding reminders is reached.
+        """
+        key = (chat_id, email_id)
+        if key in self._pending:
+            return True
+        if self.full:
+            logging.warning(f"Reminder limit reached ({self.max_pending}), not scheduling {email_id}")
+            return False
+        reminder = Reminder(chat_id, email_id, payload)
+        self._pending[key] = reminder
+        self._by_email.setdefault(email_id, set()).add(chat_id)
+        self._push(reminder)
+        return True
+
+    def cancel(self, email_id, chat_id=None):
+        """Stop reminding about a transaction, in one chat or in all of them"""
+        chats = self._by_email.get(email_id, ())
+        for chat in list(chats if chat_id is None else [chat_id]):
+            self._drop((chat, email_id))
+
+    def cancel_chat(self, chat_id):
+        """Forget everything notified in a chat so it can be notified again"""
+        for key in [key for key in self._pending if key[0] == chat_id]:
+            self._drop(key)
+        for key in [key for key in self._exhausted.keys() if key[0] == chat_id]:
+            self._exhausted.pop(key)
+
+    def _drop(self, key):
+        reminder = self._pending.pop(key, None)
+        if reminder is None:
+            return
+        chats = self._by_email.get(reminder.email_id)
+        if chats is not None:
+            chats.discard(reminder.chat_id)
+            if not chats:
+                del self._by_email[reminder.email_id]
+        # Heap entries of dropped reminders are skipped lazily; rebuild when
+        # they start to dominate so the heap stays proportional to live work
+        if len(self._heap) > 2 * len(self._pending) + 64:
+            self._heap = [entry for entry in self._heap
+                          if self._pending.get(entry[2]) is not None
+                          and self._pending[entry[2]].seq == entry[1]]
+            heapq.heapify(self._heap)
+
+    def _push(self, reminder):
+        delay = self.backoff[min(reminder.attempt, len(self.backoff) - 1)]
+        reminder.seq = next(self._seq)
+        due = time.monotonic() + delay
+        heapq.heappush(self._heap, (due, reminder.seq, (reminder.chat_id, reminder.email_id)))
+        if self._heap[0][1] == reminder.seq:
+            self._wakeup.set()
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            reminder = self._pending.get(key)
+            if reminder is not None and reminder.seq == seq:
+                due.append(reminder)
+        return due
+
+    async def _fire(self, due):
+        try:
+            unread = await self.still_pending(list({r.email_id for r in due}))
+        except Exception as e:
+            logging.error(f"Error checking pending reminders: {e}")
+            for reminder in due:
+                self._push(reminder)
+            return
+
+        live = []
+        for reminder in due:
+            if reminder.email_id not in unread:
+                self._drop((reminder.chat_id, reminder.email_id))
+            else:
+                live.append(reminder)
+
+        # Sent together so reminders to one chat can be merged into one message
+        results = await asyncio.gather(
+            *(self.remind(r.chat_id, r.email_id, r.payload) for r in live),
+            return_exceptions=True
+        )
+        for reminder, result in zip(live, results):
+            key = (reminder.chat_id, reminder.email_id)
+            if isinstance(result, Exception):
+                logging.error(f"Error sending reminder for {reminder.email_id}: {result}")
+            if self._pending.get(key) is not reminder:
+                continue  # cancelled while sending
+            reminder.attempt += 1
+            if reminder.attempt >= self.max_attempts:
+                self._drop(key)
+                self._exhausted.put(key, True)
+            else:
+                self._push(reminder)
+
+    async def run(self):
+        """Fire reminders as they come due until cancelled"""
+        while True:
+            self._wakeup.clear()
+            timeout = max(0, self._heap[0][0] - time.monotonic()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            due = self._pop_due(time.monotonic())
+            if due:
+                await self._fire(due)
@@ -0,0 +1,77 @@
+"""Register a Telegram chat as a tenant and link its Gmail account.
+
+Runs Google's OAuth consent flow in a browser (credentials.json, read-only
+Gmail scope), then stores the tenant and its token in the bot's database
+(DB_* settings):
+
+    python scripts/add_tenant.py --chat-id 123456789 --name "Hoàng Đăng"
+
+Running it again for the same chat refreshes the name, reactivates the
+tenant and links a new token. The bot loads new tenants on its next Gmail
+sync, or at once when restarted; a new token for an existing tenant is
+only used after a restart.
+"""
+import os
+import sys
+import uuid
+import argparse
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from getDataFromGmail import SCOPES
+
+
+def authorize(client_secrets):
+    """Run the OAuth consent flow and return the Gmail credentials"""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    flow = InstalledAppFlow.from_client_secrets_file(client_secrets, SCOPES)
+    # offline + consent so Google always returns a refresh token
+    return flow.run_local_server(port=0, access_type='offline', prompt='consent')
+
+
+def add_tenant(conn, chat_id, name, creds):
+    """Upsert the tenant of a chat and link a token to it; returns the tenant id"""
+    with conn, conn.cursor() as cursor:
+        cursor.execute("""
+        INSERT INTO "Tenant" ("id", "chatId", "name")
+        VALUES (%s, %s, %s)
+        ON CONFLICT ("chatId") DO UPDATE SET "name" = EXCLUDED."name", "active" = true
+        RETURNING "id";
+        """, (str(uuid.uuid4()), chat_id, name))
+        tenant_id = cursor.fetchone()[0]
+        cursor.execute("""
+        INSERT INTO "OAuthToken" ("id", "accessToken", "refreshToken", "expiryDate", "updatedAt", "tenantId")
+        VALUES (%s, %s, %s, %s, NOW(), %s);
+        """, (str(uuid.uuid4()), creds.token, creds.refresh_token, creds.expiry, tenant_id))
+    return tenant_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chat-id', type=int, required=True, help='Telegram chat id of the new tenant')
+    parser.add_argument('--name', required=True, help='display name of the tenant')
+    parser.add_argument('--client-secrets', default='credentials.json', help='OAuth client of the bot')
+    args = parser.parse_args()
+
+    creds = authorize(args.client_secrets)
+    if not creds.refresh_token:
+        sys.exit("Google returned no refresh token; revoke the app's access and try again")
+
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        port=os.getenv('DB_PORT'),
+    )
+    try:
+        tenant_id = add_tenant(conn, args.chat_id, args.name, creds)
+    finally:
+        conn.close()
+    print(f"Tenant {tenant_id} registered for chat {args.chat_id}")
+
+
+if __name__ == '__main__':
+    main()
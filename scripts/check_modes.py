@@ -0,0 +1,112 @@
+"""Check how the bot's chat modes route commands, voice notes and photos.
+
+Drives EmailBot's handlers in-process with minimal stand-ins for Telegram
+updates, and with recognition and expense capture replaced by recorders,
+so neither a Bot API, a database, Tesseract nor a speech service is needed:
+
+    python scripts/check_modes.py
+
+Checks that /bot_ai_gen_report and /bot_ai_gen_report_image leave capture
+mode (so media after /capture then a report command goes to the report,
+not to the ledger), and that /exit leaves the search modes. Exits non-zero
+if a check fails.
+"""
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+os.environ.setdefault('TELEGRAM_TOKEN', '1:check')
+os.environ.setdefault('METRICS_PORT', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test import EmailBot
+
+USER_ID = 424242
+
+
+class Chat:
+    """Records the bot's replies to one user"""
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return SimpleNamespace(edit_text=self.reply_text)
+
+    def update(self, text=None, photo=None, voice=None):
+        message = SimpleNamespace(text=text, photo=photo, voice=voice, reply_to_message=None,
+                                  reply_text=self.reply_text)
+        return SimpleNamespace(message=message, effective_user=SimpleNamespace(id=USER_ID),
+                               effective_chat=SimpleNamespace(id=USER_ID))
+
+
+async def download():
+    return bytearray(b'media')
+
+
+def make_bot():
+    bot = EmailBot()
+    bot.captured = []
+
+    async def capture_expenses(update, respond, expenses, data, source):
+        bot.captured.append(source)
+
+    async def recognize_image(data):
+        return 'Noi dung: hop\nTong cong: 50.000'
+
+    async def transcribe_stream(data):
+        yield ['ăn trưa 50 nghìn']
+
+    async def generate(prompt):
+        return 'báo cáo'
+
+    bot.capture_expenses = capture_expenses
+    bot.ocr.recognize = recognize_image
+    bot.voice.transcribe_stream = transcribe_stream
+    bot.llm.generate = generate
+    return bot
+
+
+async def check_report_after_capture(command, media):
+    bot = make_bot()
+    chat = Chat()
+    context = SimpleNamespace(bot=SimpleNamespace(
+        get_file=lambda file_id: asyncio.sleep(0, SimpleNamespace(download_as_bytearray=download))
+    ))
+    await bot.capture_command(chat.update('/capture'), context)
+    await getattr(bot, command)(chat.update(f'/{command}'), context)
+    if media == 'photo':
+        await bot.handle_image(chat.update(photo=[SimpleNamespace(file_id='photo')]), context)
+    else:
+        await bot.handle_voice(chat.update(voice=SimpleNamespace(file_id='voice', duration=3)), context)
+    ok = not bot.captured and USER_ID not in bot.capture_mode and any('báo cáo' in r for r in chat.replies)
+    print(f"{'ok  ' if ok else 'FAIL'} /capture then /{command}: {media} goes to the report")
+    return ok
+
+
+async def check_exit_leaves_search():
+    bot = make_bot()
+    chat = Chat()
+    ok = True
+    for command, modes in (('search_command', bot.search_mode), ('place_search_command', bot.place_search_mode)):
+        await getattr(bot, command)(chat.update(), None)
+        await bot.exit_ai_report(chat.update('/exit'), None)
+        passed = USER_ID not in modes
+        print(f"{'ok  ' if passed else 'FAIL'} /exit leaves {command.removesuffix('_command')} mode")
+        ok = ok and passed
+    return ok
+
+
+async def main():
+    results = [
+        await check_report_after_capture('bot_ai_gen_report', 'voice'),
+        await check_report_after_capture('bot_ai_gen_report_image', 'photo'),
+        await check_exit_leaves_search(),
+    ]
+    return all(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,42 @@
+"""Check the amount and category parse_receipt reads from OCR text.
+
+OCR often drops Vietnamese diacritics, so every receipt is checked as
+printed and as OCR returns it without them:
+
+    python scripts/check_receipts.py
+
+Exits non-zero if a case fails.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_capture import fold, parse_receipt
+
+# (receipt text, amount, category)
+CASES = [
+    ('CỬA HÀNG TIỆN LỢI MINH CHÂU\nBánh mì sandwich 18.500\nTổng cộng 60.500', -60500, 'MUA_SAM'),
+    ('QUÁN PHỞ HÀ NỘI\nPhở bò tái chín 55.000\nThành tiền 66.000', -66000, 'AN_UONG'),
+    ('Chuyển khoản\nSố tiền: 5.000.000\nNội dung: trả tiền nhà', -5000000, 'HOA_DON'),
+    ('Biên lai\nTổng tiền 250.000\nNội dung: khám răng', -250000, 'SUC_KHOE'),
+    ('Chuyển khoản\nSố tiền: 10.000.000\nNội dung: lương tháng 10', 10000000, 'THU_NHAP'),
+]
+
+
+def main():
+    failures = 0
+    for text, amount, category in CASES:
+        for variant in (text, fold(text).upper()):
+            expense = parse_receipt(variant)
+            got = (expense.amount, expense.category) if expense else None
+            if got != (amount, category):
+                failures += 1
+                print(f"FAIL {variant.splitlines()[0]}: expected {(amount, category)}, got {got}")
+    total = 2 * len(CASES)
+    print(f"receipts: {total - failures}/{total} cases pass")
+    return failures == 0
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
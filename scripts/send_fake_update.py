@@ -0,0 +1,106 @@
+"""Post fake Telegram updates to the bot's webhook server for local testing.
+
+Start the bot with BOT_MODE=webhook and no WEBHOOK_URL (so nothing is
+registered with Telegram), then e.g.:
+
+    python scripts/send_fake_update.py --secret $WEBHOOK_SECRET --text /help
+    python scripts/send_fake_update.py --secret $WEBHOOK_SECRET --text "AN_UONG - phở" --reply-to 42
+    python scripts/send_fake_update.py --secret $WEBHOOK_SECRET --text /check_bot --count 200 --concurrency 20
+    python scripts/send_fake_update.py --health
+
+Replies still go to the Bot API with the bot's token, so use a real chat id
+to see them, or point the bot at a fake API server.
+"""
+import time
+import asyncio
+import argparse
+import itertools
+
+import aiohttp
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def make_update(update_id, chat_id, user_id, text, reply_to=None):
+    """Build a private-chat text message update as Telegram would post it"""
+    chat = {'id': chat_id, 'type': 'private', 'first_name': 'Test'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': chat,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        # CommandHandler only matches messages that start with a bot_command entity
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    if reply_to is not None:
+        message['reply_to_message'] = {
+            'message_id': reply_to,
+            'date': int(time.time()),
+            'chat': chat,
+            'text': '',
+        }
+    return {'update_id': update_id, 'message': message}
+
+
+async def send_all(args):
+    ids = itertools.count(args.first_update_id)
+    statuses = {}
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def send(text):
+            update = make_update(next(ids), args.chat_id, args.user_id, text, args.reply_to)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.post(args.url, json=update) as response:
+                        status = response.status
+                except aiohttp.ClientError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(text) for _ in range(args.count) for text in args.text))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"sent {len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s), "
+          f"status {statuses}")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+
+async def check_health(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            print(response.status, await response.text())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8080/telegram')
+    parser.add_argument('--secret', help='WEBHOOK_SECRET of the bot')
+    parser.add_argument('--chat-id', type=int, default=1)
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--text', action='append', help='message text, may be repeated (default /help)')
+    parser.add_argument('--reply-to', type=int, help='message id the fake message replies to')
+    parser.add_argument('--count', type=int, default=1, help='times to send each text')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--first-update-id', type=int, default=int(time.time()))
+    parser.add_argument('--health', action='store_true', help='query /healthz instead')
+    args = parser.parse_args()
+    args.text = args.text or ['/help']
+
+    if args.health:
+        asyncio.run(check_health(args.url.rsplit('/', 1)[0] + '/healthz'))
+    else:
+        asyncio.run(send_all(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import re
+import logging
+import unicodedata
+
+from psycopg2.extras import Json
+
+from cache import TTLCache
+
+
+def normalize_query(query):
+    """Fold case, Unicode form, whitespace and trailing punctuation so near-identical queries share a key"""
+    query = unicodedata.normalize('NFC', query).lower()
+    query = re.sub(r'\s+', ' ', query)
+    return query.strip(' ?!.,;:"\'')
+
+
+class SearchCache:
+    """Two-level cache for search plans and page metadata.
+
+    Entries are grouped by kind (e.g. 'query', 'page'), each with its own
+    TTL. Lookups go to an in-memory LRU first and then to the "SearchCache"
+    table, which survives restarts and is shared by every process. The
+    table is kept to `max_rows` per kind by prune().
+    """
+
+    def __init__(self, db, ttls, memory_size=512, max_rows=10000):
+        self.db = db
+        self.ttls = dict(ttls)
+        self.max_rows = max_rows
+        self._memory = {kind: TTLCache(memory_size, ttl) for kind, ttl in self.ttls.items()}
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    async def get(self, kind, key):
+        value = self._memory[kind].get(key)
+        if value is not None:
+            self.stats['memory_hits'] += 1
+            return value
+
+        query = """
+        SELECT "value" FROM "SearchCache"
+        WHERE "kind" = %s AND "key" = %s AND "expiresAt" > NOW();
+        """
+        try:
+            row = await self.db.fetchone(query, (kind, key))
+        except Exception as e:
+            logging.error(f"Error reading search cache: {e}")
+            row = None
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['db_hits'] += 1
+        self._memory[kind].put(key, row[0])
+        return row[0]
+
+    async def put(self, kind, key, value):
+        self._memory[kind].put(key, value)
+        query = """
+        INSERT INTO "SearchCache" ("kind", "key", "value", "expiresAt")
+        VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+        ON CONFLICT ("kind", "key") DO UPDATE
+        SET "value" = EXCLUDED."value", "expiresAt" = EXCLUDED."expiresAt";
+        """
+        try:
+            await self.db.execute(query, (kind, key, Json(value), self.ttls[kind]))
+        except Exception as e:
+            logging.error(f"Error writing search cache: {e}")
+
+    def hit_ratio(self):
+        hits = self.stats['memory_hits'] + self.stats['db_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    async def prune(self):
+        """Drop expired entries and the soonest-expiring ones beyond max_rows per kind"""
+        expired = await self.db.execute('DELETE FROM "SearchCache" WHERE "expiresAt" <= NOW();')
+        query = """
+        DELETE FROM "SearchCache"
+        WHERE ("kind", "key") IN (
+            SELECT "kind", "key" FROM (
+                SELECT "kind", "key",
+                       ROW_NUMBER() OVER (PARTITION BY "kind" ORDER BY "expiresAt" DESC) AS "rank"
+                FROM "SearchCache"
+            ) ranked
+            WHERE "rank" > %s
+        );
+        """
+        evicted = await self.db.execute(query, (self.max_rows,))
+        return expired + evicted
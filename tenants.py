@@ -0,0 +1,128 @@
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Tenant:
+    id: str
+    chat_id: int
+    name: str
+
+
+class TenantRegistry:
+    """Telegram chats served by the bot, each owning a Gmail account and its transactions"""
+
+    def __init__(self, db):
+        self.db = db
+        self._by_chat = {}
+
+    def __iter__(self):
+        return iter(list(self._by_chat.values()))
+
+    def __len__(self):
+        return len(self._by_chat)
+
+    def for_chat(self, chat_id):
+        """Return the tenant of a chat, or None if the chat is not registered"""
+        return self._by_chat.get(chat_id)
+
+    async def load(self):
+        """Reload active tenants, picking up ones provisioned since the last load"""
+        query = """
+        SELECT "id", "chatId", "name" FROM "Tenant"
+        WHERE "active" = true;
+        """
+        rows = await self.db.fetchall(query)
+        self._by_chat = {row[1]: Tenant(*row) for row in rows}
+        return len(self._by_chat)
+
+    async def ensure(self, chat_id, name):
+        """Register a chat (or refresh its name) and return its tenant"""
+        query = """
+        INSERT INTO "Tenant" ("id", "chatId", "name")
+        VALUES (%s, %s, %s)
+        ON CONFLICT ("chatId") DO UPDATE SET "name" = EXCLUDED."name", "active" = true
+        RETURNING "id", "chatId", "name";
+        """
+        row = await self.db.fetchone(query, (str(uuid.uuid4()), chat_id, name))
+        tenant = Tenant(*row)
+        self._by_chat[tenant.chat_id] = tenant
+        return tenant
+
+    async def adopt_orphans(self, tenant):
+        """Assign emails and Gmail cursors stored before tenants existed to a tenant,
+        returning the number of emails"""
+        query = """
+        UPDATE "GmailSyncState" AS s SET "tenantId" = %s
+        WHERE s."tenantId" = ''
+          AND NOT EXISTS (
+            SELECT 1 FROM "GmailSyncState" AS t
+            WHERE t."tenantId" = %s AND t."account" = s."account"
+          );
+        """
+        await self.db.execute(query, (tenant.id, tenant.id))
+        query = """
+        UPDATE "Email" SET "tenantId" = %s
+        WHERE "tenantId" IS NULL;
+        """
+        return await self.db.execute(query, (tenant.id,))
+
+
+class TenantSyncScheduler:
+    """Runs Gmail ingestion for every tenant with bounded concurrency.
+
+    At most `concurrency` syncs run at once, across the periodic sweep and
+    on-demand syncs alike. Each sweep starts with the tenants that were synced
+    least recently, and a tenant whose sync fails is skipped for a growing
+    backoff so a broken account cannot starve the others.
+    """
+
+    def __init__(self, registry, make_service, concurrency=4, max_backoff=6 * 3600):
+        self.registry = registry
+        self.make_service = make_service
+        self.max_backoff = max_backoff
+        self._services = {}
+        self._last_sync = {}
+        self._failures = {}
+        self._retry_at = {}
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def service_for(self, tenant):
+        service = self._services.get(tenant.id)
+        if service is None:
+            service = self._services[tenant.id] = self.make_service(tenant)
+        return service
+
+    async def sync(self, tenant):
+        """Sync one tenant now and return the ids of the new emails"""
+        async with self._slots:
+            try:
+                new_ids = await self.service_for(tenant).sync()
+            except Exception:
+                failures = self._failures.get(tenant.id, 0) + 1
+                self._failures[tenant.id] = failures
+                self._retry_at[tenant.id] = time.monotonic() + min(60 * 2 ** failures, self.max_backoff)
+                raise
+            self._failures.pop(tenant.id, None)
+            self._retry_at.pop(tenant.id, None)
+            self._last_sync[tenant.id] = time.monotonic()
+            return new_ids
+
+    async def _sync_logged(self, tenant):
+        try:
+            return await self.sync(tenant)
+        except Exception as e:
+            logging.error(f"Error syncing Gmail for tenant {tenant.id}: {e}")
+            return []
+
+    async def sync_all(self):
+        """Sync every tenant that is not backing off; return the total of new emails"""
+        await self.registry.load()
+        now = time.monotonic()
+        tenants = [t for t in self.registry if self._retry_at.get(t.id, 0) <= now]
+        tenants.sort(key=lambda t: self._last_sync.get(t.id, 0))
+        results = await asyncio.gather(*(self._sync_logged(t) for t in tenants))
+        return sum(len(new_ids) for new_ids in results)
@@ -1,55 +1,51 @@
 import os
 import logging
 import asyncio
-import psycopg2
-import subprocess
 from datetime import datetime
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import pickle
-import speech_recognition as sr
-from pydub import AudioSegment
-import tempfile
-import requests
-import json
-import google.generativeai as genai
-import pytesseract
-from PIL import Image
-import io
-from googlesearch import search
-import aiohttp
-from bs4 import BeautifulSoup
 import re
-import base64
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-import uuid
+# Feature dependencies (Gemini, Google APIs, speech, OCR, web search) are
+# imported on first use and pre-imported in the background after startup
+from db import Database, Listener
+from message_map import MessageMap
+from reminders import ReminderScheduler
+from tenants import TenantRegistry, TenantSyncScheduler
+from llm import LLMService
+from web_search import SearchPipeline
+from search_cache import SearchCache, normalize_query
+from voice import NoSpeech, RecognitionError, VoicePipeline, VoiceQueueFull, VoiceTooLong, join_transcript
+from ocr import OCRService
+from outbox import Outbox
+from webhook import WebhookServer, allowed_updates, serve
+from prewarm import prewarm
+import metrics
+from metrics import LoopMonitor, MetricsServer, TraceIdFilter, new_trace_id, trace_id, traced
+from expense_capture import (
+    CATEGORIES, ExpenseWriter, content_key, expense_from_json, parse_receipt, parse_spoken
+)
+from getDataFromGmail import GmailIngestionService, OAuthTokenStore
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     level=logging.INFO
 )
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
 
 # Get environment variables
 TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Bot API endpoints, overridable to run against a local or fake server
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+TELEGRAM_FILE_URL = os.getenv('TELEGRAM_FILE_URL', 'https://api.telegram.org/file/bot')
+# Optional single-user setup: this chat becomes the default tenant, using token.pickle
 CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+USER_NAME = os.getenv('TELEGRAM_USER_NAME', 'Hoàng Đăng')
 
 # Database configuration
 DB_CONFIG = {
@@ -59,18 +55,202 @@ DB_CONFIG = {
     "password": os.getenv('DB_PASSWORD'),
     "port": os.getenv('DB_PORT')
 }
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+
+# New transactions are pushed via LISTEN/NOTIFY; polling is only a fallback
+EMAIL_NOTIFY_CHANNEL = 'email_inserted'
+UNREAD_POLL_INTERVAL = int(os.getenv('UNREAD_POLL_INTERVAL', '300'))
+
+# Sent message id -> transactions it shows, used to resolve replies
+MESSAGE_MAP_CACHE_SIZE = int(os.getenv('MESSAGE_MAP_CACHE_SIZE', '1024'))
+MESSAGE_MAP_RETENTION_DAYS = int(os.getenv('MESSAGE_MAP_RETENTION_DAYS', '30'))
+
+# Reminders for unanswered transactions: delays in seconds (the last one repeats)
+REMINDER_BACKOFF = [int(s) for s in os.getenv('REMINDER_BACKOFF', '15,60,300,900,3600').split(',')]
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS', '10'))
+REMINDER_MAX_PENDING = int(os.getenv('REMINDER_MAX_PENDING', '1000'))
+REMINDER_MAX_PER_CHAT = int(os.getenv('REMINDER_MAX_PER_CHAT', '10'))
+
+# Gmail ingestion across tenants
+GMAIL_SYNC_INTERVAL = int(os.getenv('GMAIL_SYNC_INTERVAL', '3600'))
+GMAIL_SYNC_CONCURRENCY = int(os.getenv('GMAIL_SYNC_CONCURRENCY', '4'))
+
+# Gemini
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+LLM_TIMEOUT = int(os.getenv('LLM_TIMEOUT', '30'))
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '256'))
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', '3600'))
+
+# Web search: result pages are fetched concurrently within an overall deadline
+SEARCH_RESULTS = int(os.getenv('SEARCH_RESULTS', '5'))
+SEARCH_PER_HOST = int(os.getenv('SEARCH_PER_HOST', '2'))
+SEARCH_PAGE_TIMEOUT = int(os.getenv('SEARCH_PAGE_TIMEOUT', '10'))
+SEARCH_DEADLINE = int(os.getenv('SEARCH_DEADLINE', '15'))
+
+# Search cache: query -> enhanced query + URLs, and URL -> page metadata
+SEARCH_QUERY_TTL = int(os.getenv('SEARCH_QUERY_TTL', '86400'))
+SEARCH_PAGE_TTL = int(os.getenv('SEARCH_PAGE_TTL', '604800'))
+SEARCH_CACHE_MEMORY = int(os.getenv('SEARCH_CACHE_MEMORY', '512'))
+SEARCH_CACHE_MAX_ROWS = int(os.getenv('SEARCH_CACHE_MAX_ROWS', '10000'))
+
+# Voice notes are decoded and transcribed on a worker pool
+VOICE_WORKERS = int(os.getenv('VOICE_WORKERS', '4'))
+VOICE_SEGMENT_SECONDS = int(os.getenv('VOICE_SEGMENT_SECONDS', '30'))
+VOICE_SEGMENT_CONCURRENCY = int(os.getenv('VOICE_SEGMENT_CONCURRENCY', '2'))
+VOICE_MAX_DURATION = int(os.getenv('VOICE_MAX_DURATION', '300'))
+VOICE_MAX_QUEUE_PER_USER = int(os.getenv('VOICE_MAX_QUEUE_PER_USER', '2'))
+VOICE_LANGUAGE = os.getenv('VOICE_LANGUAGE', 'vi-VN')
+
+# OCR runs on a process pool; 0 workers means one per CPU core
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '0'))
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'vie')
+OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', '256'))
+
+# Expenses captured from photos and voice notes are written in batches
+CAPTURE_MAX_BATCH = int(os.getenv('CAPTURE_MAX_BATCH', '500'))
+
+# Outgoing messages: Telegram allows about 30 messages/s overall and 1/s per chat
+OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', '25'))
+OUTBOX_PER_CHAT_RATE = float(os.getenv('OUTBOX_PER_CHAT_RATE', '1'))
+OUTBOX_PER_CHAT_BURST = int(os.getenv('OUTBOX_PER_CHAT_BURST', '3'))
+OUTBOX_MAX_RETRIES = int(os.getenv('OUTBOX_MAX_RETRIES', '5'))
+NOTIFY_COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', '1'))
+
+# Updates come from long polling or, with BOT_MODE=webhook, from an embedded
+# aiohttp server. WEBHOOK_URL is the public URL Telegram posts to; leave it
+# unset to only listen (behind a load balancer that is already registered,
+# or locally with scripts/send_fake_update.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Comma-separated update types; by default those the registered handlers use
+ALLOWED_UPDATES = [kind for kind in os.getenv('ALLOWED_UPDATES', '').split(',') if kind]
+
+# Seconds after startup before the feature modules are pre-imported in the
+# background (negative to leave them to first use)
+PREWARM_DELAY = float(os.getenv('PREWARM_DELAY', '2'))
+
+# Prometheus metrics on a local port (0 to turn off). The event loop is
+# probed every LOOP_LAG_INTERVAL seconds and a probe delayed by more than
+# LOOP_BLOCK_THRESHOLD seconds logs what the loop is running.
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.25'))
+
+NOTIFICATION_DELAY = metrics.histogram(
+    'bot_notification_delay_seconds',
+    'Time from a transaction email\'s Date header to its Telegram notification',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600)
+)
+QUEUE_DEPTH = metrics.gauge('bot_queue_depth', 'Items waiting in the bot\'s in-process queues', ['queue'])
 
 # Gmail API configuration
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+def month_range(year, month):
+    """Return the [start, end) datetimes of a calendar month for index-backed range filters"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
 class EmailBot:
     def __init__(self):
-        self.check = True
-        self.current_email = None
-        self.application = Application.builder().token(TOKEN).build()
+        self.background_tasks = set()
+        self.db = Database(DB_CONFIG, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX)
+        self.new_email_event = asyncio.Event()
+        self.message_map = MessageMap(
+            self.db,
+            maxsize=MESSAGE_MAP_CACHE_SIZE,
+            retention_days=MESSAGE_MAP_RETENTION_DAYS
+        )
+        self.reminders = ReminderScheduler(
+            self.send_reminder,
+            self.unread_email_ids,
+            backoff=REMINDER_BACKOFF,
+            max_attempts=REMINDER_MAX_ATTEMPTS,
+            max_pending=REMINDER_MAX_PENDING
+        )
+        self.tenants = TenantRegistry(self.db)
+        self.default_tenant = None
+        self.ingestion = TenantSyncScheduler(
+            self.tenants,
+            self.make_ingestion_service,
+            concurrency=GMAIL_SYNC_CONCURRENCY
+        )
+        self.llm = LLMService(
+            os.getenv('GOOGLE_API_KEY'),
+            model_name=GEMINI_MODEL,
+            concurrency=LLM_CONCURRENCY,
+            timeout=LLM_TIMEOUT,
+            cache_size=LLM_CACHE_SIZE,
+            cache_ttl=LLM_CACHE_TTL
+        )
+        self.search_cache = SearchCache(
+            self.db,
+            {'query': SEARCH_QUERY_TTL, 'page': SEARCH_PAGE_TTL},
+            memory_size=SEARCH_CACHE_MEMORY,
+            max_rows=SEARCH_CACHE_MAX_ROWS
+        )
+        self.web_search = SearchPipeline(
+            num_results=SEARCH_RESULTS,
+            per_host=SEARCH_PER_HOST,
+            page_timeout=SEARCH_PAGE_TIMEOUT,
+            deadline=SEARCH_DEADLINE,
+            cache=self.search_cache
+        )
+        self.voice = VoicePipeline(
+            workers=VOICE_WORKERS,
+            max_duration=VOICE_MAX_DURATION,
+            max_queue_per_user=VOICE_MAX_QUEUE_PER_USER,
+            language=VOICE_LANGUAGE,
+            max_segment=VOICE_SEGMENT_SECONDS,
+            segment_concurrency=VOICE_SEGMENT_CONCURRENCY
+        )
+        self.ocr = OCRService(
+            workers=OCR_WORKERS or None,
+            lang=OCR_LANGUAGE,
+            cache_size=OCR_CACHE_SIZE
+        )
+        self.expense_writer = ExpenseWriter(self.db, max_batch=CAPTURE_MAX_BATCH)
+        self.email_listener = Listener(DB_CONFIG, EMAIL_NOTIFY_CHANNEL, self.on_email_inserted)
+        builder = (
+            Application.builder()
+            .token(TOKEN)
+            .base_url(TELEGRAM_API_URL)
+            .base_file_url(TELEGRAM_FILE_URL)
+            .post_init(self.on_startup)
+            .post_stop(self.on_stop)
+            .post_shutdown(self.on_shutdown)
+        )
+        if BOT_MODE == 'webhook':
+            builder = builder.updater(None)  # updates are put on the queue by WebhookServer
+        self.application = builder.build()
+        self.outbox = Outbox(
+            self.application.bot,
+            global_rate=OUTBOX_GLOBAL_RATE,
+            per_chat_rate=OUTBOX_PER_CHAT_RATE,
+            per_chat_burst=OUTBOX_PER_CHAT_BURST,
+            max_retries=OUTBOX_MAX_RETRIES,
+            coalesce_window=NOTIFY_COALESCE_SECONDS,
+            max_digest=REMINDER_MAX_PER_CHAT
+        )
+        self.metrics_server = MetricsServer(listen=METRICS_LISTEN, port=METRICS_PORT)
+        self.loop_monitor = LoopMonitor(interval=LOOP_LAG_INTERVAL, threshold=LOOP_BLOCK_THRESHOLD)
+        QUEUE_DEPTH.labels(queue='outbox').set_function(lambda: self.outbox.pending)
+        QUEUE_DEPTH.labels(queue='reminders').set_function(lambda: len(self.reminders))
+        QUEUE_DEPTH.labels(queue='expense_writer').set_function(lambda: self.expense_writer.pending)
+        QUEUE_DEPTH.labels(queue='voice').set_function(lambda: self.voice.queued)
+        QUEUE_DEPTH.labels(queue='ocr').set_function(lambda: self.ocr.pending)
         self.ai_report_mode = {}  # Dictionary to track AI report mode for each user
         self.search_mode = {}  # Dictionary to track search mode for each user
         self.place_search_mode = {}  # Dictionary to track place search mode for each user
+        self.capture_mode = {}  # Dictionary to track expense capture mode for each user
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -95,38 +275,41 @@ class EmailBot:
         🤖 Tính Năng AI:
         8. /bot_ai_gen_report: Bật chế độ phân tích tin nhắn thoại
         9. /bot_ai_gen_report_image: Bật chế độ phân tích ảnh
-        10. /exit: Thoát chế độ phân tích
+        10. /capture: Ghi chi tiêu từ ảnh hóa đơn hoặc tin nhắn thoại
+        11. /exit: Thoát chế độ phân tích, ghi chi tiêu hoặc tìm kiếm
 
         🔍 Tính Năng Tìm Kiếm:
-        11. /search: Tìm kiếm thông tin với AI
-        12. /place_search: Tìm kiếm địa điểm và hiển thị Google Maps
+        12. /search: Tìm kiếm thông tin với AI
+        13. /place_search: Tìm kiếm địa điểm và hiển thị Google Maps
+        14. /cache_stats: Thống kê bộ nhớ đệm tìm kiếm
         """
         await update.message.reply_text(help_text)
 
     async def reset_bot(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /reset_bot command"""
         try:
-            # Run getDataFromGmail.py with venv python
+            tenant = await self.get_tenant(update)
+            if tenant is None:
+                return
+
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             await update.message.reply_text(f"🔄 Đang cập nhật dữ liệu từ Gmail... ({current_time})")
             
-            # Use python3 from virtual environment
-            subprocess.run(['venv/bin/python3', 'getDataFromGmail.py'], check=True)
+            try:
+                await self.ingestion.sync(tenant)
+            except Exception as e:
+                logging.error(f"Error syncing Gmail: {e}")
+                await update.message.reply_text("❌ Lỗi khi cập nhật dữ liệu từ Gmail!")
+                return
             
             # Check for unread transactions
-            conn = psycopg2.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
             query = """
             SELECT COUNT(*) 
             FROM "Email" 
-            WHERE "isRead" = false;
+            WHERE "tenantId" = %s AND "isRead" = false;
             """
             
-            cursor.execute(query)
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await self.db.fetchone(query, (tenant.id,))
             
             unread_count = result[0] if result[0] else 0
             
@@ -139,12 +322,9 @@ class EmailBot:
             else:
                 await update.message.reply_text("✅ Đã cập nhật dữ liệu!\n📝 Không có giao dịch nào chưa ghi chú.")
             
-            self.check = True
-            self.current_email = None
+            self.reminders.cancel_chat(tenant.chat_id)
+            self.new_email_event.set()
             
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Error running getDataFromGmail.py: {e}")
-            await update.message.reply_text("❌ Lỗi khi cập nhật dữ liệu từ Gmail!")
         except Exception as e:
             logging.error(f"Error in reset_bot: {e}")
             await update.message.reply_text("❌ Lỗi khi reset bot!")
@@ -152,37 +332,40 @@ class EmailBot:
     async def check_bot(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /check_bot command"""
         try:
+            tenant = await self.get_tenant(update)
+            if tenant is None:
+                return
+
             # Get unread emails
-            conn = psycopg2.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
             query = """
             SELECT "emailId", "price", "note", "createdAt" 
             FROM "Email" 
-            WHERE "isRead" = false 
+            WHERE "tenantId" = %s AND "isRead" = false 
             ORDER BY "createdAt" DESC;
             """
             
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            results = await self.db.fetchall(query, (tenant.id,))
             
             if results:
-                message = "📝 Danh sách giao dịch chưa ghi chú:\n\n"
+                # One block per transaction; long lists are split over several
+                # messages, each remembering the transactions it shows
+                blocks = ["📝 Danh sách giao dịch chưa ghi chú:"]
                 for email in results:
                     money = float(email[1])
                     status = 'giảm' if money < 0 else 'tăng'
                     formatted_money = "{:,.0f}".format(abs(money))
                     created_at = email[3].strftime("%Y-%m-%d %H:%M:%S")
-                    message += f"💰 {formatted_money} VNĐ ({status})\n📄 {email[2]}\n🕒 {created_at}\n\n"
-                
-                message += "Vui lòng reply để ghi chú chi tiết theo định dạng:\nDANH_MUC - chi tiết"
-                await update.message.reply_text(message)
+                    blocks.append(f"💰 {formatted_money} VNĐ ({status})\n📄 {email[2]}\n🕒 {created_at}")
+                blocks.append("Vui lòng reply để ghi chú chi tiết theo định dạng:\nDANH_MUC - chi tiết")
+                keys = [None] + [email[0] for email in results] + [None]
+
+                for sent, email_ids in await self.outbox.send_blocks(update.effective_chat.id, blocks, keys):
+                    if email_ids:
+                        await self.message_map.remember(sent.chat_id, sent.message_id, email_ids)
             else:
                 await update.message.reply_text("✅ Không có giao dịch nào chưa ghi chú!")
             
-            self.check = True
+            self.new_email_event.set()
         except Exception as e:
             logging.error(f"Error checking unread transactions: {e}")
             await update.message.reply_text("❌ Lỗi khi kiểm tra giao dịch!")
@@ -190,18 +373,17 @@ class EmailBot:
     async def check_outlay(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /check_outlay command"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
+            tenant = await self.get_tenant(update)
+            if tenant is None:
+                return
+
+            now = datetime.now()
             query = """
-            SELECT SUM("price") FROM "Email" 
-            WHERE "month" = %s AND "isRead" = true AND "price" < 0;
+            SELECT SUM("expenseTotal") FROM "SpendingRollup" 
+            WHERE "tenantId" = %s AND "year" = %s AND "month" = %s;
             """
             
-            cursor.execute(query, (datetime.now().month,))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await self.db.fetchone(query, (tenant.id, now.year, now.month))
             
             total = result[0] if result[0] else 0
             formatted_total = "{:,.0f}".format(total)
@@ -213,18 +395,23 @@ class EmailBot:
     async def report_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /report command"""
         try:
+            tenant = await self.get_tenant(update)
+            if tenant is None:
+                return
+
             # Get month from command arguments
             args = context.args
             if not args:
                 await update.message.reply_text(
                     "❌ Vui lòng chỉ định tháng!\n"
-                    "Cú pháp: /report <tháng>\n"
+                    "Cú pháp: /report <tháng> [năm]\n"
                     "Ví dụ: /report 3"
                 )
                 return
 
             try:
                 month = int(args[0])
+                year = int(args[1]) if len(args) > 1 else datetime.now().year
                 if month < 1 or month > 12:
                     await update.message.reply_text("❌ Tháng phải từ 1 đến 12!")
                     return
@@ -232,65 +419,74 @@ class EmailBot:
                 await update.message.reply_text("❌ Tháng phải là số!")
                 return
 
-            conn = psycopg2.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
-            # Get expenses grouped by category
-            query = """
-            SELECT 
-                "category",
-                COUNT(*) as transaction_count,
-                SUM("price") as total_amount,
-                array_agg("expense") as expenses,
-                array_agg("note") as notes
-            FROM "Email" 
-            WHERE "month" = %s
-            AND "isRead" = true
-            AND "category" IS NOT NULL
-            GROUP BY "category"
-            ORDER BY total_amount ASC;
+            # Totals per category come from the pre-aggregated rollup
+            totals_query = """
+            SELECT "category", "count", "total"
+            FROM "SpendingRollup"
+            WHERE "tenantId" = %s AND "year" = %s AND "month" = %s AND "count" > 0
+            ORDER BY "total" ASC;
             """
+            totals = await self.db.fetchall(totals_query, (tenant.id, year, month))
             
-            cursor.execute(query, (month,))
-            results = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            
-            if results:
-                message = f"📊 Thống kê chi tiêu tháng {month}:\n\n"
+            if totals:
+                details_query = """
+                SELECT "category", "expense", "note"
+                FROM "Email"
+                WHERE "tenantId" = %s AND "isRead" = true
+                AND "createdAt" >= %s AND "createdAt" < %s
+                ORDER BY "createdAt";
+                """
+                details = {}
+                start, end = month_range(year, month)
+                for category, expense, note in await self.db.fetchall(details_query, (tenant.id, start, end)):
+                    details.setdefault(category, []).append((expense, note))
+
+                # One block per category, sent as ordered messages under Telegram's limit
+                blocks = [f"📊 Thống kê chi tiêu tháng {month}/{year}:"]
                 total_spent = 0
                 
-                for category, count, amount, expenses, notes in results:
+                for category, count, amount in totals:
                     formatted_amount = "{:,.0f}".format(abs(amount))
                     status = 'chi' if amount < 0 else 'thu'
                     
-                    message += f"📌 {category}:\n"
-                    message += f"💰 Tổng: {formatted_amount} VNĐ ({status})\n"
-                    message += f"📝 Chi tiết:\n"
+                    lines = [
+                        f"📌 {category}:",
+                        f"💰 Tổng: {formatted_amount} VNĐ ({status})",
+                        "📝 Chi tiết:"
+                    ]
                     
                     # Add each expense with bullet point
-                    for expense, note in zip(expenses, notes):
-                        if note:
-                            message += f"• {expense} ({note})\n"
-                        else:
-                            message += f"• {expense}\n"
+                    for expense, note in details.get(category, []):
+                        lines.append(f"• {expense} ({note})" if note else f"• {expense}")
                     
-                    message += "\n"
+                    blocks.append("\n".join(lines))
                     total_spent += amount
                 
                 # Add total summary
                 formatted_total = "{:,.0f}".format(abs(total_spent))
                 status = 'chi' if total_spent < 0 else 'thu'
-                message += f"📈 Tổng cộng: {formatted_total} VNĐ ({status})"
+                blocks.append(f"📈 Tổng cộng: {formatted_total} VNĐ ({status})")
                 
-                await update.message.reply_text(message)
+                await self.outbox.send_blocks(update.effective_chat.id, blocks)
             else:
-                await update.message.reply_text(f"📊 Chưa có dữ liệu chi tiêu trong tháng {month}!")
+                await update.message.reply_text(f"📊 Chưa có dữ liệu chi tiêu trong tháng {month}/{year}!")
                 
         except Exception as e:
             logging.error(f"Error generating report: {e}")
             await update.message.reply_text("❌ Lỗi khi tạo báo cáo!")
 
+    async def cache_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cache_stats command"""
+        stats = self.search_cache.stats
+        await update.message.reply_text(
+            "📦 Bộ nhớ đệm tìm kiếm:\n"
+            f"• Trúng (RAM): {stats['memory_hits']}\n"
+            f"• Trúng (DB): {stats['db_hits']}\n"
+            f"• Trượt: {stats['misses']}\n"
+            f"• Tỉ lệ trúng: {self.search_cache.hit_ratio():.0%}\n"
+            f"• LLM: {self.llm.hits} trúng / {self.llm.misses} trượt"
+        )
+
     async def name_love(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /name_love command"""
         await update.message.reply_text("❤️ Hoàng Đăng vs Thy Uyên ❤️")
@@ -305,6 +501,7 @@ class EmailBot:
     async def bot_ai_gen_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /bot_ai_gen_report command"""
         user_id = update.effective_user.id
+        self.capture_mode.pop(user_id, None)
         self.ai_report_mode[user_id] = True
         
         await update.message.reply_text(
@@ -316,6 +513,28 @@ class EmailBot:
             "3. Những khó khăn\n"
         )
 
+    async def capture_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /capture command"""
+        user_id = update.effective_user.id
+        self.ai_report_mode.pop(user_id, None)
+        self.capture_mode[user_id] = True
+
+        await update.message.reply_text(
+            "🧾 Chế độ ghi chi tiêu đã được kích hoạt!\n\n"
+            "Gửi ảnh hóa đơn, ảnh chụp màn hình chuyển khoản\n"
+            "hoặc tin nhắn thoại như \"ăn trưa 50 nghìn\".\n"
+            "Gửi /exit để thoát."
+        )
+
+    async def exit_ai_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /exit command"""
+        user_id = update.effective_user.id
+        self.ai_report_mode.pop(user_id, None)
+        self.capture_mode.pop(user_id, None)
+        self.search_mode.pop(user_id, None)
+        self.place_search_mode.pop(user_id, None)
+        await update.message.reply_text("👋 Đã thoát chế độ hiện tại!")
+
     async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /search command"""
         user_id = update.effective_user.id
@@ -388,93 +607,72 @@ class EmailBot:
                         )
                         return
 
-                    # Extract transaction info from replied message
-                    replied_text = reply_to_message.text
-                    price_match = re.search(r'(\d+(?:,\d+)*) VNĐ', replied_text)
-                    note_match = re.search(r'Nội dung: (.+?)(?:\n|$)', replied_text)
-                    
-                    if not price_match or not note_match:
+                    tenant = await self.get_tenant(update)
+                    if tenant is None:
+                        return
+
+                    # Resolve the replied message to the transactions it showed
+                    email_ids = await self.message_map.lookup(
+                        reply_to_message.chat_id, reply_to_message.message_id
+                    )
+
+                    if not email_ids:
                         await update.message.reply_text(
                             "❌ Không thể tìm thấy thông tin giao dịch trong tin nhắn được trả lời!",
                             quote=False
                         )
                         return
-                        
-                    # Convert price string to number
-                    price_str = price_match.group(1).replace(',', '')
-                    price = float(price_str)
-                    if 'giảm' in replied_text:
-                        price = -price
-                        
-                    note = note_match.group(1).strip()
-                    
-                    # Save reply as note with category and expense
-                    conn = psycopg2.connect(**DB_CONFIG)
-                    cursor = conn.cursor()
-                    
-                    try:
-                        # Find the transaction in database
-                        query = """
+
+                    # Save reply as note with category and expense on the first
+                    # transaction of that message that is still unread
+                    update_query = """
+                    UPDATE "Email"
+                    SET "isRead" = true,
+                        "category" = %s,
+                        "expense" = %s
+                    WHERE "emailId" = (
                         SELECT "emailId" FROM "Email"
-                        WHERE "price" = %s AND "note" = %s AND "isRead" = false
-                        ORDER BY "createdAt" DESC LIMIT 1;
-                        """
-                        
-                        cursor.execute(query, (price, note))
-                        result = cursor.fetchone()
-                        
-                        if not result:
-                            await update.message.reply_text(
-                                "❌ Không tìm thấy giao dịch tương ứng trong cơ sở dữ liệu!",
-                                quote=False
-                            )
-                            return
-                            
-                        # Update the transaction
-                        update_query = """
-                        UPDATE "Email" 
-                        SET "isRead" = true,
-                            "category" = %s,
-                            "expense" = %s
-                        WHERE "emailId" = %s
-                        RETURNING "emailId";
-                        """
-                        
-                        cursor.execute(update_query, (category, expense, result[0]))
-                        update_result = cursor.fetchone()
-                        conn.commit()
-                        
-                        if update_result:
-                            # Get total expense after update
-                            total = await self.get_total_expense()
-                            formatted_total = "{:,.0f}".format(abs(total))
-                            
-                            # Send success messages
-                            await update.message.reply_text(
-                                f"✅ Đã lưu thông tin chi tiêu!\nDanh mục: {category}\nChi tiết: {expense}",
-                                quote=False
-                            )
-                            
-                            await update.message.reply_text(
-                                f"💰 Tổng chi tiêu trong tháng này: {formatted_total} VNĐ",
-                                quote=False
-                            )
-                        else:
-                            await update.message.reply_text(
-                                "❌ Không thể cập nhật thông tin! Vui lòng thử lại.",
-                                quote=False
-                            )
-                            
+                        WHERE "emailId" = ANY(%s) AND "tenantId" = %s AND "isRead" = false
+                        ORDER BY array_position(%s, "emailId") LIMIT 1
+                    )
+                    RETURNING "emailId";
+                    """
+
+                    try:
+                        update_result = await self.db.fetchone(
+                            update_query, (category, expense, email_ids, tenant.id, email_ids)
+                        )
                     except Exception as e:
                         logging.error(f"Database error: {str(e)}")
                         await update.message.reply_text(
                             "❌ Lỗi khi cập nhật cơ sở dữ liệu! Vui lòng thử lại.",
                             quote=False
                         )
-                        conn.rollback()
-                    finally:
-                        cursor.close()
-                        conn.close()
+                        return
+
+                    if update_result is None:
+                        await update.message.reply_text(
+                            "❌ Giao dịch trong tin nhắn này đã được ghi chú hoặc không còn tồn tại!",
+                            quote=False
+                        )
+                        return
+
+                    self.reminders.cancel(update_result[0])
+
+                    # Get total expense after update
+                    total = await self.get_total_expense(tenant)
+                    formatted_total = "{:,.0f}".format(abs(total))
+                    
+                    # Send success messages
+                    await update.message.reply_text(
+                        f"✅ Đã lưu thông tin chi tiêu!\nDanh mục: {category}\nChi tiết: {expense}",
+                        quote=False
+                    )
+                    
+                    await update.message.reply_text(
+                        f"💰 Tổng chi tiêu trong tháng này: {formatted_total} VNĐ",
+                        quote=False
+                    )
                     
                 except Exception as e:
                     logging.error(f"Error processing reply: {str(e)}")
@@ -484,8 +682,8 @@ class EmailBot:
                     )
             else:
                 if message in ['/reset_bot', 'Reset-bot']:
-                    self.check = True
-                    self.current_email = None
+                    self.reminders.cancel_chat(update.effective_chat.id)
+                    self.new_email_event.set()
                     await update.message.reply_text("✅ Bot đã được reset!")
                 elif message in ['/check_bot', 'Check-bot']:
                     await self.check_bot(update, context)
@@ -501,6 +699,8 @@ class EmailBot:
                     await self.check_outlay_web(update, context)
                 elif message in ['/bot_ai_gen_report', 'Bot-AI-gen-report']:
                     await self.bot_ai_gen_report(update, context)
+                elif message in ['/capture', 'Capture']:
+                    await self.capture_command(update, context)
                 elif message in ['/search', 'Search']:
                     await self.search_command(update, context)
                 elif message in ['/place_search', 'Place-search']:
@@ -515,9 +715,6 @@ class EmailBot:
         """Process a search query and ask for more"""
         try:
             user_id = update.effective_user.id
-            # Configure Gemini API
-            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-            model = genai.GenerativeModel('gemini-2.0-flash')
             
             # Create prompt for enhancing search query
             prompt = f"""
@@ -533,9 +730,8 @@ class EmailBot:
             Chỉ trả về câu truy vấn đã được cải thiện, không thêm giải thích.
             """
             
-            # Generate enhanced query using Gemini
-            response = model.generate_content(prompt)
-            enhanced_query = response.text.strip()
+            # Generate enhanced query using Gemini, unless this search was planned recently
+            enhanced_query, urls = await self.plan_search('search', query, prompt)
             
             # Send initial message
             await update.message.reply_text(
@@ -543,52 +739,23 @@ class EmailBot:
                 "Vui lòng đợi trong giây lát..."
             )
             
-            # Perform web search
-            search_results = []
-            async with aiohttp.ClientSession() as session:
-                # Get top 5 search results
-                for url in search(enhanced_query, num_results=5):
-                    try:
-                        async with session.get(url, timeout=10) as response:
-                            if response.status == 200:
-                                html = await response.text()
-                                soup = BeautifulSoup(html, 'html.parser')
-                                
-                                # Extract title
-                                title = soup.title.string if soup.title else url
-                                
-                                # Extract description
-                                meta_desc = soup.find('meta', {'name': 'description'})
-                                description = meta_desc['content'] if meta_desc else "Không có mô tả"
-                                
-                                # Clean up text
-                                title = re.sub(r'\s+', ' ', title).strip()
-                                description = re.sub(r'\s+', ' ', description).strip()
-                                
-                                search_results.append({
-                                    'title': title,
-                                    'description': description,
-                                    'url': url
-                                })
-                    except Exception as e:
-                        logging.error(f"Error fetching {url}: {e}")
-                        continue
-            
-            # Format and send results
-            if search_results:
-                message = "📊 Kết quả tìm kiếm:\n\n"
-                for i, result in enumerate(search_results, 1):
-                    message += f"{i}. {result['title']}\n"
-                    message += f"📝 {result['description']}\n"
-                    message += f"🔗 {result['url']}\n\n"
-                
-                message += "Bạn có thể dùng lệnh /search để tìm kiếm tiếp."
-                await update.message.reply_text(message)
-            else:
-                await update.message.reply_text(
-                    "❌ Không tìm thấy kết quả nào!\n\n"
-                    "Bạn có thể dùng lệnh /search để tìm kiếm lại."
+            # Perform web search, showing results as they arrive
+            def format_result(i, result):
+                return (
+                    f"{i}. {result['title']}\n"
+                    f"📝 {result['description']}\n"
+                    f"🔗 {result['url']}\n\n"
                 )
+
+            await self.stream_search_results(
+                update,
+                urls,
+                "📊 Kết quả tìm kiếm:\n\n",
+                format_result,
+                "Bạn có thể dùng lệnh /search để tìm kiếm tiếp.",
+                "❌ Không tìm thấy kết quả nào!\n\n"
+                "Bạn có thể dùng lệnh /search để tìm kiếm lại."
+            )
             
             # Automatically exit search mode
             if user_id in self.search_mode:
@@ -604,134 +771,175 @@ class EmailBot:
                 del self.search_mode[user_id]
             logging.error(f"Error in search: {e}")
 
-    async def get_total_expense(self):
-        """Get total expense for current month"""
+    async def get_total_expense(self, tenant):
+        """Get a tenant's total expense for current month"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
+            now = datetime.now()
             query = """
-            SELECT SUM("price") FROM "Email" 
-            WHERE "month" = %s AND "isRead" = true;
+            SELECT SUM("total") FROM "SpendingRollup" 
+            WHERE "tenantId" = %s AND "year" = %s AND "month" = %s;
             """
             
-            cursor.execute(query, (datetime.now().month,))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await self.db.fetchone(query, (tenant.id, now.year, now.month))
             
             return result[0] if result[0] else 0
         except Exception as e:
             logging.error(f"Error getting total expense: {e}")
             return 0
 
+    def make_ingestion_service(self, tenant):
+        """Create the Gmail ingestion service of a tenant"""
+        # The single-user setup keeps using token.pickle until it links an OAuthToken
+        if tenant == self.default_tenant and os.path.exists('token.pickle'):
+            return GmailIngestionService(self.db, tenant_id=tenant.id)
+        return GmailIngestionService(
+            self.db,
+            tenant_id=tenant.id,
+            token_store=OAuthTokenStore(self.db, tenant.id)
+        )
+
+    async def get_tenant(self, update: Update):
+        """Return the tenant of the chat, replying if the chat is not registered"""
+        tenant = self.tenants.for_chat(update.effective_chat.id)
+        if tenant is None:
+            await update.message.reply_text("❌ Cuộc trò chuyện này chưa được đăng ký sử dụng bot!")
+        return tenant
+
     async def run_gmail_script(self):
-        """Run getDataFromGmail.py every hour"""
+        """Sync Gmail for every tenant on a fixed interval"""
         while True:
+            trace_id.set(new_trace_id())
             try:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                logging.info(f"Running getDataFromGmail.py at {current_time}")
-                # Use python3 from virtual environment
-                subprocess.run(['venv/bin/python3', 'getDataFromGmail.py'], check=True)
-                logging.info("getDataFromGmail.py completed successfully")
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Error running getDataFromGmail.py: {e}")
+                logging.info(f"Syncing Gmail for {len(self.tenants)} tenants at {current_time}")
+                new_count = await self.ingestion.sync_all()
+                logging.info(f"Gmail sync completed successfully ({new_count} new emails)")
+                await self.message_map.prune()
+                await self.search_cache.prune()
             except Exception as e:
-                logging.error(f"Unexpected error: {e}")
+                logging.error(f"Error syncing Gmail: {e}")
             
-            await asyncio.sleep(3600)  # Wait for 1 hour
+            await asyncio.sleep(GMAIL_SYNC_INTERVAL)
+
+    def on_email_inserted(self, email_id):
+        """Wake the unread-transaction check when a new email row is stored"""
+        logging.info(f"New transaction stored: {email_id}")
+        self.new_email_event.set()
+
+    def transaction_message(self, name, price, note):
+        """Build the notification text for a transaction"""
+        money = float(price)
+        status = 'giảm' if money < 0 else 'tăng'
+        formatted_money = "{:,.0f}".format(abs(money))
+        return f"Chào {name}\nTài khoản của bạn đã {status} {formatted_money} VNĐ\nNội dung: {note}\nCho tôi biết lý do chi tiêu của bạn nha!"
 
     async def check_unread_transactions(self):
-        """Check for unread transactions every 15 seconds"""
+        """Notify unread transactions when notified, polling only as a fallback"""
         while True:
+            self.new_email_event.clear()
+            trace_id.set(new_trace_id())
             try:
-                # Get unread email
-                conn = psycopg2.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
+                # The newest unread emails of every tenant, at most REMINDER_MAX_PER_CHAT
+                # each so one busy account cannot use up the reminder slots
                 query = """
-                SELECT "emailId", "price", "note" 
-                FROM "Email" 
-                WHERE "isRead" = false 
-                ORDER BY "createdAt" DESC 
-                LIMIT 1;
+                SELECT "emailId", "price", "note", "createdAt", "chatId", "name"
+                FROM (
+                    SELECT e."emailId", e."price", e."note", e."createdAt", t."chatId", t."name",
+                           ROW_NUMBER() OVER (PARTITION BY e."tenantId" ORDER BY e."createdAt" DESC) AS "rank"
+                    FROM "Email" e
+                    JOIN "Tenant" t ON t."id" = e."tenantId"
+                    WHERE e."isRead" = false AND t."active" = true
+                ) unread
+                WHERE "rank" <= %s
+                ORDER BY "createdAt";
                 """
                 
-                cursor.execute(query)
-                result = cursor.fetchone()
-                cursor.close()
-                conn.close()
+                results = await self.db.fetchall(query, (REMINDER_MAX_PER_CHAT,))
                 
-                if result and self.check:  # Only send if we have an unread email and check is True
-                    self.current_email = {
-                        "emailId": result[0],
-                        "price": result[1],
-                        "note": result[2]
-                    }
-                    
-                    # Send notification
-                    money = float(self.current_email["price"])
-                    status = 'giảm' if money < 0 else 'tăng'
-                    formatted_money = "{:,.0f}".format(abs(money))
-                    message = f"Chào Hoàng Đăng\nTài khoản của bạn đã {status} {formatted_money} VNĐ\nNội dung: {self.current_email['note']}\nCho tôi biết lý do chi tiêu của bạn nha!"
-                    
-                    await self.application.bot.send_message(chat_id=CHAT_ID, text=message)
-                    self.check = False
-                    logging.info(f"Sent notification for transaction: {formatted_money} VNĐ")
-                    
-                    # Start auto-resend task
-                    asyncio.create_task(self.auto_resend_notification())
+                # Oldest first so the newest transaction ends up at the bottom of the chat.
+                # Claiming the reminder first keeps the next pass from notifying it again;
+                # notifications to one chat are merged by the outbox while they wait
+                notifications = []
+                for email_id, price, note, created_at, chat_id, name in results:
+                    if self.reminders.is_tracked(chat_id, email_id):
+                        continue
+                    if not self.reminders.schedule(chat_id, email_id, (name, price, note)):
+                        break
+                    notifications.append(
+                        self.notify_transaction(chat_id, email_id, (name, price, note), created_at)
+                    )
+                await asyncio.gather(*notifications)
             
             except Exception as e:
                 logging.error(f"Error checking unread transactions: {e}")
             
-            await asyncio.sleep(15)  # Wait for 15 seconds
-
-    async def auto_resend_notification(self):
-        """Auto resend notification after 5 seconds if no response"""
-        while self.current_email and not self.check:
-            await asyncio.sleep(15)  # Wait for 5 seconds
-            
-            # Check if email is still unread
             try:
-                conn = psycopg2.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                query = """
-                SELECT "isRead" FROM "Email" 
-                WHERE "emailId" = %s;
-                """
-                
-                cursor.execute(query, (self.current_email["emailId"],))
-                result = cursor.fetchone()
-                cursor.close()
-                conn.close()
-                
-                if result and not result[0]:  # If still unread
-                    # Resend notification
-                    money = float(self.current_email["price"])
-                    status = 'giảm' if money < 0 else 'tăng'
-                    formatted_money = "{:,.0f}".format(abs(money))
-                    message = f"Chào Hoàng Đăng\nTài khoản của bạn đã {status} {formatted_money} VNĐ\nNội dung: {self.current_email['note']}\nCho tôi biết lý do chi tiêu của bạn nha!"
-                    
-                    await self.application.bot.send_message(chat_id=CHAT_ID, text=message)
-                    logging.info(f"Re-sent notification for transaction: {formatted_money} VNĐ")
-                else:
-                    break  # Stop if email is read
-                    
-            except Exception as e:
-                logging.error(f"Error in auto-resend: {e}")
-                break
+                await asyncio.wait_for(self.new_email_event.wait(), timeout=UNREAD_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def transaction_digest(self, payloads):
+        """Build one message for the notifications merged by the outbox"""
+        if len(payloads) == 1:
+            return self.transaction_message(*payloads[0])
+        lines = [f"Chào {payloads[0][0]}\nBạn có {len(payloads)} giao dịch chưa ghi chú:\n"]
+        for _, price, note in payloads:
+            money = float(price)
+            status = 'giảm' if money < 0 else 'tăng'
+            lines.append(f"💰 {abs(money):,.0f} VNĐ ({status}) - {note}")
+        lines.append("\nReply tin nhắn này theo định dạng DANH_MUC - chi tiết để ghi chú lần lượt từng giao dịch!")
+        return "\n".join(lines)
+
+    async def notify_transaction(self, chat_id, email_id, payload, created_at=None):
+        """Notify a transaction, possibly merged with others to the same chat"""
+        try:
+            messages, email_ids = await self.outbox.notify(chat_id, email_id, payload, self.transaction_digest)
+        except Exception as e:
+            logging.error(f"Error notifying transaction {email_id}: {e}")
+            self.reminders.cancel(email_id, chat_id)  # notified again on the next pass
+            return
+        if created_at is not None:
+            # "createdAt" is the email's Date header
+            delay = (datetime.now(created_at.tzinfo) - created_at).total_seconds()
+            NOTIFICATION_DELAY.observe(max(delay, 0))
+        # Every merged notification gets the same result; the first one records it
+        if email_ids[0] == email_id:
+            for sent in messages:
+                await self.message_map.remember(sent.chat_id, sent.message_id, email_ids)
+        logging.info(f"Sent notification for transaction: {email_id}")
+
+    async def send_reminder(self, chat_id, email_id, payload):
+        """Re-send the notification of a transaction that is still unread"""
+        messages, email_ids = await self.outbox.notify(chat_id, email_id, payload, self.transaction_digest)
+        if email_ids[0] == email_id:
+            for sent in messages:
+                await self.message_map.remember(sent.chat_id, sent.message_id, email_ids)
+        logging.info(f"Re-sent notification for transaction: {email_id}")
+
+    async def unread_email_ids(self, email_ids):
+        """Return which of the given emails are still unread"""
+        query = """
+        SELECT "emailId" FROM "Email"
+        WHERE "emailId" = ANY(%s) AND "isRead" = false;
+        """
+        results = await self.db.fetchall(query, (email_ids,))
+        return {row[0] for row in results}
 
     async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle voice messages"""
+        # Once shown, the progress message is edited into the final answer or error
+        progress = None
+
+        async def respond(text):
+            await (progress.edit_text if progress else update.message.reply_text)(text)
+
         try:
             user_id = update.effective_user.id
             
-            # Check if user is in AI report mode
-            if user_id not in self.ai_report_mode:
+            # Check if user is in AI report or expense capture mode
+            if user_id not in self.ai_report_mode and user_id not in self.capture_mode:
                 await update.message.reply_text(
-                    "❌ Bạn cần sử dụng lệnh /bot_ai_gen_report trước khi gửi tin nhắn thoại!"
+                    "❌ Bạn cần sử dụng lệnh /bot_ai_gen_report hoặc /capture trước khi gửi tin nhắn thoại!"
                 )
                 return
                 
@@ -740,96 +948,105 @@ class EmailBot:
                 await self.exit_ai_report(update, context)
                 return
 
-            # Download the voice message
             voice = update.message.voice
-            voice_file = await context.bot.get_file(voice.file_id)
-            
-            # Create temporary files for audio processing
-            with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as ogg_file, \
-                 tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as wav_file:
-                
-                # Download voice message as OGG file
-                await voice_file.download_to_drive(ogg_file.name)
-                
-                # Convert OGG to WAV using pydub
-                audio = AudioSegment.from_ogg(ogg_file.name)
-                audio.export(wav_file.name, format="wav")
-                
-                # Initialize speech recognition
-                recognizer = sr.Recognizer()
-                
-                # Transcribe audio to text
-                with sr.AudioFile(wav_file.name) as source:
-                    audio_data = recognizer.record(source)
-                    text = recognizer.recognize_google(audio_data, language='vi-VN')  # Vietnamese language
-                    
-                    # Configure Gemini API
-                    genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-                    model = genai.GenerativeModel('gemini-2.0-flash')
-                    
-                    # Create prompt for analysis
-                    prompt = f"""
-                    Hãy phân tích và tóm tắt nội dung sau thành 3 phần:
-                    1. Hôm qua đã làm gì
-                    2. Hôm nay sẽ làm gì
-                    3. Những khó khăn
-                    
-                    Nội dung: {text}
-                    
-                    Hãy trả lời theo định dạng:
-                    HÔM QUA:
-                    - Điểm 1
-                    - Điểm 2
-                    ...
-                    
-                    HÔM NAY:
-                    - Điểm 1
-                    - Điểm 2
-                    ...
-                    
-                    KHÓ KHĂN:
-                    - Điểm 1
-                    - Điểm 2
-                    ...
-                    """
-                    
-                    # Generate response using Gemini
-                    response = model.generate_content(prompt)
-                    
-                    if response.text:
-                        # Send both original transcription and AI summary
-                        await update.message.reply_text(
-                            "🎤 Nội dung tin nhắn thoại của bạn:\n\n"
-                            f"📝 {text}\n\n"
-                            "🤖 Phân tích AI:\n\n"
-                            f"{response.text}\n\n"
-                            "Gửi tin nhắn thoại khác hoặc /exit để thoát."
-                        )
-                    else:
-                        # If AI analysis fails, just send the transcription
-                        await update.message.reply_text(
-                            "🎤 Nội dung tin nhắn thoại của bạn:\n\n"
-                            f"📝 {text}\n\n"
-                            "❌ Không thể phân tích AI lúc này.\n"
-                            "Gửi tin nhắn thoại khác hoặc /exit để thoát."
+            with self.voice.slot(user_id):
+                self.voice.check_duration(voice.duration)
+
+                # Download the voice message into memory and transcribe it off the event loop
+                voice_file = await context.bot.get_file(voice.file_id)
+                voice_bytes = await voice_file.download_as_bytearray()
+
+                # Show the transcript as segments complete
+                progress = await update.message.reply_text("🎤 Đang nhận dạng tin nhắn thoại...")
+                parts = []
+                async for parts in self.voice.transcribe_stream(voice_bytes):
+                    done = sum(part is not None for part in parts)
+                    if not done:
+                        continue
+                    try:
+                        await progress.edit_text(
+                            f"🎤 Đang nhận dạng ({done}/{len(parts)})...\n\n"
+                            f"📝 {join_transcript(parts)}"
                         )
+                    except Exception as e:
+                        logging.error(f"Error updating transcript: {e}")
+                text = join_transcript(parts)
+                if not text:
+                    raise NoSpeech()
+
+            if user_id in self.capture_mode:
+                # Gemini is only asked when the note cannot be parsed directly
+                expenses = parse_spoken(text) or await self.read_expenses_with_llm(text)
+                await self.capture_expenses(update, progress.edit_text, expenses, voice_bytes, text)
+                return
                 
-                # Clean up temporary files
-                os.unlink(ogg_file.name)
-                os.unlink(wav_file.name)
+            # Create prompt for analysis
+            prompt = f"""
+            Hãy phân tích và tóm tắt nội dung sau thành 3 phần:
+            1. Hôm qua đã làm gì
+            2. Hôm nay sẽ làm gì
+            3. Những khó khăn
+            
+            Nội dung: {text}
+            
+            Hãy trả lời theo định dạng:
+            HÔM QUA:
+            - Điểm 1
+            - Điểm 2
+            ...
+            
+            HÔM NAY:
+            - Điểm 1
+            - Điểm 2
+            ...
+            
+            KHÓ KHĂN:
+            - Điểm 1
+            - Điểm 2
+            ...
+            """
+            
+            # Generate response using Gemini
+            analysis = await self.llm.generate(prompt)
+            
+            if analysis:
+                # Send both original transcription and AI summary
+                await progress.edit_text(
+                    "🎤 Nội dung tin nhắn thoại của bạn:\n\n"
+                    f"📝 {text}\n\n"
+                    "🤖 Phân tích AI:\n\n"
+                    f"{analysis}\n\n"
+                    "Gửi tin nhắn thoại khác hoặc /exit để thoát."
+                )
+            else:
+                # If AI analysis fails, just send the transcription
+                await progress.edit_text(
+                    "🎤 Nội dung tin nhắn thoại của bạn:\n\n"
+                    f"📝 {text}\n\n"
+                    "❌ Không thể phân tích AI lúc này.\n"
+                    "Gửi tin nhắn thoại khác hoặc /exit để thoát."
+                )
                 
-        except sr.UnknownValueError:
-            await update.message.reply_text("❌ Không thể nhận dạng giọng nói. Vui lòng thử lại!")
-        except sr.RequestError as e:
-            await update.message.reply_text("❌ Lỗi khi kết nối với dịch vụ nhận dạng giọng nói!")
+        except VoiceQueueFull:
+            await respond("⏳ Bạn đang có tin nhắn thoại chờ xử lý, vui lòng đợi trong giây lát!")
+        except VoiceTooLong:
+            await respond(f"❌ Tin nhắn thoại quá dài! Vui lòng gửi tin nhắn dưới {VOICE_MAX_DURATION} giây.")
+        except NoSpeech:
+            await respond("❌ Không thể nhận dạng giọng nói. Vui lòng thử lại!")
+        except RecognitionError as e:
+            await respond("❌ Lỗi khi kết nối với dịch vụ nhận dạng giọng nói!")
             logging.error(f"Speech recognition error: {e}")
         except Exception as e:
-            await update.message.reply_text("❌ Có lỗi xảy ra khi xử lý tin nhắn thoại!")
             logging.error(f"Error handling voice message: {e}")
+            try:
+                await respond("❌ Có lỗi xảy ra khi xử lý tin nhắn thoại!")
+            except Exception as reply_error:
+                logging.error(f"Error reporting voice message failure: {reply_error}")
 
     async def bot_ai_gen_report_image(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /bot_ai_gen_report_image command"""
         user_id = update.effective_user.id
+        self.capture_mode.pop(user_id, None)
         self.ai_report_mode[user_id] = 'image'
         
         await update.message.reply_text(
@@ -846,6 +1063,21 @@ class EmailBot:
         try:
             user_id = update.effective_user.id
             
+            if user_id in self.capture_mode:
+                photo = update.message.photo[-1]
+                file = await context.bot.get_file(photo.file_id)
+                image_bytes = await file.download_as_bytearray()
+
+                text = await self.ocr.recognize(image_bytes)
+                if not text.strip():
+                    await update.message.reply_text("❌ Không thể nhận dạng văn bản từ ảnh. Vui lòng thử lại!")
+                    return
+
+                expense = parse_receipt(text)
+                expenses = [expense] if expense else await self.read_expenses_with_llm(text)
+                await self.capture_expenses(update, update.message.reply_text, expenses, image_bytes, "Ảnh hóa đơn")
+                return
+
             # Check if user is in image analysis mode
             if user_id in self.ai_report_mode and self.ai_report_mode[user_id] == 'image':
                 # Check if the message is a text message with /exit
@@ -860,20 +1092,13 @@ class EmailBot:
                 # Download the image
                 image_bytes = await file.download_as_bytearray()
                 
-                # Convert to PIL Image
-                image = Image.open(io.BytesIO(image_bytes))
-                
-                # Extract text using OCR
-                text = pytesseract.image_to_string(image, lang='vie')
+                # Pre-process and OCR on the worker pool
+                text = await self.ocr.recognize(image_bytes)
                 
                 if not text.strip():
                     await update.message.reply_text("❌ Không thể nhận dạng văn bản từ ảnh. Vui lòng thử lại!")
                     return
                 
-                # Configure Gemini API
-                genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-                model = genai.GenerativeModel('gemini-2.0-flash')
-                
                 # Create prompt for formatting
                 prompt = f"""
                 Hãy định dạng và làm rõ văn bản sau một cách chuyên nghiệp và dễ đọc:
@@ -888,14 +1113,14 @@ class EmailBot:
                 """
                 
                 # Generate formatted text using Gemini
-                response = model.generate_content(prompt)
+                formatted_text = await self.llm.generate(prompt)
                 
-                if response.text:
+                if formatted_text:
                     await update.message.reply_text(
                         "📸 Văn bản từ ảnh của bạn:\n\n"
                         f"📝 {text}\n\n"
                         "✨ Văn bản đã được định dạng:\n\n"
-                        f"{response.text}\n\n"
+                        f"{formatted_text}\n\n"
                         "Gửi ảnh khác hoặc /exit để thoát."
                     )
                 else:
@@ -910,13 +1135,53 @@ class EmailBot:
             await update.message.reply_text("❌ Có lỗi xảy ra khi xử lý ảnh!")
             logging.error(f"Error handling image: {e}")
 
+    async def read_expenses_with_llm(self, text):
+        """Ask Gemini for the expense in a text the parsers could not read, or None"""
+        prompt = f"""
+        Trích xuất khoản chi tiêu trong nội dung sau. Chỉ trả lời bằng một đối tượng JSON:
+        {{"amount": số tiền bằng VNĐ, "category": một trong {', '.join(CATEGORIES)} hoặc Others, "note": mô tả ngắn}}
+
+        Nội dung: {text}
+        """
+        expense = expense_from_json(await self.llm.generate(prompt))
+        return [expense] if expense else None
+
+    async def capture_expenses(self, update: Update, respond, expenses, data, source):
+        """Store expenses read from a photo or voice note and report them"""
+        if not expenses:
+            await respond(
+                "❌ Không đọc được số tiền!\n"
+                "Hãy thử lại, ví dụ: \"ăn trưa 50 nghìn\" hoặc ảnh có dòng \"Tổng cộng\"."
+            )
+            return
+
+        tenant = await self.get_tenant(update)
+        if tenant is None:
+            return
+
+        now = datetime.now()
+        try:
+            stored = await asyncio.gather(*(
+                self.expense_writer.add(content_key(tenant.id, data, i), tenant.id, expense, source, now)
+                for i, expense in enumerate(expenses)
+            ))
+        except Exception as e:
+            logging.error(f"Error saving captured expenses: {e}")
+            await respond("❌ Lỗi khi lưu chi tiêu! Vui lòng thử lại.")
+            return
+
+        message = "✅ Đã ghi chi tiêu:\n" if any(stored) else "⚠️ Các khoản này đã được ghi trước đó:\n"
+        for expense, is_new in zip(expenses, stored):
+            mark = "" if is_new or not any(stored) else " (đã ghi trước đó)"
+            message += f"- {expense.note}: {abs(expense.amount):,.0f} VNĐ ({expense.category}){mark}\n"
+
+        total = await self.get_total_expense(tenant)
+        message += f"\n💰 Tổng chi tiêu trong tháng này: {abs(total):,.0f} VNĐ"
+        await respond(message)
+
     async def process_place_search_query(self, update: Update, query: str):
         """Process a place search query and ask for more"""
         try:
-            # Configure Gemini API
-            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
             # Create prompt for enhancing search query
             prompt = f"""
             Hãy tạo câu truy vấn tìm kiếm địa điểm chi tiết và đầy đủ hơn từ câu truy vấn sau:
@@ -931,9 +1196,8 @@ class EmailBot:
             Chỉ trả về câu truy vấn đã được cải thiện, không thêm giải thích.
             """
             
-            # Generate enhanced query using Gemini
-            response = model.generate_content(prompt)
-            enhanced_query = response.text.strip()
+            # Generate enhanced query using Gemini, unless this search was planned recently
+            enhanced_query, urls = await self.plan_search('place_search', query, prompt)
             
             # Send initial message
             await update.message.reply_text(
@@ -941,59 +1205,28 @@ class EmailBot:
                 "Vui lòng đợi trong giây lát..."
             )
             
-            # Perform web search
-            search_results = []
-            async with aiohttp.ClientSession() as session:
-                # Get top 5 search results
-                for url in search(enhanced_query, num_results=5):
-                    try:
-                        async with session.get(url, timeout=10) as response:
-                            if response.status == 200:
-                                html = await response.text()
-                                soup = BeautifulSoup(html, 'html.parser')
-                                
-                                # Extract title
-                                title = soup.title.string if soup.title else url
-                                
-                                # Extract description
-                                meta_desc = soup.find('meta', {'name': 'description'})
-                                description = meta_desc['content'] if meta_desc else "Không có mô tả"
-                                
-                                # Clean up text
-                                title = re.sub(r'\s+', ' ', title).strip()
-                                description = re.sub(r'\s+', ' ', description).strip()
-                                
-                                # Create Google Maps search URL
-                                maps_query = f"{title} {description}"
-                                maps_query = re.sub(r'[^\w\s]', '', maps_query)  # Remove special characters
-                                maps_url = f"https://www.google.com/maps/search/{maps_query.replace(' ', '+')}"
-                                
-                                search_results.append({
-                                    'title': title,
-                                    'description': description,
-                                    'url': url,
-                                    'maps_url': maps_url
-                                })
-                    except Exception as e:
-                        logging.error(f"Error fetching {url}: {e}")
-                        continue
-            
-            # Format and send results
-            if search_results:
-                message = "📍 Kết quả tìm kiếm địa điểm:\n\n"
-                for i, result in enumerate(search_results, 1):
-                    message += f"{i}. {result['title']}\n"
-                    message += f"📝 {result['description']}\n"
-                    message += f"🔗 {result['url']}\n"
-                    message += f"🗺️ Google Maps: {result['maps_url']}\n\n"
-                
-                message += "Bạn muốn tìm kiếm địa điểm nào nữa không?\nGửi /exit để thoát chế độ tìm kiếm."
-                await update.message.reply_text(message)
-            else:
-                await update.message.reply_text(
-                    "❌ Không tìm thấy địa điểm nào!\n\n"
-                    "Bạn muốn tìm kiếm địa điểm nào nữa không?\nGửi /exit để thoát chế độ tìm kiếm."
+            # Perform web search, showing results as they arrive
+            def format_result(i, result):
+                # Create Google Maps search URL
+                maps_query = f"{result['title']} {result['description']}"
+                maps_query = re.sub(r'[^\w\s]', '', maps_query)  # Remove special characters
+                maps_url = f"https://www.google.com/maps/search/{maps_query.replace(' ', '+')}"
+                return (
+                    f"{i}. {result['title']}\n"
+                    f"📝 {result['description']}\n"
+                    f"🔗 {result['url']}\n"
+                    f"🗺️ Google Maps: {maps_url}\n\n"
                 )
+
+            await self.stream_search_results(
+                update,
+                urls,
+                "📍 Kết quả tìm kiếm địa điểm:\n\n",
+                format_result,
+                "Bạn muốn tìm kiếm địa điểm nào nữa không?\nGửi /exit để thoát chế độ tìm kiếm.",
+                "❌ Không tìm thấy địa điểm nào!\n\n"
+                "Bạn muốn tìm kiếm địa điểm nào nữa không?\nGửi /exit để thoát chế độ tìm kiếm."
+            )
                 
         except Exception as e:
             await update.message.reply_text(
@@ -1002,12 +1235,127 @@ class EmailBot:
             )
             logging.error(f"Error in place search: {e}")
 
+    async def plan_search(self, kind, query, prompt):
+        """Return (enhanced query, result URLs) for a search, from cache when possible"""
+        key = f"{kind}:{normalize_query(query)}"
+        plan = await self.search_cache.get('query', key)
+        if plan is None:
+            # An empty rewrite would search for nothing; use the user's words instead
+            enhanced_query = (await self.llm.generate(prompt)).strip() or query.strip()
+            urls = await self.web_search.find_urls(enhanced_query)
+            plan = {'query': enhanced_query, 'urls': urls}
+            if urls:
+                await self.search_cache.put('query', key, plan)
+        return plan['query'], plan['urls']
+
+    async def stream_search_results(self, update: Update, urls, title, format_result, footer, empty_message):
+        """Send search results as their pages load, editing one message in place"""
+        results = []
+        sent = None
+        async for result in self.web_search.results(urls):
+            results.append(result)
+            message = title + "".join(format_result(i, r) for i, r in enumerate(results, 1))
+            message += "⏳ Đang tải thêm kết quả..."
+            if sent is None:
+                sent = await update.message.reply_text(message)
+                continue
+            try:
+                await sent.edit_text(message)
+            except Exception as e:
+                logging.error(f"Error updating search results: {e}")
+
+        if sent is None:
+            await update.message.reply_text(empty_message)
+            return
+        message = title + "".join(format_result(i, r) for i, r in enumerate(results, 1)) + footer
+        await sent.edit_text(message)
+
+    async def on_startup(self, application: Application):
+        """Open the database pool and start the schedulers"""
+        self.loop_monitor.start()
+        if METRICS_PORT:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logging.error(f"Could not serve metrics on port {METRICS_PORT}: {e}")
+        await asyncio.to_thread(self.db.open)
+        if not await self.db.ping():
+            logging.warning("Database is not reachable at startup")
+            self.start_background_task(self.retry_load_tenants())
+        elif not await self.load_tenants():
+            self.start_background_task(self.retry_load_tenants())
+
+        await self.email_listener.start()
+        self.start_background_task(self.run_gmail_script())
+        self.start_background_task(self.check_unread_transactions())
+        self.start_background_task(self.reminders.run())
+        self.start_background_task(self.expense_writer.run())
+        if PREWARM_DELAY >= 0:
+            self.start_background_task(self.prewarm())
+
+    async def load_tenants(self):
+        """Load the tenants and register the default chat; returns False on failure"""
+        try:
+            await self.tenants.load()
+            if CHAT_ID:
+                self.default_tenant = await self.tenants.ensure(int(CHAT_ID), USER_NAME)
+                adopted = await self.tenants.adopt_orphans(self.default_tenant)
+                if adopted:
+                    logging.info(f"Assigned {adopted} existing emails to the default tenant")
+            logging.info(f"Serving {len(self.tenants)} tenants")
+            return True
+        except Exception as e:
+            logging.error(f"Error loading tenants: {e}")
+            return False
+
+    async def retry_load_tenants(self, max_delay=60):
+        """Load the tenants with backoff until the database answers"""
+        delay = 1
+        while not await self.load_tenants():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def on_stop(self, application: Application):
+        """Stop the schedulers and send queued messages while the bot can still send"""
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        await self.expense_writer.flush()
+        await self.outbox.close()
+
+    async def on_shutdown(self, application: Application):
+        """Release pooled database connections and worker pools"""
+        await self.email_listener.stop()
+        await self.web_search.close()
+        self.voice.close()
+        self.ocr.close()
+        await asyncio.to_thread(self.db.close)
+        await self.metrics_server.stop()
+        self.loop_monitor.stop()
+
+    async def prewarm(self):
+        """Import the feature modules off the event loop once updates are flowing"""
+        await asyncio.sleep(PREWARM_DELAY)
+        await asyncio.to_thread(prewarm)
+        await asyncio.to_thread(lambda: self.llm.model)
+
+    async def health_checks(self):
+        """Dependencies reported by the webhook health endpoint"""
+        return {'database': await self.db.ping(), 'email_listener': self.email_listener.connected}
+
+    def start_background_task(self, coro):
+        """Run a long-lived coroutine until shutdown"""
+        task = asyncio.create_task(coro, name=coro.__qualname__)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
     def run(self):
         """Start the bot and the schedulers"""
         # Add handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("reset_bot", self.reset_bot))
+        self.application.add_handler(CommandHandler("reset_bot", self.reset_bot, block=False))
         self.application.add_handler(CommandHandler("check_bot", self.check_bot))
         self.application.add_handler(CommandHandler("check_outlay", self.check_outlay))
         self.application.add_handler(CommandHandler("report", self.report_command))
@@ -1015,23 +1363,42 @@ class EmailBot:
         self.application.add_handler(CommandHandler("check_outlay_web", self.check_outlay_web))
         self.application.add_handler(CommandHandler("bot_ai_gen_report", self.bot_ai_gen_report))
         self.application.add_handler(CommandHandler("bot_ai_gen_report_image", self.bot_ai_gen_report_image))
+        self.application.add_handler(CommandHandler("capture", self.capture_command))
+        self.application.add_handler(CommandHandler("exit", self.exit_ai_report))
         self.application.add_handler(CommandHandler("search", self.search_command))
         self.application.add_handler(CommandHandler("place_search", self.place_search_command))
+        self.application.add_handler(CommandHandler("cache_stats", self.cache_stats))
         
         # Add message handlers
-        self.application.add_handler(MessageHandler(filters.VOICE, self.handle_voice))
-        self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_image))
+        self.application.add_handler(MessageHandler(filters.VOICE, self.handle_voice, block=False))
+        self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_image, block=False))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
-        # Create event loop
-        loop = asyncio.get_event_loop()
-        
-        # Start both schedulers
-        loop.create_task(self.run_gmail_script())
-        loop.create_task(self.check_unread_transactions())
-        
-        # Start the bot
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        # Time every handler and give each update a trace ID for the logs
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, CommandHandler):
+                    name = '/' + min(handler.commands)
+                else:
+                    name = handler.callback.__name__
+                handler.callback = traced(name, handler.callback)
+
+        # Start the bot (schedulers are started in on_startup)
+        updates = ALLOWED_UPDATES or allowed_updates(self.application)
+        if BOT_MODE == 'webhook':
+            server = WebhookServer(
+                self.application,
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                allowed_updates=updates,
+                health=self.health_checks
+            )
+            asyncio.run(serve(self.application, server, self.on_startup, self.on_stop, self.on_shutdown))
+        else:
+            self.application.run_polling(allowed_updates=updates)
 
 if __name__ == '__main__':
     bot = EmailBot()
@@ -0,0 +1,266 @@
+import re
+import email.utils
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+
+CURRENCY = r'(?P<c{i}>vnđ|vnd|usd|đồng|đ)(?!\w)'
+
+
+# A NamedTuple rather than a frozen dataclass: built once per message, and
+# a frozen dataclass's __init__ costs more than the rest of _build
+class Transaction(NamedTuple):
+    amount: float
+    currency: str
+    direction: Optional[str]
+    balance: Optional[float]
+    counterparty: Optional[str]
+    description: Optional[str]
+
+
+class RuleSet:
+    """Precompiled extraction rules for one bank's notification wording.
+
+    Keywords and labels are plain lowercase strings. Every label (and bare
+    amounts) becomes one branch of a single regex, so a message is scanned
+    exactly once and the first occurrence of each field wins. Branches are
+    grouped by their first character, which lets the regex engine skip
+    non-candidate characters in C and try only the branches that can start
+    at a candidate. The last group of each branch (an empty one for
+    keywords) tells which field matched.
+    """
+
+    def __init__(self, name, senders, credit, debit, balance, description, counterparty=()):
+        self.name = name
+        self.senders = tuple(s.lower() for s in senders)
+
+        branches = {}
+        fields = []
+
+        def add(field, head, rest):
+            i = len(fields)
+            branches.setdefault(head, []).append(rest.format(i=i))
+            fields.append(field)
+
+        def add_word(field, word, rest):
+            add(field, re.escape(word[0]), re.escape(word[1:]) + rest)
+
+        # Runs of [\d.,] are taken whole: nothing inside one can start " ?currency"
+        amount = r'[\d.,]* ?' + CURRENCY
+        label_amount = r'[ \t]*:?[ \t]*(?P<v{i}>(?:[+-] ?)?\d[\d.,]*) ?' + CURRENCY
+        # As in the old Timo-only parser, a description may start on the next
+        # line and runs to the end of its line, "|" included
+        description_text = r'[ \t]*:\s*(?P<v{i}>[^\n]+)'
+        # Counterparty labels are common words ("từ ngày 1/3"), so they need
+        # a colon, and their value stops before a description label
+        labels = '|'.join(re.escape(word) for word in sorted(description, key=len, reverse=True))
+        counterparty_text = (r'[ \t]*:[ \t]*(?P<v{i}>[^\n|]+?)'
+                             r'(?=[ \t.,;]*(?<!\w)(?:' + labels + r')[ \t]*:|[\n|]|$)')
+
+        for word in credit:
+            add_word('credit', word, r'(?!\w)(?P<f{i}>)')
+        for word in debit:
+            add_word('debit', word, r'(?!\w)(?P<f{i}>)')
+        # Longest labels first so "số dư hiện tại" wins over "số dư"
+        for word in sorted(balance, key=len, reverse=True):
+            add_word('balance', word, label_amount)
+        for word in sorted(description, key=len, reverse=True):
+            add_word('description', word, description_text)
+        for word in sorted(counterparty, key=len, reverse=True):
+            add_word('counterparty', word, counterparty_text)
+        # Bare amounts last so labelled amounts (balance) claim their digits first
+        for sign in '+-':
+            add('amount', re.escape(sign), r' ?(?=\d)' + amount)
+        # A digit right after another digit ends the same run, so it cannot
+        # match where the previous one failed; and no branch ends before a digit
+        add('amount', '[0-9]', r'(?<![0-9][0-9])' + amount)
+
+        # Branches with different first characters never match at the same
+        # position, so grouping them keeps the leftmost-first result
+        pattern = '|'.join(
+            head + (rests[0] if len(rests) == 1 else '(?:' + '|'.join(rests) + ')')
+            for head, rests in branches.items()
+        )
+        self.field_count = len(set(fields))
+        self.pattern = re.compile(pattern)
+        # Used when lowercasing would shift offsets into the original text
+        self.pattern_ignorecase = re.compile(self.pattern.pattern, re.IGNORECASE)
+        # match.lastindex is the group a branch closes last: its marker,
+        # currency or label value
+        groups = self.pattern.groupindex
+        self._branches = {}
+        for i, field in enumerate(fields):
+            last = groups.get(f'f{i}') or groups.get(f'c{i}') or groups[f'v{i}']
+            self._branches[last] = (field, groups.get(f'v{i}'), groups.get(f'c{i}'))
+
+    def _collect(self, matches, text, found):
+        # Keep the first match of each field, skipping labels inside longer words
+        branches = self._branches
+        for match in matches:
+            field, value, currency = branches[match.lastindex]
+            if field in found:
+                continue
+            start = match.start()
+            if field != 'amount' and start and text[start - 1].isalnum():
+                continue  # "nd" inside "spend"
+            found[field] = (match, value, currency)
+            if len(found) == self.field_count:
+                break
+
+    def parse(self, text):
+        lowered = text.lower()
+        found = {}
+        if len(lowered) == len(text):
+            self._collect(self.pattern.finditer(lowered), lowered, found)
+        else:
+            self._collect(self.pattern_ignorecase.finditer(text), text, found)
+        return _build(found, text)
+
+
+def _build(found, text):
+    amount = 0.0
+    currency = 'VND'
+    direction = None
+    credit = found.get('credit')
+    debit = found.get('debit')
+    if credit and (not debit or credit[0].start() < debit[0].start()):
+        direction = '+'
+    elif debit:
+        direction = '-'
+
+    if 'amount' in found:
+        match, _, currency_group = found['amount']
+        raw = text[match.start():match.start(currency_group)]
+        amount = _to_number(raw)
+        if match.group(currency_group).lower() == 'usd':
+            currency = 'USD'
+        if direction is None and raw[0] in '+-':
+            direction = raw[0]
+
+    # Đặt dấu + hoặc - trước số tiền
+    if direction == '-':
+        amount = -amount
+
+    balance = None
+    if 'balance' in found:
+        match, value_group, _ = found['balance']
+        balance = _to_number(match.group(value_group))
+
+    return Transaction(
+        amount=amount,
+        currency=currency,
+        direction=direction,
+        balance=balance,
+        counterparty=_text(found.get('counterparty'), text),
+        description=_text(found.get('description'), text),
+    )
+
+
+def _to_number(value):
+    return float(value.strip(' +-').replace('.', '').replace(',', ''))
+
+
+def _text(field, text):
+    # Read from the original text so the case is preserved
+    if not field:
+        return None
+    match, value_group, _ = field
+    return text[match.start(value_group):match.end(value_group)].strip() or None
+
+
+TIMO = RuleSet(
+    'timo',
+    senders=['support@timo.vn', 'timo.vn'],
+    credit=['vừa tăng'],
+    debit=['vừa giảm'],
+    balance=['số dư hiện tại', 'số dư khả dụng', 'số dư'],
+    description=['mô tả'],
+)
+
+VIETCOMBANK = RuleSet(
+    'vietcombank',
+    senders=['vcbdigibank@info.vietcombank.com.vn', 'vietcombank.com.vn'],
+    credit=['ghi có'],
+    debit=['ghi nợ'],
+    balance=['số dư cuối', 'số dư'],
+    description=['nội dung giao dịch', 'nội dung', 'ref'],
+)
+
+TECHCOMBANK = RuleSet(
+    'techcombank',
+    senders=['alert@techcombank.com.vn', 'techcombank.com.vn'],
+    credit=['ps có', 'tăng'],
+    debit=['ps nợ', 'giảm'],
+    balance=['so du', 'số dư'],
+    description=['nd', 'nội dung'],
+    counterparty=['từ', 'tới', 'đến'],
+)
+
+MBBANK = RuleSet(
+    'mbbank',
+    senders=['mbbank@mbbank.com.vn', 'mbbank.com.vn'],
+    credit=['ghi có', 'tiền vào'],
+    debit=['ghi nợ', 'tiền ra'],
+    balance=['sd', 'số dư'],
+    description=['nd', 'nội dung'],
+)
+
+VPBANK = RuleSet(
+    'vpbank',
+    senders=['customercare@care.vpb.com.vn', 'vpb.com.vn', 'vpbank.com.vn'],
+    credit=['tăng', 'ghi có'],
+    debit=['giảm', 'ghi nợ'],
+    balance=['số dư', 'so du'],
+    description=['nội dung', 'nd'],
+)
+
+ACB = RuleSet(
+    'acb',
+    senders=['mailalert@acb.com.vn', 'acb.com.vn'],
+    credit=['ghi có', 'tăng'],
+    debit=['ghi nợ', 'giảm'],
+    balance=['số dư khả dụng', 'số dư'],
+    description=['nội dung giao dịch', 'nội dung', 'nd'],
+)
+
+RULE_SETS = [TIMO, VIETCOMBANK, TECHCOMBANK, MBBANK, VPBANK, ACB]
+DEFAULT_RULE_SET = TIMO
+
+_BY_ADDRESS = {}
+_BY_DOMAIN = {}
+for _rules in RULE_SETS:
+    for _sender in _rules.senders:
+        (_BY_ADDRESS if '@' in _sender else _BY_DOMAIN)[_sender] = _rules
+
+
+@lru_cache(maxsize=1024)
+def find_rules(sender):
+    """Return the rule set registered for a From header, or None for unknown senders"""
+    if not sender:
+        return None
+    address = email.utils.parseaddr(sender)[1].lower() or sender.lower()
+    rules = _BY_ADDRESS.get(address)
+    if rules:
+        return rules
+    domain = address.rpartition('@')[2]
+    while domain:
+        rules = _BY_DOMAIN.get(domain)
+        if rules:
+            return rules
+        domain = domain.partition('.')[2]
+    return None
+
+
+def rules_for(sender):
+    """Pick the rule set for a From header, falling back to the Timo rules"""
+    return find_rules(sender) or DEFAULT_RULE_SET
+
+
+def bank_addresses():
+    """Sender addresses of every supported bank, for Gmail search queries"""
+    return [sender for rules in RULE_SETS for sender in rules.senders if '@' in sender]
+
+
+def parse(sender, text):
+    """Parse one bank notification into a Transaction"""
+    return rules_for(sender).parse(text)
@@ -0,0 +1,171 @@
+import asyncio
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# speech_recognition and pydub are imported where they are used, on the
+# worker threads, so they are not loaded until the first voice note
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+STAGE_SECONDS = metrics.histogram(
+    'voice_stage_seconds', 'Time to decode and split a voice note, or to recognize one segment', ['stage']
+)
+
+
+class VoiceTooLong(Exception):
+    pass
+
+
+class VoiceQueueFull(Exception):
+    pass
+
+
+class NoSpeech(Exception):
+    """Nothing recognizable was said in the voice note"""
+
+
+class RecognitionError(Exception):
+    """The speech recognition service could not be reached"""
+
+
+def decode_audio(data, max_duration=None):
+    """Decode an OGG/Opus voice note to 16 kHz mono PCM entirely in memory"""
+    from pydub import AudioSegment
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0']
+    if max_duration:
+        command += ['-t', str(max_duration)]
+    command += ['-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1']
+    result = subprocess.run(command, input=bytes(data), capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    return AudioSegment(data=result.stdout, sample_width=SAMPLE_WIDTH, frame_rate=SAMPLE_RATE, channels=1)
+
+
+def split_segments(audio, max_segment_ms, min_silence_ms=500, silence_offset=16, padding_ms=200):
+    """Return (start, end) ranges in ms that cover the speech, cut at pauses.
+
+    Speech runs separated by at least min_silence_ms are merged greedily into
+    segments of at most max_segment_ms; a run longer than that is cut hard.
+    """
+    from pydub.silence import detect_nonsilent
+    # Silence is relative to the clip's loudness so quiet recordings still split
+    threshold = audio.dBFS - silence_offset if audio.dBFS != float('-inf') else -50
+    runs = detect_nonsilent(audio, min_silence_len=min_silence_ms, silence_thresh=threshold, seek_step=10)
+    segments = []
+    for start, end in runs:
+        start = max(0, start - padding_ms)
+        end = min(len(audio), end + padding_ms)
+        if segments and end - segments[-1][0] <= max_segment_ms:
+            segments[-1] = (segments[-1][0], end)
+            continue
+        while end - start > max_segment_ms:
+            segments.append((start, start + max_segment_ms))
+            start += max_segment_ms
+        segments.append((start, end))
+    return segments
+
+
+def join_transcript(parts):
+    """Join segment transcripts, marking segments still in progress with an ellipsis"""
+    return ' '.join('…' if part is None else part for part in parts if part != '').strip()
+
+
+class VoicePipeline:
+    """Transcribes voice notes on a worker pool instead of the event loop.
+
+    Decoding (ffmpeg over pipes, no temp files) and the blocking Google
+    speech requests run on `workers` threads. Audio is split at pauses into
+    segments of at most `max_segment` seconds that are recognized
+    concurrently, at most `segment_concurrency` at a time per note so one
+    long note cannot take every worker from other users' notes. Notes longer
+    than `max_duration` seconds are rejected, and each user may have at most
+    `max_queue_per_user` notes waiting or in progress.
+    """
+
+    def __init__(self, workers=4, max_duration=300, max_queue_per_user=2, language='vi-VN',
+                 max_segment=30, segment_concurrency=2):
+        self.max_duration = max_duration
+        self.segment_concurrency = segment_concurrency
+        self.max_segment_ms = max_segment * 1000
+        self.max_queue_per_user = max_queue_per_user
+        self.language = language
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice')
+        self._queued = {}
+
+    @contextmanager
+    def slot(self, user_id):
+        """Reserve one of the user's queue slots for the duration of the block"""
+        if self._queued.get(user_id, 0) >= self.max_queue_per_user:
+            raise VoiceQueueFull()
+        self._queued[user_id] = self._queued.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._queued[user_id] -= 1
+            if not self._queued[user_id]:
+                del self._queued[user_id]
+
+    @property
+    def queued(self):
+        """Voice notes waiting or in progress across all users"""
+        return sum(self._queued.values())
+
+    def check_duration(self, duration):
+        if duration and duration > self.max_duration:
+            raise VoiceTooLong(duration)
+
+    def _recognize(self, audio):
+        import speech_recognition as sr
+        audio_data = sr.AudioData(audio.raw_data, audio.frame_rate, audio.sample_width)
+        try:
+            with STAGE_SECONDS.labels(stage='recognize').time():
+                return sr.Recognizer().recognize_google(audio_data, language=self.language)
+        except sr.UnknownValueError:
+            return ''  # a segment with no recognizable speech
+        except sr.RequestError as e:
+            raise RecognitionError(str(e)) from e
+
+    def _prepare(self, data):
+        with STAGE_SECONDS.labels(stage='decode').time():
+            audio = decode_audio(data, self.max_duration)
+            return [audio[start:end] for start, end in split_segments(audio, self.max_segment_ms)]
+
+    async def transcribe_stream(self, data):
+        """Transcribe a voice note given as OGG bytes, segment by segment.
+
+        Yields the list of segment transcripts in audio order, first with
+        every entry None and then again each time one segment completes.
+        """
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(self._executor, self._prepare, data)
+        parts = [None] * len(segments)
+        yield list(parts)
+        slots = asyncio.Semaphore(self.segment_concurrency)
+
+        async def recognize(index, segment):
+            async with slots:
+                return index, await loop.run_in_executor(self._executor, self._recognize, segment)
+
+        tasks = [asyncio.create_task(recognize(i, segment)) for i, segment in enumerate(segments)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, text = await next_done
+                parts[index] = text
+                yield list(parts)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def transcribe(self, data):
+        """Return the full transcript of a voice note given as OGG bytes"""
+        parts = []
+        async for parts in self.transcribe_stream(data):
+            pass
+        return join_transcript(parts)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from html_meta import DEFAULT_MAX_BYTES, extract_metadata_async
+
+
+def page_result(url, metadata):
+    """Build a search result from a page's metadata"""
+    return {
+        'title': metadata['title'] or url,
+        'description': metadata['description'] or "Không có mô tả",
+        'url': url,
+        'image': metadata['og'].get('image')
+    }
+
+
+class SearchPipeline:
+    """Web search whose result pages are fetched concurrently.
+
+    The blocking googlesearch call runs on a worker thread. The result pages
+    are then fetched at once over a shared session that allows at most
+    `per_host` connections per host. Results are yielded in the order they
+    arrive, and pages still loading after `deadline` seconds are abandoned.
+    Only the <head> of each page is read (at most `max_page_bytes`), and
+    with a SearchCache the metadata of recently seen pages is reused.
+    """
+
+    def __init__(self, num_results=5, per_host=2, page_timeout=10, deadline=15,
+                 max_page_bytes=DEFAULT_MAX_BYTES, cache=None):
+        self.num_results = num_results
+        self.cache = cache
+        self.max_page_bytes = max_page_bytes
+        self.per_host = per_host
+        self.page_timeout = page_timeout
+        self.deadline = deadline
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.per_host),
+                timeout=aiohttp.ClientTimeout(total=self.page_timeout)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def find_urls(self, query):
+        """Return the result URLs of a web search"""
+        # Imported on first use: googlesearch pulls in requests and BeautifulSoup
+        from googlesearch import search
+        urls = await asyncio.wait_for(
+            asyncio.to_thread(lambda: list(search(query, num_results=self.num_results))),
+            timeout=self.deadline
+        )
+        return list(dict.fromkeys(urls))
+
+    async def _fetch(self, session, url):
+        if self.cache is not None:
+            cached = await self.cache.get('page', url)
+            if cached is not None:
+                return cached
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    return None
+                metadata = await extract_metadata_async(
+                    response.content, response.charset, max_bytes=self.max_page_bytes
+                )
+        except Exception as e:
+            logging.error(f"Error fetching {url}: {e}")
+            return None
+        result = page_result(url, metadata)
+        if self.cache is not None:
+            await self.cache.put('page', url, result)
+        return result
+
+    async def results(self, urls):
+        """Yield result dicts (title, description, url, image) as their pages load"""
+        if not urls:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+
+        session = self._get_session()
+        tasks = [asyncio.create_task(self._fetch(session, url)) for url in urls]
+        try:
+            # Fetch errors are handled in _fetch, so a timeout here is the deadline
+            for next_done in asyncio.as_completed(tasks, timeout=max(0, deadline - loop.time())):
+                result = await next_done
+                if result:
+                    yield result
+        except asyncio.TimeoutError:
+            pending = sum(not task.done() for task in tasks)
+            logging.warning(f"Search deadline reached, dropped {pending} slow pages")
+        finally:
+            for task in tasks:
+                task.cancel()
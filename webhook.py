@@ -0,0 +1,166 @@
+import hmac
+import signal
+import asyncio
+import logging
+import secrets
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import (
+    CallbackQueryHandler, ChatMemberHandler, CommandHandler, InlineQueryHandler, MessageHandler
+)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# The bot's handlers read update.message, which edited messages and channel
+# posts leave empty, so those update types are not subscribed to
+UPDATES_BY_HANDLER = [
+    (CommandHandler, [Update.MESSAGE]),
+    (MessageHandler, [Update.MESSAGE]),
+    (CallbackQueryHandler, [Update.CALLBACK_QUERY]),
+    (InlineQueryHandler, [Update.INLINE_QUERY]),
+    (ChatMemberHandler, [Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER]),
+]
+
+
+def allowed_updates(application):
+    """Update types that the application's registered handlers can use"""
+    kinds = []
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for handler_type, handler_kinds in UPDATES_BY_HANDLER:
+                if isinstance(handler, handler_type):
+                    kinds.extend(handler_kinds)
+                    break
+            else:
+                logging.warning(f"Unknown handler {type(handler).__name__}, subscribing to all updates")
+                return Update.ALL_TYPES
+    return list(dict.fromkeys(kinds))
+
+
+class WebhookServer:
+    """Receives Telegram updates over a webhook served by aiohttp.
+
+    Runs in the bot's own process and event loop: each POST to `path` is
+    checked against the secret token Telegram sends in SECRET_HEADER, parsed
+    and put on the application's update queue, and answered at once so
+    Telegram never waits on a handler. GET /healthz reports the bot and the
+    `health` checks (an async callable returning {name: ok}) with 503 when
+    any fails, for a load balancer.
+
+    With `url` set, start() registers the webhook with Telegram for
+    `allowed_updates`, and a random secret is used if none is given. Without
+    it the server only listens, e.g. for a fake update sender or a webhook
+    managed elsewhere, and the secret must be given since nothing else could
+    know a generated one.
+    """
+
+    def __init__(self, application, url=None, secret_token=None, listen='0.0.0.0', port=8080,
+                 path='/telegram', allowed_updates=None, health=None, max_connections=40,
+                 drop_pending_updates=False):
+        self.application = application
+        self.url = url
+        if not secret_token:
+            if not url:
+                raise ValueError("WEBHOOK_SECRET is required when WEBHOOK_URL is not set")
+            secret_token = secrets.token_urlsafe(32)
+            logging.warning("WEBHOOK_SECRET is not set, using a random secret for this process")
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.allowed_updates = allowed_updates
+        self.health = health
+        self.max_connections = max_connections
+        self.drop_pending_updates = drop_pending_updates
+        self._runner = None
+        self.stats = {'received': 0, 'rejected': 0}
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        return app
+
+    async def handle_update(self, request):
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.stats['rejected'] += 1
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logging.warning(f"Malformed webhook update: {e}")
+            self.stats['rejected'] += 1
+            return web.Response(status=400)
+        if update is None:
+            self.stats['rejected'] += 1
+            return web.Response(status=400)
+        self.stats['received'] += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request):
+        checks = {'bot': self.application.running}
+        if self.health is not None:
+            try:
+                checks.update(await self.health())
+            except Exception as e:
+                logging.error(f"Health check failed: {e}")
+                checks['health'] = False
+        status = 200 if all(checks.values()) else 503
+        return web.json_response({'ok': status == 200, **checks}, status=status)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logging.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+        if self.url:
+            await self.application.bot.set_webhook(
+                url=self.url,
+                secret_token=self.secret_token,
+                allowed_updates=self.allowed_updates,
+                max_connections=self.max_connections,
+                drop_pending_updates=self.drop_pending_updates
+            )
+            logging.info(f"Webhook registered at {self.url} for {self.allowed_updates}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(application, server, on_startup=None, on_stop=None, on_shutdown=None):
+    """Run the application with updates from a WebhookServer until SIGINT/SIGTERM.
+
+    Mirrors Application.run_polling: on_startup runs after initialize(),
+    on_stop after stop() while the bot can still send, and on_shutdown
+    after shutdown().
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # not supported on this platform; Ctrl+C still cancels the run
+
+    await application.initialize()
+    try:
+        if on_startup is not None:
+            await on_startup(application)
+        await application.start()
+        await server.start()
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if on_stop is not None:
+                await on_stop(application)
+    finally:
+        await application.shutdown()
+        if on_shutdown is not None:
+            await on_shutdown(application)